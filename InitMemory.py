@@ -1,21 +1,26 @@
 import requests
-import os 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import pandas as pd
-from datetime import datetime 
+from datetime import datetime
 import json
+from responseCache import ResponseCache
+from dataStore import dataBackend, csv_path, load_frame, save_frame
 
 load_dotenv()
 
-ticker = "meta" #tsla, msft, nvda, meta
-
 ticker_to_company = {
     "tsla": "Tesla",
     "msft": "Microsoft",
     "nvda": "Nvidia",
     "meta": "Meta",
 }
-stock = ticker_to_company.get(ticker.lower(), "Unknown")
 
 
 hisFolder = 'HistoricalData'
@@ -28,13 +33,14 @@ newsFolder = 'News'
 
 todaysDate = datetime.now().strftime('%d-%m-%Y')
 
-historicalURL = f"https://yahoo-finance127.p.rapidapi.com/historic/{ticker}/1d/3mo"
-earningsURL = f"https://yahoo-finance127.p.rapidapi.com/earnings/{ticker}"
-ESGURL = f"https://yahoo-finance127.p.rapidapi.com/esg-score/{ticker}"
-finAnalyticsURL = f"https://yahoo-finance127.p.rapidapi.com/finance-analytics/{ticker}"
-trendURL = f"https://yahoo-finance127.p.rapidapi.com/earnings-trend/{ticker}"
-keyStatisticsURL = f"https://yahoo-finance127.p.rapidapi.com/key-statistics/{ticker}"
-newsURL = f"https://reuters-business-and-financial-news.p.rapidapi.com/get-articles-by-keyword-name/{stock}/0/15"
+# Incremental history, only the bars missing since the last stored date are requested
+historyWindow = 504 # number of daily bars kept in {ticker}_Historical.csv (~2 years)
+historySlack = 21 # bars the file may grow past historyWindow before it is trimmed (~1 month), so most runs only append
+initialHistoryRange = '3mo' # range requested when no history is stored for the ticker yet
+historyRanges = [('5d', 5), ('1mo', 30), ('3mo', 90), ('6mo', 182), ('1y', 365), ('2y', 730), ('5y', 1826), ('10y', 3652)]
+
+yahooBaseURL = "https://yahoo-finance127.p.rapidapi.com"
+reutersBaseURL = "https://reuters-business-and-financial-news.p.rapidapi.com"
 
 yahooHeaders = {
     "X-RapidAPI-Key": os.getenv('RAPIDAPI_KEY'),
@@ -46,51 +52,173 @@ reuterHeaders = {
     "X-RapidAPI-Host": os.getenv('REUTERS_RAPIDAPI_HOST')
 }
 
-hisRes = requests.get(historicalURL, headers=yahooHeaders)
-earRes = requests.get(earningsURL, headers=yahooHeaders)
-esgRes = requests.get(ESGURL , headers=yahooHeaders)
-finRes = requests.get(finAnalyticsURL, headers=yahooHeaders)
-treRes = requests.get(trendURL, headers=yahooHeaders)
-keyRes = requests.get(keyStatisticsURL, headers=yahooHeaders)
-newsRes = requests.get(newsURL, headers=reuterHeaders)
-
-# HISTORICAL PRICE DATA
-
-#filter out the info
-hisJSON = hisRes.json()
-hisTimestamps = hisJSON['timestamp']
-hisOpens = hisJSON['indicators']['quote'][0]['open']
-hisCloses = hisJSON['indicators']['quote'][0]['close'] 
-hisVolumes = hisJSON['indicators']['quote'][0]['volume']
-
-#dataframe
-hisdf = pd.DataFrame({
-    'Timestamp': hisTimestamps,
-    'Open': hisOpens,
-    'Close': hisCloses,
-    'Volume': hisVolumes
-})
-
-#clean up date 
-hisdf['Date'] = pd.to_datetime(hisdf['Timestamp'], unit='s').dt.strftime('%d-%m-%Y')
-hisdf.drop('Timestamp', axis=1, inplace=True)
-
-#create folder if doesnt exist
-if not os.path.exists(hisFolder):
-    os.makedirs(hisFolder)
-
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(hisFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(hisFolder, filename))
-
-#save the dataframe to folder
-hisFilepath = os.path.join(hisFolder, f'{ticker}_Historical.csv')
-hisdf.to_csv(hisFilepath, index=False)
-
-#EARNINGS
+# HTTP ENGINE
+
+def build_requests(ticker: str, yahoo_base: str = yahooBaseURL, reuters_base: str = reutersBaseURL, history_range: str = '3mo') -> dict:
+    """
+    Builds the URL and headers for each of the seven endpoints of a ticker.
+
+    :param ticker: The stock ticker to build the requests for.
+    :param history_range: The range of daily bars to request from the historical endpoint.
+    :param yahoo_base: Base URL of the Yahoo Finance API (point it at a local server when testing).
+    :param reuters_base: Base URL of the Reuters API (point it at a local server when testing).
+    :return: A dictionary mapping the endpoint name to a (url, headers) tuple.
+    """
+    stock = ticker_to_company.get(ticker.lower(), "Unknown")
+
+    return {
+        'historical': (f"{yahoo_base}/historic/{ticker}/1d/{history_range}", yahooHeaders),
+        'earnings': (f"{yahoo_base}/earnings/{ticker}", yahooHeaders),
+        'esg': (f"{yahoo_base}/esg-score/{ticker}", yahooHeaders),
+        'finance': (f"{yahoo_base}/finance-analytics/{ticker}", yahooHeaders),
+        'trend': (f"{yahoo_base}/earnings-trend/{ticker}", yahooHeaders),
+        'keystats': (f"{yahoo_base}/key-statistics/{ticker}", yahooHeaders),
+        'news': (f"{reuters_base}/get-articles-by-keyword-name/{stock}/0/15", reuterHeaders),
+    }
+
+def make_session(pool_size: int = 10, retries: int = 3, backoff: float = 0.5) -> requests.Session:
+    """
+    Creates a pooled HTTP session that retries failed requests with exponential backoff.
+
+    :param pool_size: The number of connections kept open per host.
+    :param retries: How many times a request is retried on connection errors, 429 and 5xx responses.
+    :param backoff: The backoff factor in seconds, the n-th retry waits backoff * 2^(n-1).
+    :return: A requests.Session ready to be shared between threads.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class RateLimiter:
+    """
+    Token bucket shared by all worker threads, so the whole run stays under the RapidAPI rate limit
+    no matter how many tickers are fetched at once.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: The number of requests allowed per second.
+        :param burst: The number of requests that may be sent back to back.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def earnings_ttl(earJSON: dict) -> float:
+    # The yearly and quarterly earnings only change after the next report date listed in earningsChart
+    now = time.time()
+    earnings_dates = earJSON.get('earningsChart', {}).get('earningsDate', [])
+    upcoming = [item['raw'] for item in earnings_dates if isinstance(item, dict) and item.get('raw', 0) > now]
+    if upcoming:
+        return min(upcoming) - now
+    return 86400
+
+# Seconds each endpoint stays fresh in the response cache, 0 => always fetched
+endpointTTL = {
+    'historical': 0,
+    'earnings': earnings_ttl,
+    'esg': 7 * 86400,
+    'finance': 0,
+    'trend': 86400,
+    'keystats': 86400,
+    'news': 0,
+}
 
-earJSON = earRes.json()
+def fetch_endpoint(session: requests.Session, url: str, headers: dict, timeout: float = 30, limiter: RateLimiter = None,
+                   cache: ResponseCache = None, ttl=0) -> tuple:
+    """
+    Fetches a single endpoint and measures how long it took, retries included.
+
+    :param session: The shared session to send the request through.
+    :param url: The URL of the endpoint.
+    :param headers: The RapidAPI headers for the endpoint.
+    :param timeout: Seconds to wait for the server before giving up.
+    :param limiter: Optional rate limiter shared with the other requests of the run.
+    :param cache: Optional response cache, fresh entries are returned without a request.
+    :param ttl: Seconds the response stays fresh in the cache (see endpointTTL).
+    :return: A (response, elapsed seconds) tuple, response is None if the request failed.
+    """
+    start = time.perf_counter()
+
+    # Endpoints with ttl 0 are never cached, not even revalidated
+    if cache is not None and not ttl:
+        cache = None
+
+    if cache is not None:
+        cached = cache.fresh(url)
+        if cached is not None:
+            return cached, time.perf_counter() - start
+        headers = {**headers, **cache.validators(url)}
+
+    if limiter is not None:
+        limiter.acquire()
+
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Request to {url} failed: {e}")
+        response = None
+
+    if cache is not None:
+        response = cache.store(url, response, ttl)
+    return response, time.perf_counter() - start
+
+def fetch_all(ticker: str, session: requests.Session = None, max_workers: int = 4, timeout: float = 30,
+              yahoo_base: str = yahooBaseURL, reuters_base: str = reutersBaseURL, history_range: str = '3mo',
+              cache: ResponseCache = None) -> tuple:
+    """
+    Fetches all seven endpoints for a ticker concurrently.
+
+    :param ticker: The stock ticker to fetch.
+    :param session: A shared session, a new pooled session is created if None.
+    :param max_workers: The maximum number of requests in flight at the same time.
+    :param timeout: Seconds to wait for each endpoint before giving up.
+    :param yahoo_base: Base URL of the Yahoo Finance API.
+    :param reuters_base: Base URL of the Reuters API.
+    :param history_range: The range of daily bars to request from the historical endpoint.
+    :param cache: Optional response cache for the slowly changing endpoints.
+    :return: A (responses, timings) tuple, both dictionaries keyed by endpoint name.
+    """
+    endpoints = build_requests(ticker, yahoo_base, reuters_base, history_range)
+    session = session or make_session(pool_size=max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(fetch_endpoint, session, url, headers, timeout, None, cache, endpointTTL[name])
+                   for name, (url, headers) in endpoints.items()}
+
+    responses = {}
+    timings = {}
+    for name, future in futures.items():
+        responses[name], timings[name] = future.result()
+
+    return responses, timings
+
+# DATA EXTRACTION
 
 def extract_financials_data(financials_data):
     # Initialize a list to store extracted data
@@ -116,77 +244,6 @@ def extract_financials_data(financials_data):
 
     return pd.DataFrame(extracted_data)
 
-eardf = extract_financials_data(earJSON['financialsChart'])
-
-#create folder if doesnt exist
-if not os.path.exists(earFolder):
-    os.makedirs(earFolder)
-
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(earFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(earFolder, filename))
-
-#save the dataframe to folder
-earFilepath = os.path.join(earFolder, f'{ticker}_Earnings.csv')
-eardf.to_csv(earFilepath, index=False)
-
-#ESG
-
-esgJSON = esgRes.json()
-ESGdata = {
-    'Total ESG Score': esgJSON['totalEsg']['fmt'],
-    'Environment Score': esgJSON['environmentScore']['fmt'],
-    'Social Score': esgJSON['socialScore']['fmt'],
-    'Governance Score': esgJSON['governanceScore']['fmt'],
-    'Rating Year': esgJSON['ratingYear'],
-}
-
-esgdf = pd.DataFrame([ESGdata])
-
-#create folder if doesnt exist
-if not os.path.exists(esgFolder):
-    os.makedirs(esgFolder)
-
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(esgFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(esgFolder, filename))
-
-#save the dataframe to folder
-esgFilepath = os.path.join(esgFolder, f'{ticker}_ESGscore.csv')
-esgdf.to_csv(esgFilepath, index=False)
-
-#FINANCIAL ANALYTICS 
-finJSON = finRes.json()
-finData = {key: value['fmt'] if isinstance(value, dict) and 'fmt' in value else value 
-                  for key, value in finJSON.items()}
-
-findf = pd.DataFrame([finData])
-
-findf.drop('maxAge', axis=1, inplace=True)
-findf.drop('numberOfAnalystOpinions', axis=1, inplace=True)
-findf.drop('grossProfits', axis=1, inplace=True)
-findf.drop('financialCurrency', axis=1, inplace=True)
-findf.drop('recommendationKey', axis=1, inplace=True)
-findf.drop('recommendationMean', axis=1, inplace=True)
-
-#create folder if doesnt exist
-if not os.path.exists(finFolder):
-    os.makedirs(finFolder)
-
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(finFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(finFolder, filename))
-
-#save the dataframe to folder
-finFilepath = os.path.join(finFolder, f'{ticker}_Financials.csv')
-findf.to_csv(finFilepath, index=False)
-
-#TRENDS 
-treJSON = treRes.json()
-
 def extract_fmt_values(data):
     extracted_data = {}
     for key, value in data.items():
@@ -209,96 +266,303 @@ def extract_fmt_values(data):
                     extracted_data[new_key] = nested_value
     return extracted_data
 
-# Extracting "fmt" values
-treData = extract_fmt_values(treJSON)
-
-# Converting to DataFrame for easy viewing/manipulation
-tredf = pd.DataFrame([treData])
-
-tredf.drop('epsRevisions_downLast30days', axis=1, inplace=True)
-tredf.drop('epsRevisions_upLast30days', axis=1, inplace=True)
-tredf.drop('epsRevisions_upLast7days', axis=1, inplace=True)
-tredf.drop('earningsEstimate_numberOfAnalysts', axis=1, inplace=True)
-tredf.drop('revenueEstimate_numberOfAnalysts', axis=1, inplace=True)
-
-#create folder if doesnt exist
-if not os.path.exists(treFolder):
-    os.makedirs(treFolder)
-
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(treFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(treFolder, filename))
-
-#save the dataframe to folder
-treFilepath = os.path.join(treFolder, f'{ticker}_TrendScores.csv')
-tredf.to_csv(treFilepath, index=False)
-
-#KEY STATISTICS
-
-keyJSON = keyRes.json()
-
-# Extracting "fmt" values
-keyData = extract_fmt_values(keyJSON)
-
-# Converting to DataFrame for easy viewing/manipulation
-keydf = pd.DataFrame([keyData])
-keydf.drop('askSize', axis=1, inplace=True)
-
-#create folder if doesnt exist
-if not os.path.exists(keyFolder):
-    os.makedirs(keyFolder)
-
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(keyFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(keyFolder, filename))
-
-#save the dataframe to folder
-keyFilepath = os.path.join(keyFolder, f'{ticker}_KeyStatistics.csv')
-keydf.to_csv(keyFilepath, index=False)
-
-#NEWS DATA 
-
-newsJSON = newsRes.json()
-
-# Define a list to store extracted information for each article
-newsData = []
-
-# Iterate through each article in the newsJSON
-for article in newsJSON['articles']:
-    # Extract the needed information
-    title = article['articlesName']
-    short_description = article['articlesShortDescription']
-    
-    # Parse the 'articlesDescription' string into a Python list of dictionaries
-    articles_description = json.loads(article['articlesDescription'])
-    
-   
-    # Extract and format the publishing date
-    publishing_date = datetime.strptime(article['dateModified']['date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y')
-    
-    # Append the information to the list
-    newsData.append({
-        'Title': title,
-        'Short Description': short_description,
-        'Publishing Date': publishing_date
+def historical_frame(hisJSON: dict) -> pd.DataFrame:
+    # HISTORICAL PRICE DATA
+
+    #filter out the info
+    hisTimestamps = hisJSON['timestamp']
+    hisOpens = hisJSON['indicators']['quote'][0]['open']
+    hisCloses = hisJSON['indicators']['quote'][0]['close']
+    hisVolumes = hisJSON['indicators']['quote'][0]['volume']
+
+    #dataframe
+    hisdf = pd.DataFrame({
+        'Timestamp': hisTimestamps,
+        'Open': hisOpens,
+        'Close': hisCloses,
+        'Volume': hisVolumes
     })
 
-# Convert the list of dictionaries to a DataFrame
-newsdf = pd.DataFrame(newsData)
+    #clean up date
+    hisdf['Date'] = pd.to_datetime(hisdf['Timestamp'], unit='s').dt.strftime('%d-%m-%Y')
+    hisdf.drop('Timestamp', axis=1, inplace=True)
+
+    return hisdf
+
+def save_historical(ticker: str, hisJSON: dict) -> str:
+    return save_frame(historical_frame(hisJSON), hisFolder, ticker)
+
+def history_range_for(ticker: str) -> str:
+    """
+    Finds the smallest range of daily bars that covers the days since the last stored date for a ticker.
+
+    :param ticker: The stock ticker.
+    :return: A range accepted by the historical endpoint, e.g. '5d' or '1mo'.
+    """
+    try:
+        dates = load_frame(ticker, hisFolder, columns=['Date'])['Date']
+    except FileNotFoundError:
+        return initialHistoryRange
+
+    if dates.empty:
+        return initialHistoryRange
+
+    last_date = pd.to_datetime(dates, format='%d-%m-%Y').max()
+    missing_days = (pd.Timestamp.now().normalize() - last_date).days
+
+    for history_range, days in historyRanges:
+        if missing_days < days:
+            return history_range
+    return 'max'
+
+def update_historical(ticker: str, hisJSON: dict, window: int = None, slack: int = None) -> str:
+    """
+    Merges newly fetched bars into the stored history instead of replacing it.
+    Bars are deduplicated by date (the newest fetch wins) and only the last 'window' bars are kept.
+    New bars are appended to the end of the CSV file until it holds more than 'window' + 'slack' bars,
+    the file is only rewritten (and trimmed back to 'window') then or when a stored bar changed.
+
+    :param ticker: The stock ticker.
+    :param hisJSON: The response from the historical endpoint.
+    :param window: The number of bars to keep, defaults to historyWindow.
+    :param slack: The number of bars the file may hold past the window before it is trimmed, defaults to historySlack.
+    :return: The path of the written file.
+    """
+    window = window or historyWindow
+    slack = historySlack if slack is None else slack
+    newdf = historical_frame(hisJSON)
+
+    try:
+        olddf = load_frame(ticker, hisFolder)
+    except FileNotFoundError:
+        return save_frame(newdf.tail(window), hisFolder, ticker)
+
+    # The columnar store keeps typed dates, the merge works on the CSV date strings
+    if pd.api.types.is_datetime64_any_dtype(olddf['Date']):
+        olddf['Date'] = olddf['Date'].dt.strftime('%d-%m-%Y')
+
+    old_dates = pd.to_datetime(olddf['Date'], format='%d-%m-%Y')
+    new_dates = pd.to_datetime(newdf['Date'], format='%d-%m-%Y')
+
+    last_date = old_dates.max() if not old_dates.empty else pd.Timestamp.min
+    appended = newdf[new_dates > last_date]
+
+    # Bars that were already stored but came back with different values (e.g. a bar fetched mid-session)
+    overlap = newdf[new_dates <= last_date].merge(olddf, on='Date', how='inner', suffixes=('', '_old'))
+    changed = any((overlap[column].ne(overlap[f'{column}_old']) & overlap[column].notna()).any()
+                  for column in ['Open', 'Close', 'Volume'])
+
+    # Only a CSV file can be appended to, the columnar store writes a new snapshot
+    if not changed and len(olddf) + len(appended) <= window + slack and dataBackend == 'csv':
+        hisFilepath = csv_path(ticker, hisFolder)
+        if not appended.empty:
+            appended[olddf.columns].to_csv(hisFilepath, mode='a', header=False, index=False)
+        return hisFilepath
+
+    hisdf = pd.concat([olddf, newdf], ignore_index=True)
+    hisdf['SortDate'] = pd.to_datetime(hisdf['Date'], format='%d-%m-%Y')
+    hisdf = hisdf.drop_duplicates(subset='Date', keep='last').sort_values('SortDate').drop('SortDate', axis=1)
+
+    return save_frame(hisdf.tail(window), hisFolder, ticker)
+
+def save_earnings(ticker: str, earJSON: dict) -> str:
+    #EARNINGS
+    eardf = extract_financials_data(earJSON['financialsChart'])
+    return save_frame(eardf, earFolder, ticker)
+
+def save_esg(ticker: str, esgJSON: dict) -> str:
+    #ESG
+    ESGdata = {
+        'Total ESG Score': esgJSON['totalEsg']['fmt'],
+        'Environment Score': esgJSON['environmentScore']['fmt'],
+        'Social Score': esgJSON['socialScore']['fmt'],
+        'Governance Score': esgJSON['governanceScore']['fmt'],
+        'Rating Year': esgJSON['ratingYear'],
+    }
+
+    esgdf = pd.DataFrame([ESGdata])
+    return save_frame(esgdf, esgFolder, ticker)
+
+def save_finance(ticker: str, finJSON: dict) -> str:
+    #FINANCIAL ANALYTICS
+    finData = {key: value['fmt'] if isinstance(value, dict) and 'fmt' in value else value
+                      for key, value in finJSON.items()}
+
+    findf = pd.DataFrame([finData])
+
+    findf.drop('maxAge', axis=1, inplace=True)
+    findf.drop('numberOfAnalystOpinions', axis=1, inplace=True)
+    findf.drop('grossProfits', axis=1, inplace=True)
+    findf.drop('financialCurrency', axis=1, inplace=True)
+    findf.drop('recommendationKey', axis=1, inplace=True)
+    findf.drop('recommendationMean', axis=1, inplace=True)
+
+    return save_frame(findf, finFolder, ticker)
+
+def save_trend(ticker: str, treJSON: dict) -> str:
+    #TRENDS
+
+    # Extracting "fmt" values
+    treData = extract_fmt_values(treJSON)
+
+    # Converting to DataFrame for easy viewing/manipulation
+    tredf = pd.DataFrame([treData])
+
+    tredf.drop('epsRevisions_downLast30days', axis=1, inplace=True)
+    tredf.drop('epsRevisions_upLast30days', axis=1, inplace=True)
+    tredf.drop('epsRevisions_upLast7days', axis=1, inplace=True)
+    tredf.drop('earningsEstimate_numberOfAnalysts', axis=1, inplace=True)
+    tredf.drop('revenueEstimate_numberOfAnalysts', axis=1, inplace=True)
+
+    return save_frame(tredf, treFolder, ticker)
+
+def save_keystats(ticker: str, keyJSON: dict) -> str:
+    #KEY STATISTICS
+
+    # Extracting "fmt" values
+    keyData = extract_fmt_values(keyJSON)
+
+    # Converting to DataFrame for easy viewing/manipulation
+    keydf = pd.DataFrame([keyData])
+    keydf.drop('askSize', axis=1, inplace=True)
+
+    return save_frame(keydf, keyFolder, ticker)
+
+def save_news(ticker: str, newsJSON: dict) -> str:
+    #NEWS DATA
 
-#create folder if doesnt exist
-if not os.path.exists(newsFolder):
-    os.makedirs(newsFolder)
+    # Define a list to store extracted information for each article
+    newsData = []
 
-#deletes any previous files in the folder with the given ticker
-for filename in os.listdir(newsFolder):
-    if filename.startswith(ticker):
-        os.remove(os.path.join(newsFolder, filename))
+    # Iterate through each article in the newsJSON
+    for article in newsJSON['articles']:
+        # Extract the needed information
+        title = article['articlesName']
+        short_description = article['articlesShortDescription']
 
-#save the dataframe to folder
-newsFilepath = os.path.join(newsFolder, f'{ticker}_News.csv')
-newsdf.to_csv(newsFilepath, index=False)
+        # Parse the 'articlesDescription' string into a Python list of dictionaries
+        articles_description = json.loads(article['articlesDescription'])
 
+        # Extract and format the publishing date
+        publishing_date = datetime.strptime(article['dateModified']['date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y')
+
+        # Append the information to the list
+        newsData.append({
+            'Title': title,
+            'Short Description': short_description,
+            'Publishing Date': publishing_date
+        })
+
+    # Convert the list of dictionaries to a DataFrame
+    newsdf = pd.DataFrame(newsData)
+    return save_frame(newsdf, newsFolder, ticker)
+
+# Maps each endpoint to the function that turns its JSON into a CSV
+endpoint_writers = {
+    'historical': save_historical,
+    'earnings': save_earnings,
+    'esg': save_esg,
+    'finance': save_finance,
+    'trend': save_trend,
+    'keystats': save_keystats,
+    'news': save_news,
+}
 
+def write_response(ticker: str, name: str, response: requests.Response, incremental: bool = True) -> bool:
+    """
+    Writes the CSV file for one endpoint response, skipping failed requests.
+
+    :param incremental: If True the historical bars are merged into the stored history instead of replacing it.
+    :return: True if the file was written, False if the response was skipped.
+    """
+    if response is None or not response.ok:
+        status = response.status_code if response is not None else "no response"
+        print(f"Skipping {name} for {ticker}: {status}")
+        return False
+
+    if name == 'historical' and incremental:
+        update_historical(ticker, response.json())
+    else:
+        endpoint_writers[name](ticker, response.json())
+    return True
+
+def refresh_ticker(ticker: str, session: requests.Session = None, max_workers: int = 4, timeout: float = 30,
+                   yahoo_base: str = yahooBaseURL, reuters_base: str = reutersBaseURL, incremental: bool = True,
+                   cache: ResponseCache = None) -> dict:
+    """
+    Fetches all seven endpoints for a ticker concurrently and writes the CSV files.
+
+    :param ticker: The stock ticker to refresh.
+    :param incremental: If True only the missing historical bars are fetched and appended, else the last 3 months are rewritten.
+    :param cache: Optional response cache for the slowly changing endpoints.
+    :return: A dictionary with the wall-clock seconds spent on each endpoint.
+    """
+    history_range = history_range_for(ticker) if incremental else '3mo'
+    responses, timings = fetch_all(ticker, session, max_workers, timeout, yahoo_base, reuters_base, history_range, cache)
+
+    for name, response in responses.items():
+        write_response(ticker, name, response, incremental)
+
+    return timings
+
+def refresh_tickers(tickers: list = None, session: requests.Session = None, max_workers: int = 8, rate: float = 5,
+                    timeout: float = 30, yahoo_base: str = yahooBaseURL, reuters_base: str = reutersBaseURL,
+                    incremental: bool = True, cache: ResponseCache = None) -> tuple:
+    """
+    Fetches every (ticker x endpoint) pair in one sweep and writes all the CSV files.
+    All requests share one connection pool and one rate limiter, files are written as the responses arrive.
+
+    :param tickers: The stock tickers to refresh, defaults to every ticker in ticker_to_company.
+    :param session: A shared session, a new pooled session is created if None.
+    :param max_workers: The maximum number of requests in flight at the same time.
+    :param rate: The maximum number of requests per second across all tickers.
+    :param timeout: Seconds to wait for each endpoint before giving up.
+    :param incremental: If True only the missing historical bars are fetched and appended, else the last 3 months are rewritten.
+    :param cache: Optional response cache for the slowly changing endpoints.
+    :return: A (timings, failed) tuple: the per-endpoint wall-clock seconds of each ticker, and a list with the
+        ticker, endpoint and error of every response that couldn't be written.
+    """
+    tickers = tickers or list(ticker_to_company)
+    session = session or make_session(pool_size=max_workers)
+    limiter = RateLimiter(rate, burst=max_workers)
+
+    timings = {ticker: {} for ticker in tickers}
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for ticker in tickers:
+            history_range = history_range_for(ticker) if incremental else '3mo'
+            for name, (url, headers) in build_requests(ticker, yahoo_base, reuters_base, history_range).items():
+                future = pool.submit(fetch_endpoint, session, url, headers, timeout, limiter, cache, endpointTTL[name])
+                futures[future] = (ticker, name)
+
+        # Writing happens on this thread only, so two files are never written at the same time.
+        # A failed fetch or a malformed body only skips its own file, the rest of the sweep carries on
+        for future in as_completed(futures):
+            ticker, name = futures[future]
+            try:
+                response, timings[ticker][name] = future.result()
+                if not write_response(ticker, name, response, incremental):
+                    status = response.status_code if response is not None else "no response"
+                    failed.append({'ticker': ticker, 'endpoint': name, 'error': str(status)})
+            except Exception as e:
+                print(f"Refreshing {name} for {ticker} failed: {e}")
+                failed.append({'ticker': ticker, 'endpoint': name, 'error': str(e)})
+
+    return timings, failed
+
+if __name__ == "__main__":
+    # python InitMemory.py tsla msft => refreshes the given tickers, no arguments => every ticker in ticker_to_company
+    # python InitMemory.py --no-cache => fetches every endpoint, ignoring the response cache
+    tickers = [arg.lower() for arg in sys.argv[1:] if not arg.startswith('--')] or list(ticker_to_company)
+    cache = ResponseCache(enabled='--no-cache' not in sys.argv)
+
+    start = time.perf_counter()
+    all_timings, failed = refresh_tickers(tickers, cache=cache)
+    for ticker, timings in all_timings.items():
+        for name, elapsed in timings.items():
+            print(f"{ticker} {name}: {elapsed:.2f}s")
+    for failure in failed:
+        print(f"Not refreshed: {failure['ticker']} {failure['endpoint']} ({failure['error']})")
+    print(f"Refreshed {len(tickers)} tickers in {time.perf_counter() - start:.2f}s")
+    print(f"Response cache: {cache.stats()}")
@@ -1,23 +1,35 @@
 from autogen import config_list_from_json, OpenAIWrapper, AssistantAgent, UserProxyAgent
+from autogen.agentchat.chat import ChatResult
 import autogen
 import os 
 from dotenv import load_dotenv
-import json
+import re
+from decimal import Decimal
 import pandas as pd
 from datetime import date
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from dataStore import snapshotCache
+from features import ticker_signals
+from payloadCompactor import payloadMode, compact_payload, payloadStats
+from llmCache import llmCache
+from dbPool import get_connection
+from consensus import aggregate_debate
+from dbWriter import bufferedWriter
+from transcriptWriter import TranscriptWriter, historyFormat
+from replayClient import ReplayClient, replayConfigList
 
 load_dotenv()
 
 #CONFIG
 
-config_list = config_list_from_json(env_or_file="OAI_CONFIG_LIST")
+# 'live' => the models of OAI_CONFIG_LIST, 'replay' => the scripted stand-in of replayClient.py, no request leaves the machine
+llmBackend = os.getenv('LLM_BACKEND', 'live').lower()
 
-ticker = "META" #TSLA, MSFT, NVDA, META 
-todaysDate = date.today()
-model = "GPT3.5" #GPT3.5 , MISTRAL 
-version = "V2"
+config_list = replayConfigList if llmBackend == 'replay' else config_list_from_json(env_or_file="OAI_CONFIG_LIST")
 
 ticker_to_company = {
     "tsla": "Tesla",
@@ -26,8 +38,6 @@ ticker_to_company = {
     "meta": "Meta",
 }
 
-stock = ticker_to_company.get(ticker.lower(), "Unknown")
-
 hisFolder = 'HistoricalData'
 earFolder = 'EarningsData'
 esgFolder = 'ESGScores'
@@ -43,14 +53,6 @@ llm_config = {
     "temperature": 0 #Creativity     
 }
 
-DATABASE_CONFIG = {
-    'database': os.getenv('DATABASE_NAME'),
-    'user': os.getenv('DATABASE_USER'),
-    'port': os.getenv('DATABASE_PORT'),
-    'password': os.getenv('DATABASE_PASSWORD'),
-    'host': os.getenv('DATABASE_HOST')
-}
-
 # FUNTIONS
 def gather_csv(ticker: str, folder: str) -> dict:
     """
@@ -62,36 +64,35 @@ def gather_csv(ticker: str, folder: str) -> dict:
     :return: A JSON object containing the data in an agent-readable format.
     """
     
-    # Adjust the filename pattern based on the folder if necessary
-    filename_patterns = {
-        'HistoricalData': f"{ticker}_Historical.csv",
-        'EarningsData': f"{ticker}_Earnings.csv",
-        'ESGScores': f"{ticker}_ESGscore.csv",
-        'Financial Analytics Metrics': f"{ticker}_Financials.csv",
-        'Trend Indicator Scores': f"{ticker}_TrendScores.csv",
-        'Key Statistics': f"{ticker}_KeyStatistics.csv",
-        'News': f"{ticker}_News.csv"
-    }
-    
-    filename = filename_patterns.get(folder, f"{ticker}.csv")
-    file_path = os.path.join(folder, filename)
-
     try:
-        # Load the CSV file into a DataFrame
-        df = pd.read_csv(file_path)
-
-        # Convert the DataFrame to a JSON object
-        data_json = df.to_json(orient='records')
-        
-        # Convert the JSON string back to a dictionary for easier manipulation or direct use
-        data_dict = json.loads(data_json)
-
-        return data_dict
+        # The records are loaded from the CSV file or the columnar store (DATA_BACKEND) once per run
+        return snapshotCache.records(ticker, folder)
 
     except FileNotFoundError:
-        print(f"File {filename} not found in {folder}.")
+        print(f"No data for {ticker} found in {folder}.")
         return {}
 
+def gather_csv_for(agent: str):
+    """
+    :return: gather_csv for one agent, its results compacted to the agent's token budget (see payloadCompactor.py).
+    """
+    if payloadMode != 'compact':
+        return gather_csv
+
+    @functools.wraps(gather_csv)
+    def budgeted_gather_csv(ticker: str, folder: str) -> dict:
+        try:
+            df = snapshotCache.frame(ticker, folder)
+        except FileNotFoundError:
+            print(f"No data for {ticker} found in {folder}.")
+            return {}
+
+        payload, before, after = compact_payload(df, folder, agent, snapshotCache.records(ticker, folder))
+        payloadStats.add(before, after)
+        return payload
+
+    return budgeted_gather_csv
+
 def gather_price(ticker: str) -> dict:
     """
     Gathers the newest 'Open' price for the given stock ticker from the 'HistoricalData' folder.
@@ -101,12 +102,10 @@ def gather_price(ticker: str) -> dict:
     """
     
     folder = 'HistoricalData'
-    filename = f"{ticker}_Historical.csv"
-    file_path = os.path.join(folder, filename)
 
     try:
-        # Load the CSV file into a DataFrame
-        df = pd.read_csv(file_path)
+        # Take only the columns needed from the snapshot of the file
+        df = snapshotCache.frame(ticker, folder, columns=['Date', 'Open'])
 
         # Ensure the DataFrame is sorted by Date in descending order to get the newest record first
         df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
@@ -125,7 +124,7 @@ def gather_price(ticker: str) -> dict:
         return result
 
     except FileNotFoundError:
-        print(f"File {filename} not found in {folder}.")
+        print(f"No data for {ticker} found in {folder}.")
         return {}
 
 def gather_timeseries(ticker: str) -> str:
@@ -138,12 +137,10 @@ def gather_timeseries(ticker: str) -> str:
     """
     
     folder = 'HistoricalData'
-    filename = f"{ticker}_Historical.csv"
-    file_path = os.path.join(folder, filename)
 
     try:
-        # Load the CSV file into a DataFrame
-        df = pd.read_csv(file_path)
+        # Take only the columns needed from the snapshot of the file
+        df = snapshotCache.frame(ticker, folder, columns=['Date', 'Open'])
 
         df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
         df.sort_values(by='Date', ascending=True, inplace=True)
@@ -157,10 +154,60 @@ def gather_timeseries(ticker: str) -> str:
         return open_prices_str
 
     except FileNotFoundError:
-        print(f"File {filename} not found in {folder}.")
+        print(f"No data for {ticker} found in {folder}.")
         return ""
     
-def insert_summary(date: str, ticker: str, model: str, version: str, content: str, decision: str, price: str, position: bool, positionsize:str) -> dict:
+def gather_features(ticker: str) -> dict:
+    """
+    Gathers precomputed technical signals for the given stock ticker from the 'HistoricalData' folder:
+    moving averages, returns, volatility, RSI, MACD, volume z-score and drawdown for the newest trading day.
+
+    :param ticker: The stock ticker for which to gather the signals.
+    :return: A JSON object containing the signals.
+    """
+    try:
+        return ticker_signals(ticker)
+
+    except FileNotFoundError:
+        print(f"No data for {ticker} found in {hisFolder}.")
+        return {}
+
+# TYPED VALUES
+# mdmemory and mddebate store price and positionsize as NUMERIC and decision as the trade_decision enum (see postgresSetup.py)
+def parse_number(value):
+    """
+    Parses a price or position size sent by an agent, e.g. 172.5, '172.50', '$172.50' or '35 shares'.
+
+    :return: The value as a float, or None if it holds no number.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = re.search(r'-?\d+(?:\.\d+)?', str(value).replace(',', ''))
+    return float(match.group()) if match else None
+
+def parse_decision(value):
+    """
+    :return: The decision as BUY, SELL or HOLD ('BUY MORE' counts as BUY, 'NON-ACTION' as HOLD), or None if unknown.
+    """
+    text = str(value or '').strip().upper()
+    if text.startswith('BUY'):
+        return 'BUY'
+    if text.startswith('SELL'):
+        return 'SELL'
+    if text in ('HOLD', 'NON-ACTION'):
+        return 'HOLD'
+    return None
+
+def typed_row(row: dict) -> dict:
+    # Dates and NUMERIC values are converted to plain JSON types before they are handed to an agent
+    for column, value in row.items():
+        if isinstance(value, Decimal):
+            row[column] = float(value)
+        elif isinstance(value, date):
+            row[column] = value.strftime('%Y-%m-%d')
+    return row
+
+def insert_summary(date: str, ticker: str, model: str, version: str, content: str, decision: str, price: float, position: bool, positionsize: float) -> dict:
     """
     Inserts a summary into the mdmemory table without requiring an external database connection passed as a parameter.
 
@@ -169,19 +216,34 @@ def insert_summary(date: str, ticker: str, model: str, version: str, content: st
     :param model: Model used for generating the summary.
     :param version: Version of the debate structure.
     :param content: Content of the summary.
-    :param decision: The trading decision made, BUY, SELL, HOLD, BUY MORE, NON-ACTION
+    :param decision: The trading decision made, BUY, SELL or HOLD.
     :param price: Today's opening price.
     :param position: boolean value, if true => we have stock in the company, of false => we don't.
-    :param positionsize: the amount of stock we hold of the stock.
+    :param positionsize: the number of shares we hold of the stock.
     :return: True if insertion was successful, False if an error occurred.
     """
+    if parse_decision(decision) is None:
+        print(f"Unknown decision {decision!r}, use BUY, SELL or HOLD")
+        return False
+
     try:
-        with psycopg2.connect(**DATABASE_CONFIG) as conn:
+        if bufferedWriter is not None:
+            # Written with the rest of the debate, see dbWriter.py
+            return bufferedWriter.add("mdmemory", {
+                "date": str(date), "ticker": ticker, "model": model, "version": version, "content": content,
+                "decision": parse_decision(decision), "price": parse_number(price), "position": position,
+                "positionsize": parse_number(positionsize),
+            })
+
+        with get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO mdmemory (date, ticker, model, version, content, decision, price, position, positionsize)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (date, ticker, model, version, content, decision, price, position, positionsize))
+                    ON CONFLICT (ticker, model, version, date) DO UPDATE SET
+                        content = EXCLUDED.content, decision = EXCLUDED.decision, price = EXCLUDED.price,
+                        position = EXCLUDED.position, positionsize = EXCLUDED.positionsize
+                """, (date, ticker, model, version, content, parse_decision(decision), parse_number(price), position, parse_number(positionsize)))
                 conn.commit()
                 return True
     except psycopg2.Error as e:
@@ -202,22 +264,19 @@ def get_summary(ticker: str, model: str, version: str) -> dict:
     :return: The most recent summary as a dictionary, or an empty dictionary if not found.
     """
     try:
-        # Establish the database connection inside the function
-        with psycopg2.connect(**DATABASE_CONFIG) as conn:
-            with conn.cursor() as cur:
+        # Borrow a connection from the shared pool
+        with get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
-                    SELECT * FROM mdmemory
+                    SELECT id, date, ticker, model, version, content, decision, price, position, positionsize
+                    FROM mdmemory
                     WHERE ticker = %s AND model = %s AND version = %s
                     ORDER BY date DESC
                     LIMIT 1
                 """, (ticker, model, version))
                 result = cur.fetchone()
                 if result:
-                    column_names = ['id', 'date', 'ticker', 'model', 'version', 'content', 'position', 'positionsize']
-                    result = list(result)  # Convert tuple to list to modify it
-                    result[1] = result[1].strftime('%Y-%m-%d')  # Assuming 'date' is at index 1
-                    summary_dict = dict(zip(column_names, result))
-                    return summary_dict
+                    return typed_row(dict(result))
     except psycopg2.Error as e:
         print(f"Database error occurred: {e}")
     return {}
@@ -234,7 +293,7 @@ def get_opinions(date: str, ticker: str, model: str) -> list:
     """
     summaries = []
     try:
-        with psycopg2.connect(**DATABASE_CONFIG) as conn:
+        with get_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:  # Use RealDictCursor to get dictionaries
                 cur.execute("""
                     SELECT date, ticker, agent, model, content, decision, price, position, positionsize 
@@ -245,16 +304,14 @@ def get_opinions(date: str, ticker: str, model: str) -> list:
                 results = cur.fetchall()
                 
                 for result in results:
-                    # Convert date to string format if needed, assuming result['date'] is a datetime object
-                    result['date'] = result['date'].strftime('%Y-%m-%d')
-                    summaries.append(result)
+                    summaries.append(typed_row(dict(result)))
                 
     except psycopg2.Error as e:
         print(f"Database error occurred: {e}")
     
     return summaries
 
-def send_opinion(key: str, date: str, ticker: str, agent: str, model: str, version: str, content: str, decision: str, price: str,  position: bool, positionsize:str) -> dict:
+def send_opinion(key: int, date: str, ticker: str, agent: str, model: str, version: str, content: str, decision: str, price: float,  position: bool, positionsize: float) -> dict:
     """
     Inserts a summary into the mddebate table without requiring an external database connection passed as a parameter.
 
@@ -265,20 +322,36 @@ def send_opinion(key: str, date: str, ticker: str, agent: str, model: str, versi
     :param model: Model used for generating the summary.
     :param version: Version of the debate structure.
     :param content: Content of the summary.
-    :param decision: The trading decision made, BUY, SELL, HOLD, BUY MORE, NON-ACTION
+    :param decision: The trading decision made, BUY, SELL or HOLD.
     :param price: Today's opening price.
     :param position: boolean value, if true => we have stock in the company, of false => we don't.
-    :param positionsize: the amount of stock we hold of the stock.
+    :param positionsize: the number of shares we hold of the stock.
 
     :return: True if insertion was successful, False if an error occurred.
     """
+    if parse_decision(decision) is None:
+        print(f"Unknown decision {decision!r}, use BUY, SELL or HOLD")
+        return False
+
     try:
-        with psycopg2.connect(**DATABASE_CONFIG) as conn:
+        if bufferedWriter is not None:
+            # Written with the rest of the debate, see dbWriter.py
+            return bufferedWriter.add("mddebate", {
+                "key": int(parse_number(key)), "date": str(date), "ticker": ticker, "agent": agent, "model": model,
+                "version": version, "content": content, "decision": parse_decision(decision), "price": parse_number(price),
+                "position": position, "positionsize": parse_number(positionsize),
+            })
+
+        with get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO mddebate (key, date, ticker, agent, model, version, content, decision, price, position, positionsize)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (key, date, ticker, agent, model, version, content, decision, price, position, positionsize))
+                    ON CONFLICT (date, ticker, model, version, agent) DO UPDATE SET
+                        key = EXCLUDED.key, content = EXCLUDED.content, decision = EXCLUDED.decision, price = EXCLUDED.price,
+                        position = EXCLUDED.position, positionsize = EXCLUDED.positionsize
+                """, (int(parse_number(key)), date, ticker, agent, model, version, content, parse_decision(decision), parse_number(price),
+                      position, parse_number(positionsize)))
                 conn.commit()
                 return True
     except psycopg2.Error as e:
@@ -303,10 +376,7 @@ def calculate_average(numbers_str: str) -> float:
         return 0.0 
 
 #AGENTS
-MDfinAnalyst = autogen.AssistantAgent(
-    name="MDfinAnalyst",
-    llm_config=llm_config,
-    system_message= f"""
+finSystemMessage = """
     CHARACTERISTIC: You are MDfinAnalyst, a skilled financial analyst.
 
     OBJECTIVE: Every step of the process will be outlined for MDfinAnalyst by the user_proxy. Roughly explained, MDfinAnalyst will first gather 
@@ -314,8 +384,8 @@ MDfinAnalyst = autogen.AssistantAgent(
         potential buying or selling price of the stock. MDfinAnalyst will then use gather_csv to find the financial data to make a prediction about. 
         When calling get_summary, MDfinAnalyst calls for all the folders in one prompt.
          
-        Then, MDfinAnalyst will create a report on the financial information about {ticker}. The data is found using gather_csv, for the folders:
-        {hisFolder}, and {finFolder}. Based on this information MDfinAnalyst will construct a report on the 
+        Then, MDfinAnalyst will create a report on the financial information about {ticker}. The data is found using gather_csv, for the folder
+        {finFolder}, and the price signals from {hisFolder} using gather_features. Based on this information MDfinAnalyst will construct a report on the 
         financial outlooks of {ticker}. MDfinAnalyst will then reflect on the price fluctuations and the financial indicators of {ticker}, 
         and make a trading decision (BUY, HOLD, or SELL).
         MDfinAnalyst is required to reflect and provide a report on the findings before sending to the database using send_opinion function.
@@ -377,12 +447,8 @@ MDfinAnalyst = autogen.AssistantAgent(
 
         MDfinAnalyst is also required to look at the data from the get_summary function when making a decision, so that MDfinAnalyst adheres to the DECISION RULES above.
     """
-)
 
-MDnewsAnalyst = autogen.AssistantAgent(
-    name="MDnewsAnalyst",
-    llm_config=llm_config, 
-    system_message=f"""
+newsSystemMessage = """
     CHARACTERISTIC: You are MDnewsAnalyst, a skilled financial news specialist.
 
     OBJECTIVE: Every step of the process will be outlined for MDnewsAnalyst by the user_proxy. Roughly explained, MDnewsAnalyst will first gather 
@@ -449,12 +515,8 @@ MDnewsAnalyst = autogen.AssistantAgent(
         MDnewsAnalyst is also required to look at the data from the get_summary function when making a decision, so that MDnewsAnalyst adheres to the DECISION RULES above.
 
 """
-)
 
-MDnrelAnalyst = autogen.AssistantAgent(
-    name="MDnrelAnalyst",
-    llm_config=llm_config, 
-    system_message=f"""
+nrelSystemMessage = """
     CHARACTERISTIC: You are MDnrelAnalyst, a skilled financial news specialist.
 
     OBJECTIVE: Every step of the process will be outlined for MDnrelAnalyst by the user_proxy. Roughly explained, MDnrelAnalyst will first gather 
@@ -520,12 +582,8 @@ MDnrelAnalyst = autogen.AssistantAgent(
         MDnrelAnalyst is also required to look at the data from the get_summary function when making a decision, so that MDnrelAnalyst adheres to the DECISION RULES above.
 
 """
-)
 
-MDtserAnalyst = autogen.AssistantAgent(
-    name="MDtserAnalyst",
-    llm_config=llm_config,
-    system_message=f"""
+tserSystemMessage = """
     CHARACTERISTIC: You are MDtserAnalyst, a LLM timeseries precitor.
 
     OBJECTIVE: Every step of the process will be outlined for MDtserAnalyst by the user_proxy. Roughly explained, MDtserAnalyst will first gather 
@@ -588,12 +646,8 @@ MDtserAnalyst = autogen.AssistantAgent(
         MDtserAnalyst is also required to look at the data from the get_summary function when making a decision, so that MDtserAnalyst adheres to the DECISION RULES above.
 
 """
-)
 
-MDearnAnalyst = autogen.AssistantAgent(
-    name="MDearnAnalyst",
-    llm_config=llm_config,
-    system_message= f"""
+earnSystemMessage = """
     CHARACTERISTIC: You are MDearnAnalyst, a skilled financial analyst.
 
     OBJECTIVE: Every step of the process will be outlined for MDearnAnalyst by the user_proxy. Roughly explained, MDearnAnalyst will first gather 
@@ -661,12 +715,8 @@ MDearnAnalyst = autogen.AssistantAgent(
 
         MDearnAnalyst is also required to look at the data from the get_summary function when making a decision, so that MDearnAnalyst adheres to the DECISION RULES above.
     """
-)
 
-MDkeyAnalyst = autogen.AssistantAgent(
-    name="MDkeyAnalyst",
-    llm_config=llm_config,
-    system_message=f"""
+keySystemMessage = """
     CHARACTERISTIC: You are MDkeyAnalyst, a skilled financial analyst.
 
     OBJECTIVE: Every step of the process will be outlined for MDkeyAnalyst by the user_proxy. Roughly explained, MDkeyAnalyst will first gather 
@@ -735,12 +785,8 @@ MDkeyAnalyst = autogen.AssistantAgent(
 
         MDkeyAnalyst is also required to look at the data from the get_summary function when making a decision, so that MDkeyAnalyst adheres to the DECISION RULES above.
 """
-)
 
-MDmanager = autogen.AssistantAgent(
-    name="MDmanager",
-    llm_config=llm_config,
-    system_message=f"""
+managerSystemMessage = """
     CHARACTERISTIC: You are MDmanager, a professional data gatherer and summarizer.
 
     OBJECTIVE: The complete tasklist will be outlined by the user_proxy prompt. Roughly explained, MDmanager will first gather all the 6 agents 
@@ -811,23 +857,30 @@ MDmanager = autogen.AssistantAgent(
     MDanalyst will then take the average from those 'positionsize's and input it into the database, using insert_summary.
      
      
-"""    
-)
+"""
 
-user_proxy = autogen.UserProxyAgent(
-    name="user_proxy",
-    human_input_mode="NEVER",
-    max_consecutive_auto_reply=20,
-    code_execution_config={},
-    llm_config=llm_config,
-    system_message= """You are the human admin that execute the function, and exclusively that. 
-    Reply TERMINATE if the task has been solved at full satisfaction.
-    Otherwise, Reply CONTINUE, or the reason why the task is not solved yet."""
-)
+def use_replay_client(agent: autogen.ConversableAgent, context: dict = None, narrative: bool = False):
+    # With LLM_BACKEND=replay every agent's client has to be registered before its first request
+    if llmBackend == 'replay':
+        agent.register_model_client(ReplayClient, agent=agent.name, context=context, narrative=narrative)
+
+def make_user_proxy() -> autogen.UserProxyAgent:
+    user_proxy = autogen.UserProxyAgent(
+        name="user_proxy",
+        human_input_mode="NEVER",
+        max_consecutive_auto_reply=20,
+        code_execution_config={},
+        llm_config=llm_config,
+        system_message= """You are the human admin that execute the function, and exclusively that. 
+        Reply TERMINATE if the task has been solved at full satisfaction.
+        Otherwise, Reply CONTINUE, or the reason why the task is not solved yet."""
+    )
+    use_replay_client(user_proxy)
+    return user_proxy
 
 
 #TASKS
-finTask = f"""Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
+finTask = """Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
 
 (1) Firstly, the agent will retieve the latest report from the SQL database. To get the report, use get_summary function, 
     insert {ticker}, {model}, {version}. This will output 'id', 'date', 'ticker', 'model', 'version', 'content', 'decision', 'position', and 'positionsize'. 
@@ -839,8 +892,9 @@ finTask = f"""Perform the following task list, to arrive at a decision and end-o
     RULE: The 'position' will be a boolean value, if we have stock in the company 'position'=True, then 'positionsize' > 0 (above 0). 
         The 'positionsize' is the amount of stock we hold. If we dont have stock in the company 'position'=False, and 'positionsize' = 0. 
 
-(2) Secondly, the agent will retrieve the financial and news data using the gather_csv function, insert {ticker} along with the accompanying
-    folders: {hisFolder}, and {finFolder}. The agent will call all the folders in one prompt.
+(2) Secondly, the agent will retrieve the financial data using the gather_csv function, insert {ticker} along with the accompanying
+    folder: {finFolder}, and the price signals (moving averages, returns, volatility, RSI, MACD, volume z-score and drawdown) using
+    the gather_features function, insert {ticker}. The agent will call both functions in one prompt.
     Based on this information the agent will construct a report on the financial outlooks of {ticker}. 
     MDfinAnalyst will then reflect on the price fluctuations and the financial indicators of {ticker}, and make a trading decision (BUY, HOLD, or SELL). 
     MDfinAnalyst is required to reflect and provide a report on the findings before sending to the database using send_opinion function.
@@ -898,7 +952,7 @@ DECISION RULES: ### 'positionsize' is the amount of stock we hold at the end of
     The agent is required to look at the data from the get_summary function when making a decision, so that the agent adheres to the DECISION RULES above.
 """
 
-newsTask = f"""Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
+newsTask = """Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
 
 (1) Firstly, the agent will retieve the latest report from the SQL database. To get the report, use get_summary function, 
     insert {ticker}, {model}, {version}. This will output 'id', 'date', 'ticker', 'model', 'version', 'content', 'decision', 'position', and 'positionsize'. 
@@ -969,7 +1023,7 @@ DECISION RULES: ### 'positionsize' is the amount of stock we hold at the end of
     The agent is required to look at the data from the get_summary function when making a decision, so that the agent adheres to the DECISION RULES above.
 """
 
-nrelTask = f"""Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
+nrelTask = """Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
 
 (1) Firstly, the agent will retieve the latest report from the SQL database. To get the report, use get_summary function, 
     insert {ticker}, {model}, {version}. This will output 'id', 'date', 'ticker', 'model', 'version', 'content', 'decision', 'position', and 'positionsize'. 
@@ -1039,7 +1093,7 @@ DECISION RULES: ### 'positionsize' is the amount of stock we hold at the end of
     The agent is required to look at the data from the get_summary function when making a decision, so that the agent adheres to the DECISION RULES above.
 """
 
-tserTask = f"""Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
+tserTask = """Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
 
 (1) MDtserAnalyst will first gather the time series data using the gather_timeseries function. MDtserAnalyst will input {ticker} into 
     gather_timeseries function, which will output a string of 10 numbers. Before doing any other funtion calls, 
@@ -1048,6 +1102,7 @@ tserTask = f"""Perform the following task list, to arrive at a decision and end-
 
 (2) After this the user_proxy will ask MDtserAnalyst to provide an analysis on the already outputted numbers. MDtserAnalyst will then perform the 
     gather_price and get_summary functions to get the potential buying or selling price of the stock, and last trading days thoughts and actions.  
+    MDtserAnalyst will also use the gather_features function, insert {ticker}, to check its prediction against the technical signals.
       
     MDtserAnalyst will create a report on predicted price of {ticker}. The data is provided through MDtserAnalyst, through it's prediction of
     next numbers in a timeseries. MDtserAnalyst are required to provide a 'decision' and a 'positionsize' that goes in line with the prediction outputted. 
@@ -1058,6 +1113,7 @@ tserTask = f"""Perform the following task list, to arrive at a decision and end-
     
     ### Last 10 datapoints: All points from the gather_timeseries function.
     ### Predicited 10 datapoints: MDtserAnalyst's 10 next predicted datapoints. 
+    ### Technical signals: trend (moving averages), RSI, MACD and volatility from the gather_features function.
         
     ### Decision: MDtserAnalyst must provide a 'decision' that adheres to the 'DECISION RULES'
     ### End-of-Day Position Size: MDtserAnalyst must provide a 'positionsize' that adheres to the 'DECISION RULES'
@@ -1102,7 +1158,7 @@ DECISION RULES: ### 'positionsize' is the amount of stock we hold at the end of
 
 """
 
-earnTask = f"""Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
+earnTask = """Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
 
 (1) Firstly, the agent will retieve the latest report from the SQL database. To get the report, use get_summary function, 
     insert {ticker}, {model}, {version}. This will output 'id', 'date', 'ticker', 'model', 'version', 'content', 'decision', 'position', and 'positionsize'. 
@@ -1174,7 +1230,7 @@ DECISION RULES: ### 'positionsize' is the amount of stock we hold at the end of
 
 """
 
-keyTask = f"""Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
+keyTask = """Perform the following task list, to arrive at a decision and end-of-day 'positionsize':
 
 (1) Firstly, the agent will retieve the latest report from the SQL database. To get the report, use get_summary function, 
     insert {ticker}, {model}, {version}. This will output 'id', 'date', 'ticker', 'model', 'version', 'content', 'decision', 'position', and 'positionsize'. 
@@ -1246,7 +1302,7 @@ DECISION RULES: ### 'positionsize' is the amount of stock we hold at the end of
 
 """
 
-sumTask = f"""Perform the following task list:
+sumTask = """Perform the following task list:
 
 (1) MDmanager will first use the get_opinions function to get todays agents opinions. MDmanager will input {todaysDate}, {ticker}, and {model},
 the funtion will output 6 observations of data, 1 for each agent that takes part in the debate. The function will output: 'date', 'ticker', 'agent', 'model',
@@ -1312,290 +1368,598 @@ DECISION RULES: MDmanager will gather the opinions from all 6 agents, they will
     MDanalyst will then take the average from those 'positionsize's and input it into the database, using insert_summary.
 """
 
+# Only used when MANAGER_MODE=narrative: the decision is already made in code, the LLM only writes the summary content
+narrativeTask = """Write today's summary of the debate on {ticker} for the database.
+
+Today's decision is {decision} with an end-of-day 'positionsize' of {positionsize}, decided by majority vote ({votes}).
+Do not change the decision or the 'positionsize'. Keep each agent's key points, formatted like 'MDfinAnalyst:', 'MDnewsAnalyst:', 'MDnrelAnalyst:', etc.
+Only reply with the summary.
+
+The agents' opinions:
+{opinions}
+"""
+
+
+#FACTORY
+analystNames = ["MDfinAnalyst", "MDnewsAnalyst", "MDnrelAnalyst", "MDtserAnalyst", "MDearnAnalyst", "MDkeyAnalyst"]
+
+systemMessages = {
+    "MDfinAnalyst": finSystemMessage,
+    "MDnewsAnalyst": newsSystemMessage,
+    "MDnrelAnalyst": nrelSystemMessage,
+    "MDtserAnalyst": tserSystemMessage,
+    "MDearnAnalyst": earnSystemMessage,
+    "MDkeyAnalyst": keySystemMessage,
+    "MDmanager": managerSystemMessage,
+}
+
+tasks = {
+    "MDfinAnalyst": finTask,
+    "MDnewsAnalyst": newsTask,
+    "MDnrelAnalyst": nrelTask,
+    "MDtserAnalyst": tserTask,
+    "MDearnAnalyst": earnTask,
+    "MDkeyAnalyst": keyTask,
+    "MDmanager": sumTask,
+}
+
+class LLMLimiter:
+    """
+    Caps the number of LLM requests in flight across every agent it is attached to, e.g. all the agents
+    of a portfolio run, and counts the requests made.
+    """
+
+    def __init__(self, max_requests: int):
+        self.semaphore = threading.BoundedSemaphore(max_requests)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def attach(self, agent: autogen.ConversableAgent):
+        # Wraps the agent's current client, attach after the agent's tools are registered (see build_agents)
+        if getattr(agent, "client", None) is None:
+            return
+
+        create = agent.client.create
+
+        def limited_create(**config):
+            with self.semaphore:
+                with self.lock:
+                    self.calls += 1
+                return create(**config)
+
+        agent.client.create = limited_create
+
+def debate_context(ticker: str, model: str, version: str, todaysDate) -> dict:
+    """
+    :return: The values the system messages and tasks are formatted with.
+    """
+    return {
+        "ticker": ticker,
+        "model": model,
+        "version": version,
+        "todaysDate": todaysDate,
+        "stock": ticker_to_company.get(ticker.lower(), "Unknown"),
+        "hisFolder": hisFolder,
+        "earFolder": earFolder,
+        "esgFolder": esgFolder,
+        "finFolder": finFolder,
+        "treFolder": treFolder,
+        "keyFolder": keyFolder,
+        "newsFolder": newsFolder,
+    }
+
+def build_agents(ticker: str, model: str, version: str, todaysDate, llm_limiter: LLMLimiter = None) -> dict:
+    """
+    Builds a fresh set of agents for one debate, so debates for different tickers never share agents or chat history.
+
+    :param ticker: Stock ticker of the debate.
+    :param model: The LLM model used.
+    :param version: Version of the debate structure.
+    :param todaysDate: Date of the debate.
+    :param llm_limiter: Optional limiter shared with other debates running at the same time.
+    :return: A dictionary with the agents by name, and the executing 'user_proxy'.
+    """
+    context = debate_context(ticker, model, version, todaysDate)
+
+    agents = {
+        name: autogen.AssistantAgent(
+            name=name,
+            llm_config=llm_config,
+            system_message=system_message.format(**context)
+        )
+        for name, system_message in systemMessages.items()
+    }
+    agents["user_proxy"] = make_user_proxy()
+
+    register_tools(agents, ticker, model, version)
+
+    # Registering a tool for the LLM gives the agent a new client, so the replay client and the limiter
+    # are only attached once every tool is registered.
+    # Outside MANAGER_MODE=llm the only request of MDmanager is the narrative summary
+    for name in systemMessages:
+        use_replay_client(agents[name], context, narrative=(name == "MDmanager" and managerMode != "llm"))
+
+    if llm_limiter is not None:
+        for agent in agents.values():
+            llm_limiter.attach(agent)
+    return agents
+
+def build_tasks(ticker: str, model: str, version: str, todaysDate) -> dict:
+    """
+    :return: A dictionary with the task message for each agent by name.
+    """
+    context = debate_context(ticker, model, version, todaysDate)
+    return {name: task.format(**context) for name, task in tasks.items()}
+
 
 #FUNTION MAP
+def register_tools(agents: dict, ticker: str, model: str, version: str):
+    MDfinAnalyst = agents["MDfinAnalyst"]
+    MDnewsAnalyst = agents["MDnewsAnalyst"]
+    MDnrelAnalyst = agents["MDnrelAnalyst"]
+    MDtserAnalyst = agents["MDtserAnalyst"]
+    MDearnAnalyst = agents["MDearnAnalyst"]
+    MDkeyAnalyst = agents["MDkeyAnalyst"]
+    MDmanager = agents["MDmanager"]
+    user_proxy = agents["user_proxy"]
+
+
+    #-----------------------------------------------------------------------
+    #gather_csv
+    autogen.agentchat.register_function(
+        gather_csv,
+        caller=MDfinAnalyst,
+        executor=user_proxy,
+        description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_csv,
+        caller=MDnewsAnalyst,
+        executor=user_proxy,
+        description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_csv,
+        caller=MDnrelAnalyst,
+        executor=user_proxy,
+        description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_csv,
+        caller=MDearnAnalyst,
+        executor=user_proxy,
+        description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_csv,
+        caller=MDkeyAnalyst,
+        executor=user_proxy,
+        description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
+    )
+
+
+    #-----------------------------------------------------------------------
+    #gather_price
+    autogen.agentchat.register_function(
+        gather_price,
+        caller=MDfinAnalyst,
+        executor=user_proxy,
+        description= f"Gathers the latest price for {ticker}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_price,
+        caller=MDnewsAnalyst,
+        executor=user_proxy,
+        description= f"Gathers the latest price for {ticker}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_price,
+        caller=MDnrelAnalyst,
+        executor=user_proxy,
+        description= f"Gathers the latest price for {ticker}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_price,
+        caller=MDtserAnalyst,
+        executor=user_proxy,
+        description= f"Gathers the latest price for {ticker}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_price,
+        caller=MDearnAnalyst,
+        executor=user_proxy,
+        description= f"Gathers the latest price for {ticker}",
+    )
+
+    autogen.agentchat.register_function(
+        gather_price,
+        caller=MDkeyAnalyst,
+        executor=user_proxy,
+        description= f"Gathers the latest price for {ticker}",
+    )
+
+
+    #-----------------------------------------------------------------------
+    #get_summary
+    autogen.agentchat.register_function(
+        get_summary,
+        caller=MDfinAnalyst,
+        executor=user_proxy,
+        description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
+    )
+
+    autogen.agentchat.register_function(
+        get_summary,
+        caller=MDnewsAnalyst,
+        executor=user_proxy,
+        description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
+    )
+
+    autogen.agentchat.register_function(
+        get_summary,
+        caller=MDnrelAnalyst,
+        executor=user_proxy,
+        description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
+    )
+
+    autogen.agentchat.register_function(
+        get_summary,
+        caller=MDtserAnalyst,
+        executor=user_proxy,
+        description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
+    )
+
+    autogen.agentchat.register_function(
+        get_summary,
+        caller=MDearnAnalyst,
+        executor=user_proxy,
+        description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
+    )
+
+    autogen.agentchat.register_function(
+        get_summary,
+        caller=MDkeyAnalyst,
+        executor=user_proxy,
+        description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
+    )
+
+
+    #-----------------------------------------------------------------------
+    #send_opinion
+    autogen.agentchat.register_function(
+        send_opinion,
+        caller=MDfinAnalyst,
+        executor=user_proxy,
+        description= f"Use this fuction to send your opinion to the mddebate postgres database ",
+    )
+
+    autogen.agentchat.register_function(
+        send_opinion,
+        caller=MDnewsAnalyst,
+        executor=user_proxy,
+        description= f"Use this fuction to send your opinion to the mddebate postgres database ",
+    )
+
+    autogen.agentchat.register_function(
+        send_opinion,
+        caller=MDnrelAnalyst,
+        executor=user_proxy,
+        description= f"Use this fuction to send your opinion to the mddebate postgres database ",
+    )
+
+    autogen.agentchat.register_function(
+        send_opinion,
+        caller=MDtserAnalyst,
+        executor=user_proxy,
+        description= f"Use this fuction to send your opinion to the mddebate postgres database ",
+    )
+
+    autogen.agentchat.register_function(
+        send_opinion,
+        caller=MDearnAnalyst,
+        executor=user_proxy,
+        description= f"Use this fuction to send your opinion to the mddebate postgres database ",
+    )
+
+    autogen.agentchat.register_function(
+        send_opinion,
+        caller=MDkeyAnalyst,
+        executor=user_proxy,
+        description= f"Use this fuction to send your opinion to the mddebate postgres database ",
+    )
+
+
+    #---------------------------------------------------------------------
+    #gather_timeseries
+    autogen.agentchat.register_function(
+        gather_timeseries,
+        caller=MDtserAnalyst,
+        executor=user_proxy,
+        description= f"Gather the openining price for {ticker} as timer series data.",
+    )
+
+
+    #---------------------------------------------------------------------
+    #gather_features
+    autogen.agentchat.register_function(
+        gather_features,
+        caller=MDtserAnalyst,
+        executor=user_proxy,
+        description= f"Gather the technical signals (moving averages, returns, volatility, RSI, MACD, volume, drawdown) for {ticker}.",
+    )
+
+    autogen.agentchat.register_function(
+        gather_features,
+        caller=MDfinAnalyst,
+        executor=user_proxy,
+        description= f"Gather the technical signals (moving averages, returns, volatility, RSI, MACD, volume, drawdown) for {ticker}.",
+    )
+
+
+    #---------------------------------------------------------------------
+    #get_opinions
+    autogen.agentchat.register_function(
+        get_opinions,
+        caller=MDmanager,
+        executor=user_proxy,
+        description= f"Gather the opinions about {ticker} for all 6 agents",
+    )
+
+    #---------------------------------------------------------------------
+    #insert_summary
+    autogen.agentchat.register_function(
+        insert_summary,
+        caller=MDmanager,
+        executor=user_proxy,
+        description= f"Use this fuction to send your report to the postgres database",
+    )
+
+
+    #---------------------------------------------------------------------
+    #calculate_average
+    autogen.agentchat.register_function(
+        calculate_average,
+        caller=MDmanager,
+        executor=user_proxy,
+        description= f"Use this fuction to input numbers and recieve the average number",
+    )
+
+
+#INITIALIZE CHATS
+analystConcurrency = int(os.getenv('ANALYST_CONCURRENCY', 6)) # number of analyst chats running at the same time
+
+def run_chat(proxy: autogen.UserProxyAgent, chat: dict, carryover: list = None, transcript: TranscriptWriter = None):
+    chat_id = chat["chat_id"]
+    chat = {key: value for key, value in chat.items() if key != "chat_id"}
+    if carryover:
+        chat["carryover"] = carryover
+
+    # A rerun of the same ticker and day gets the completions it already paid for from the local cache
+    if llmCache is not None:
+        chat["cache"] = llmCache
+
+    # Both sides of the chat stream their messages to the transcript as they are sent
+    if transcript is not None:
+        transcript.attach(proxy, chat_id)
+        transcript.attach(chat["recipient"], chat_id)
+
+    result = proxy.initiate_chat(**chat)
+    if transcript is not None:
+        transcript.write_chat_end(chat_id, result)
+    return result
+
+# 'code' => the decision rules run in code and write mdmemory directly (no LLM call),
+# 'narrative' => the same, plus 1 LLM call that writes the summary content, 'llm' => the MDmanager chat decides
+managerMode = os.getenv('MANAGER_MODE', 'code').lower()
+
+def make_narrator(agent: autogen.ConversableAgent, ticker: str):
+    """
+    :return: A narrator for aggregate_debate that asks the agent's LLM for the summary content in a single request.
+    """
+    def narrator(opinions: list, result: dict) -> str:
+        message = narrativeTask.format(
+            ticker=ticker,
+            decision=result["decision"],
+            positionsize=result["positionsize"],
+            votes=", ".join(f"{name}: {count}" for name, count in result["votes"].items()),
+            opinions="\n\n".join(f"{opinion['agent']} ({opinion['decision']}, positionsize {opinion['positionsize']}): {opinion['content']}"
+                                  for opinion in opinions),
+        )
+        try:
+            response = agent.client.create(messages=[
+                {"role": "system", "content": agent.system_message},
+                {"role": "user", "content": message},
+            ], cache=llmCache)
+            return agent.client.extract_text_or_completion_object(response)[0]
+        except Exception as e:
+            print(f"Narrative for {ticker} failed, storing the agents' content instead: {e}")
+            return None
+
+    return narrator
+
+def consensus_chat_result(result: dict) -> ChatResult:
+    # Stands in for the MDmanager chat in the chat history file
+    message = (f"Todays Decision: {result['decision']} (votes: {result['votes']})\n"
+               f"Agents With Todays Decision: {', '.join(result['winners'])}\n"
+               f"positionsize: {result['positionsize']}, price: {result['price']}\n\n"
+               f"{result['content']}")
+    return ChatResult(
+        chat_id=7,
+        chat_history=[{"content": message, "role": "assistant", "name": "MDmanager"}],
+        summary=message,
+        cost={"usage_including_cached_inference": {"total_cost": 0}, "usage_excluding_cached_inference": {"total_cost": 0}},
+    )
+
+def run_analyst_chat(chat: dict, user_proxy: autogen.UserProxyAgent, llm_limiter: LLMLimiter = None, transcript: TranscriptWriter = None):
+    # Every analyst chat gets its own user_proxy, so parallel chats never share conversation state
+    proxy = make_user_proxy()
+    proxy.register_function(function_map=user_proxy.function_map)
+
+    # The executor runs gather_csv with the token budget of the analyst that calls it
+    proxy.register_function(function_map={"gather_csv": gather_csv_for(chat["recipient"].name)})
+    if llm_limiter is not None:
+        llm_limiter.attach(proxy)
+    return run_chat(proxy, chat, transcript=transcript)
+
+def debate_progress(ticker: str, model: str, version: str, todaysDate) -> dict:
+    """
+    The checkpoints of a debate are its rows in the database: an analyst is done once its opinion is in mddebate,
+    the debate is done once its summary is in mdmemory.
 
-#-----------------------------------------------------------------------
-#gather_csv
-autogen.agentchat.register_function(
-    gather_csv,
-    caller=MDfinAnalyst,
-    executor=user_proxy,
-    description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
-)
-
-autogen.agentchat.register_function(
-    gather_csv,
-    caller=MDnewsAnalyst,
-    executor=user_proxy,
-    description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
-)
-
-autogen.agentchat.register_function(
-    gather_csv,
-    caller=MDnrelAnalyst,
-    executor=user_proxy,
-    description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
-)
-
-autogen.agentchat.register_function(
-    gather_csv,
-    caller=MDearnAnalyst,
-    executor=user_proxy,
-    description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
-)
-
-autogen.agentchat.register_function(
-    gather_csv,
-    caller=MDkeyAnalyst,
-    executor=user_proxy,
-    description= f"Gathers data from the different folders, the folders are {hisFolder}, {earFolder}, {esgFolder}, {finFolder}, {treFolder}, {keyFolder}, {newsFolder}",
-)
-
-
-#-----------------------------------------------------------------------
-#gather_price
-autogen.agentchat.register_function(
-    gather_price,
-    caller=MDfinAnalyst,
-    executor=user_proxy,
-    description= f"Gathers the latest price for {ticker}",
-)
-
-autogen.agentchat.register_function(
-    gather_price,
-    caller=MDnewsAnalyst,
-    executor=user_proxy,
-    description= f"Gathers the latest price for {ticker}",
-)
-
-autogen.agentchat.register_function(
-    gather_price,
-    caller=MDnrelAnalyst,
-    executor=user_proxy,
-    description= f"Gathers the latest price for {ticker}",
-)
-
-autogen.agentchat.register_function(
-    gather_price,
-    caller=MDtserAnalyst,
-    executor=user_proxy,
-    description= f"Gathers the latest price for {ticker}",
-)
-
-autogen.agentchat.register_function(
-    gather_price,
-    caller=MDearnAnalyst,
-    executor=user_proxy,
-    description= f"Gathers the latest price for {ticker}",
-)
-
-autogen.agentchat.register_function(
-    gather_price,
-    caller=MDkeyAnalyst,
-    executor=user_proxy,
-    description= f"Gathers the latest price for {ticker}",
-)
-
-
-#-----------------------------------------------------------------------
-#get_summary
-autogen.agentchat.register_function(
-    get_summary,
-    caller=MDfinAnalyst,
-    executor=user_proxy,
-    description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
-)
-
-autogen.agentchat.register_function(
-    get_summary,
-    caller=MDnewsAnalyst,
-    executor=user_proxy,
-    description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
-)
-
-autogen.agentchat.register_function(
-    get_summary,
-    caller=MDnrelAnalyst,
-    executor=user_proxy,
-    description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
-)
-
-autogen.agentchat.register_function(
-    get_summary,
-    caller=MDtserAnalyst,
-    executor=user_proxy,
-    description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
-)
-
-autogen.agentchat.register_function(
-    get_summary,
-    caller=MDearnAnalyst,
-    executor=user_proxy,
-    description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
-)
-
-autogen.agentchat.register_function(
-    get_summary,
-    caller=MDkeyAnalyst,
-    executor=user_proxy,
-    description= f"Use this funtion to get the latest report from the database, input {ticker}, {model} and {version}. This will return a dictonary, with id, date, ticker, model, version, content, position, and positionSize",
-)
-
-
-#-----------------------------------------------------------------------
-#send_opinion
-autogen.agentchat.register_function(
-    send_opinion,
-    caller=MDfinAnalyst,
-    executor=user_proxy,
-    description= f"Use this fuction to send your opinion to the mddebate postgres database ",
-)
-
-autogen.agentchat.register_function(
-    send_opinion,
-    caller=MDnewsAnalyst,
-    executor=user_proxy,
-    description= f"Use this fuction to send your opinion to the mddebate postgres database ",
-)
-
-autogen.agentchat.register_function(
-    send_opinion,
-    caller=MDnrelAnalyst,
-    executor=user_proxy,
-    description= f"Use this fuction to send your opinion to the mddebate postgres database ",
-)
-
-autogen.agentchat.register_function(
-    send_opinion,
-    caller=MDtserAnalyst,
-    executor=user_proxy,
-    description= f"Use this fuction to send your opinion to the mddebate postgres database ",
-)
-
-autogen.agentchat.register_function(
-    send_opinion,
-    caller=MDearnAnalyst,
-    executor=user_proxy,
-    description= f"Use this fuction to send your opinion to the mddebate postgres database ",
-)
-
-autogen.agentchat.register_function(
-    send_opinion,
-    caller=MDkeyAnalyst,
-    executor=user_proxy,
-    description= f"Use this fuction to send your opinion to the mddebate postgres database ",
-)
-
-
-#---------------------------------------------------------------------
-#gather_timeseries
-autogen.agentchat.register_function(
-    gather_timeseries,
-    caller=MDtserAnalyst,
-    executor=user_proxy,
-    description= f"Gather the openining price for {ticker} as timer series data.",
-)
-
-
-#---------------------------------------------------------------------
-#get_opinions
-autogen.agentchat.register_function(
-    get_opinions,
-    caller=MDmanager,
-    executor=user_proxy,
-    description= f"Gather the opinions about {ticker} for all 6 agents",
-)
-
-#---------------------------------------------------------------------
-#insert_summary
-autogen.agentchat.register_function(
-    insert_summary,
-    caller=MDmanager,
-    executor=user_proxy,
-    description= f"Use this fuction to send your report to the postgres database",
-)
-
-
-#---------------------------------------------------------------------
-#calculate_average
-autogen.agentchat.register_function(
-    calculate_average,
-    caller=MDmanager,
-    executor=user_proxy,
-    description= f"Use this fuction to input numbers and recieve the average number",
-)
-
-
-
-#INITIALIZE SEQUENCE OF CHATS
-chat_results = user_proxy.initiate_chats(  
-    [
-        {   
-            "chat_id": 1,
-            "recipient": MDfinAnalyst,
-            "message": finTask,
-            "clear_history": True,
-            "summary_method": "last_msg"
-        },
-        {   
-            "chat_id": 2,
-            "recipient": MDnewsAnalyst,
-            "message": newsTask,
-            "clear_history": True,
-            "summary_method": "last_msg"
-        },
-        {   
-            "chat_id": 3,
-            "recipient": MDnrelAnalyst,
-            "message": nrelTask,
-            "clear_history": True,
-            "summary_method": "last_msg"
-        },
-        {   
-            "chat_id": 4,
-            "recipient": MDtserAnalyst,
-            "message": tserTask,
-            "clear_history": True,
-            "summary_method": "last_msg"
-        },
-        {   
-            "chat_id": 5,
-            "recipient": MDearnAnalyst,
-            "message": earnTask,
-            "clear_history": True,
-            "summary_method": "last_msg"
-        },
-        {   
-            "chat_id": 6,
-            "recipient": MDkeyAnalyst,
-            "message": keyTask,
-            "clear_history": True,
-            "summary_method": "last_msg"
-        },
+    :return: A dictionary with the set of 'analysts' that sent an opinion, and whether the 'summary' is written.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                    (SELECT array_agg(agent) FROM mddebate WHERE date = %s AND ticker = %s AND model = %s AND version = %s),
+                    EXISTS (SELECT 1 FROM mdmemory WHERE date = %s AND ticker = %s AND model = %s AND version = %s)
+            """, (todaysDate, ticker, model, version) * 2)
+            analysts, summary = cur.fetchone()
+    return {"analysts": set(analysts or []), "summary": summary}
+
+def write_chat_history(chat_results: list, ticker: str, model: str, version: str, todaysDate, append: bool = False) -> str:
+    # The old end-of-run dump, only written with CHAT_HISTORY_FORMAT=txt or both
+    if historyFormat not in ("txt", "both"):
+        return None
+
+    # Define the directory for chat history
+    chat_history_dir = "Chat History"
+    if not os.path.exists(chat_history_dir):
+        os.makedirs(chat_history_dir)
+
+    # Construct the filename
+    filename = f"{todaysDate}_{ticker}_{model}_{version}.txt"
+    filepath = os.path.join(chat_history_dir, filename)
+
+    # Write the chat history to the file, a resumed run adds its chats to those of the earlier run
+    with open(filepath, 'a' if append else 'w') as f:
+        for i, chat_res in enumerate(chat_results):
+            f.write(f"*****{i}th chat*******:\n")
+            f.write(str(chat_res.chat_history) + "\n")
+            f.write("Conversation cost: " + str(chat_res.cost) + "\n\n")
+
+    return filepath
+
+def run_debate(ticker: str, model: str, version: str, todaysDate=None, llm_limiter: LLMLimiter = None, resume: bool = True) -> list:
+    """
+    Runs the full debate for one ticker: the six analyst chats in parallel, then the decision (see MANAGER_MODE).
+    A rerun for the same day resumes where the earlier run stopped, skipping the analysts that already sent
+    their opinion, and does nothing if the summary is already written.
+
+    :param ticker: Stock ticker of the debate.
+    :param model: The LLM model used.
+    :param version: Version of the debate structure.
+    :param todaysDate: Date of the debate, defaults to today.
+    :param llm_limiter: Optional limiter shared with other debates running at the same time.
+    :param resume: If False every stage runs again, overwriting the stored rows.
+    :return: The chat results of this run in chat_id order.
+    """
+    todaysDate = todaysDate or date.today()
+
+    # Opinions still buffered from an earlier attempt in this process count as sent
+    debate = (str(todaysDate), ticker, model, version)
+    if bufferedWriter is not None:
+        bufferedWriter.flush(debate)
+
+    done = debate_progress(ticker, model, version, todaysDate) if resume else {"analysts": set(), "summary": False}
+    if done["summary"]:
+        print(f"Debate for {ticker} {model} {version} on {todaysDate} is already complete, skipping.")
+        return []
+    if done["analysts"]:
+        print(f"Resuming {ticker} {model} {version} on {todaysDate}, skipping {', '.join(sorted(done['analysts']))}.")
+
+    agents = build_agents(ticker, model, version, todaysDate, llm_limiter)
+    messages = build_tasks(ticker, model, version, todaysDate)
+    transcript = TranscriptWriter(ticker, model, version, todaysDate) if historyFormat in ("jsonl", "both") else None
+
+    # The analysts share no state until get_opinions, so their chats run in parallel
+    analyst_chats = [
         {   
-            "chat_id": 7,
-            "recipient": MDmanager,
-            "message": sumTask,
+            "chat_id": i + 1,
+            "recipient": agents[name],
+            "message": messages[name],
             "clear_history": True,
             "summary_method": "last_msg"
-        },
-        
+        }
+        for i, name in enumerate(analystNames)
+        if name not in done["analysts"]
     ]
-)
-
-# Define the directory for chat history
-chat_history_dir = "Chat History"
-if not os.path.exists(chat_history_dir):
-    os.makedirs(chat_history_dir)
-
-# Construct the filename
-filename = f"{todaysDate}_{ticker}_{model}_{version}.txt"
-filepath = os.path.join(chat_history_dir, filename)
-
-# Write the chat history to the file
-with open(filepath, 'w') as f:
-    for i, chat_res in enumerate(chat_results):
-        f.write(f"*****{i}th chat*******:\n")
-        f.write(str(chat_res.chat_history) + "\n")
-        f.write("Conversation cost: " + str(chat_res.cost) + "\n\n")
\ No newline at end of file
+
+    manager_chat = {   
+        "chat_id": 7,
+        "recipient": agents["MDmanager"],
+        "message": messages["MDmanager"],
+        "clear_history": True,
+        "summary_method": "last_msg"
+    }
+
+    with ThreadPoolExecutor(max_workers=analystConcurrency) as pool:
+        analyst_futures = [pool.submit(run_analyst_chat, chat, agents["user_proxy"], llm_limiter, transcript) for chat in analyst_chats]
+
+        # Barrier: MDmanager only starts once every analyst has sent its opinion
+        analyst_results, failed = [], []
+        for chat, future in zip(analyst_chats, analyst_futures):
+            try:
+                analyst_results.append(future.result())
+            except Exception as e:
+                failed.append((chat["recipient"].name, e))
+
+    # The finished analysts are checkpointed by their opinions, a rerun only repeats the failed ones
+    if failed:
+        if bufferedWriter is not None:
+            bufferedWriter.flush(debate)
+        write_chat_history(analyst_results, ticker, model, version, todaysDate, append=bool(done["analysts"]))
+        names = ", ".join(name for name, _ in failed)
+        raise RuntimeError(f"{names} failed for {ticker} {model} {version} on {todaysDate}, rerun to resume.") from failed[0][1]
+
+    if managerMode == "llm":
+        # MDmanager reads the opinions with get_opinions, so in buffered mode they are committed before its chat
+        if bufferedWriter is not None:
+            bufferedWriter.flush(debate)
+        # MDmanager receives the analysts' last messages as carryover, like in a sequential initiate_chats
+        manager_result = run_chat(agents["user_proxy"], manager_chat, carryover=[result.summary for result in analyst_results],
+                                  transcript=transcript)
+    else:
+        narrator = make_narrator(agents["MDmanager"], ticker) if managerMode == "narrative" else None
+        # In buffered mode the decision is buffered with the opinions, the flush below commits the debate in one transaction
+        result = aggregate_debate(todaysDate, ticker, model, version, narrator, bufferedWriter)
+        manager_result = consensus_chat_result(result) if result else None
+        if transcript is not None and manager_result is not None:
+            transcript.write_message(7, "MDmanager", agents["user_proxy"].name, manager_result.chat_history[0])
+            transcript.write_chat_end(7, manager_result)
+
+    # Results stay in chat_id order, regardless of which analyst finished first
+    chat_results = analyst_results + ([manager_result] if manager_result is not None else [])
+
+    if bufferedWriter is not None:
+        bufferedWriter.flush(debate)
+
+    write_chat_history(chat_results, ticker, model, version, todaysDate, append=bool(done["analysts"]))
+    return chat_results
+
+if __name__ == "__main__":
+    ticker = "META" #TSLA, MSFT, NVDA, META 
+    model = "GPT3.5" #GPT3.5 , MISTRAL 
+    version = "V2"
+
+    if bufferedWriter is not None:
+        bufferedWriter.recover()
+
+    run_debate(ticker, model, version)
+
+    print(f"Data snapshot cache: {snapshotCache.stats()}")
+    print(f"gather_csv payloads: {payloadStats.stats()}")
+    if llmCache is not None:
+        print(f"LLM cache: {llmCache.stats()}")
+    if bufferedWriter is not None:
+        bufferedWriter.flush()
+        print(f"Buffered writes: {bufferedWriter.stats()}")
@@ -0,0 +1,263 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from dbPool import get_connection, close_pool
+from dataStore import load_frame
+
+load_dotenv()
+
+hisFolder = 'HistoricalData'
+tradingDays = 252
+
+# A BUY or SELL counts as a hit when the price moved the way it called, from the open it traded at to the close of
+# the hitHorizon-th trading day (the decision day is the first)
+hitHorizon = 5
+
+seriesKeys = ['ticker', 'model', 'version']
+
+# The decisions, as stored. positionsize is the number of shares held at the end of the day.
+decisionQueries = {
+    'mdmemory': """
+        SELECT date, ticker, model, version, decision::text AS decision, price, positionsize
+        FROM mdmemory
+        WHERE (%(start)s IS NULL OR date >= %(start)s) AND (%(end)s IS NULL OR date <= %(end)s)
+    """,
+    'mddebate': """
+        SELECT date, ticker, model, version, agent, decision::text AS decision, price, positionsize
+        FROM mddebate
+        WHERE (%(start)s IS NULL OR date >= %(start)s) AND (%(end)s IS NULL OR date <= %(end)s)
+    """,
+}
+
+def load_decisions(table: str = 'mdmemory', start: str = None, end: str = None) -> pd.DataFrame:
+    """
+    :param table: 'mdmemory' for the debates' decisions, 'mddebate' for every agent's opinion.
+    :return: The decisions between start and end (YYYY-MM-DD, inclusive) with a datetime 'date' and float sizes.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(decisionQueries[table], {'start': start, 'end': end})
+            columns = [column.name for column in cur.description]
+            df = pd.DataFrame(cur.fetchall(), columns=columns)
+
+    df['date'] = pd.to_datetime(df['date'])
+    df['price'] = pd.to_numeric(df['price'], errors='coerce').astype('float64')
+    df['positionsize'] = pd.to_numeric(df['positionsize'], errors='coerce').astype('float64')
+    return df
+
+def load_prices(tickers) -> pd.DataFrame:
+    """
+    :return: The open and close of every stored trading day for the tickers, as one long frame. Tickers without
+        historical data are skipped.
+    """
+    frames = []
+    for ticker in sorted(set(tickers)):
+        try:
+            df = load_frame(ticker, hisFolder, columns=['Date', 'Open', 'Close'])
+        except FileNotFoundError:
+            print(f"No historical data for {ticker}, skipping it.")
+            continue
+        frames.append(pd.DataFrame({
+            'ticker': ticker,
+            'date': pd.to_datetime(df['Date'], format='%d-%m-%Y'),
+            'open': df['Open'].astype('float64'),
+            'close': df['Close'].astype('float64'),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['ticker', 'date', 'open', 'close'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates(['ticker', 'date']).sort_values(['ticker', 'date'])
+
+def simulate(decisions: pd.DataFrame, prices: pd.DataFrame, keys: list = seriesKeys, horizon: int = hitHorizon) -> pd.DataFrame:
+    """
+    Follows the stored positionsizes of every series over the trading days, vectorized over all series at once.
+    A decision trades at the day's open, the holdings are marked at the close, and a day without a decision
+    keeps the previous holdings.
+
+    :param decisions: The decisions with the keys, 'date', 'decision' and 'positionsize'.
+    :param prices: The prices from load_prices.
+    :param keys: The columns that identify a series, add 'agent' to follow each agent's opinions.
+    :param horizon: Trading days a BUY or SELL call is scored over, see hitHorizon.
+    :return: One row per series and trading day with the shares held, the trade, the P&L, the equity, and for
+        BUY and SELL days whether the call was a hit.
+    """
+    # The series and tickers are factorized once, so the joins and groupbys below never hash the key strings again
+    decisions = decisions.dropna(subset=['positionsize'])
+    decisions = decisions.assign(series=decisions.groupby(keys, sort=False).ngroup().to_numpy())
+    decisions = decisions[decisions['series'] >= 0].drop_duplicates(['series', 'date'], keep='last')
+    series = decisions.drop_duplicates('series').set_index('series').sort_index()[keys]
+    series['first'] = decisions.groupby('series')['date'].min()
+    tickers = pd.Index(prices['ticker'].unique())
+    series['ticker_code'] = tickers.get_indexer(series['ticker'])
+    prices = prices.assign(ticker_code=tickers.get_indexer(prices['ticker']))
+
+    # Every trading day of the ticker from the series' first decision on
+    daily = series[['ticker_code', 'first']].reset_index().merge(prices[['ticker_code', 'date', 'open', 'close']], on='ticker_code')
+    daily = daily[daily['date'] >= daily['first']]
+    daily = daily.merge(decisions[['series', 'date', 'decision', 'positionsize']], on=['series', 'date'], how='left')
+    daily = daily.sort_values(['series', 'date'], ignore_index=True)
+
+    # The days of a series are consecutive rows, so a shift within the series is a shift of the arrays that
+    # starts over at each series' first day
+    codes = daily['series'].to_numpy()
+    first_day = np.r_[True, codes[1:] != codes[:-1]][:len(codes)]
+    starts = np.flatnonzero(first_day)
+    lengths = np.diff(np.r_[starts, len(codes)])
+
+    shares = daily.groupby('series')['positionsize'].ffill().fillna(0.0).to_numpy()
+    open_price = daily['open'].to_numpy()
+    close = daily['close'].to_numpy()
+    previous_shares = np.where(first_day, 0.0, np.roll(shares, 1))
+    previous_close = np.where(first_day, close, np.roll(close, 1))
+    trade = shares - previous_shares
+
+    # Yesterday's holdings move close to close, today's trade moves from the open it was made at to the close
+    pnl = previous_shares * (close - previous_close) + trade * (close - open_price)
+
+    # Returns are measured on the largest amount the series ever had invested
+    capital = np.maximum.reduceat(np.abs(shares) * open_price, starts) if len(codes) else np.array([])
+    capital = np.repeat(np.where(capital > 0, capital, 1.0), lengths)
+    cumulative = np.cumsum(pnl)
+    equity = capital + cumulative - np.repeat(cumulative[starts] - pnl[starts], lengths)
+
+    # BUY and SELL are scored against the close of the horizon-th day of the same series
+    future_index = np.arange(len(codes)) + horizon - 1
+    in_series = future_index < len(codes)
+    in_series[in_series] = codes[future_index[in_series]] == codes[in_series]
+    future = np.where(in_series, close[np.minimum(future_index, len(codes) - 1)], np.nan)
+    called = daily['decision'].isin(['BUY', 'SELL']).to_numpy() & in_series
+    hit = np.where(daily['decision'].to_numpy() == 'BUY', future > open_price, future < open_price)
+
+    daily = daily.drop(columns=['ticker_code', 'first'])
+    for key in keys:
+        daily[key] = series[key].to_numpy()[codes]
+    daily['shares'] = shares
+    daily['trade'] = trade
+    daily['pnl'] = pnl
+    daily['capital'] = capital
+    daily['equity'] = equity
+    daily['return'] = pnl / capital
+    daily['called'] = called
+    daily['hit'] = np.where(called, hit, np.nan)
+    return daily[keys + [column for column in daily.columns if column not in keys]]
+
+def summarize(daily: pd.DataFrame, keys: list = seriesKeys) -> pd.DataFrame:
+    """
+    :return: Per series: the days, trades, total P&L, return on capital, annualized Sharpe, the max drawdown
+        and the hit rate of its BUY and SELL calls.
+    """
+    daily = daily.assign(
+        traded=daily['trade'] != 0,
+        drawdown=daily['equity'] / daily.groupby('series', sort=False)['equity'].cummax() - 1,
+    )
+    summary = daily.groupby('series').agg(
+        start=('date', 'min'),
+        end=('date', 'max'),
+        days=('date', 'size'),
+        trades=('traded', 'sum'),
+        pnl=('pnl', 'sum'),
+        capital=('capital', 'first'),
+        mean_return=('return', 'mean'),
+        std_return=('return', 'std'),
+        max_drawdown=('drawdown', 'min'),
+        calls=('called', 'sum'),
+        hits=('hit', 'sum'),
+    )
+    summary = series_keys(daily, keys).join(summary).reset_index(drop=True)
+
+    summary['total_return'] = summary['pnl'] / summary['capital']
+    summary['sharpe'] = (summary['mean_return'] / summary['std_return'] * np.sqrt(tradingDays)).where(summary['std_return'] > 0)
+    summary['hit_rate'] = (summary['hits'] / summary['calls']).where(summary['calls'] > 0)
+    return summary.drop(columns=['mean_return', 'std_return']).sort_values(keys, ignore_index=True)
+
+def series_keys(daily: pd.DataFrame, keys: list) -> pd.DataFrame:
+    # The keys of each series, indexed by its code
+    return daily.loc[~daily['series'].duplicated(), ['series'] + keys].set_index('series').sort_index()
+
+def agent_attribution(opinion_daily: pd.DataFrame, debate_daily: pd.DataFrame, opinion_summary: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per agent: how often its opinion was the debate's decision, and how its own opinions would have done.
+
+    :param opinion_daily: simulate of the agents' opinions.
+    :param debate_daily: simulate of the debates' decisions.
+    :param opinion_summary: summarize of opinion_daily.
+    """
+    # Each agent series is matched to its debate series on the keys once, the days are then joined on the codes
+    pairs = series_keys(opinion_daily, seriesKeys + ['agent']).reset_index().merge(
+        series_keys(debate_daily, seriesKeys).reset_index(), on=seriesKeys, suffixes=('', '_debate'))
+    opinion_days = opinion_daily.loc[opinion_daily['decision'].notna(), ['series', 'date', 'decision']]
+    debate_days = debate_daily.loc[debate_daily['decision'].notna(), ['series', 'date', 'decision']].rename(
+        columns={'series': 'series_debate', 'decision': 'decision_debate'})
+    matched = opinion_days.merge(pairs[['series', 'series_debate']], on='series').merge(debate_days, on=['series_debate', 'date'])
+
+    per_series = (matched.assign(agreed=matched['decision'] == matched['decision_debate'])
+                  .groupby('series').agg(opinions=('agreed', 'size'), agreed=('agreed', 'sum')))
+    agreement = pairs.set_index('series')[['agent']].join(per_series, how='inner').groupby('agent').sum()
+    agreement['agreement'] = agreement.pop('agreed') / agreement['opinions']
+
+    per_agent = opinion_summary.groupby('agent').agg(
+        pnl=('pnl', 'sum'),
+        capital=('capital', 'sum'),
+        sharpe=('sharpe', 'median'),
+        max_drawdown=('max_drawdown', 'min'),
+        calls=('calls', 'sum'),
+        hits=('hits', 'sum'),
+    )
+    per_agent['total_return'] = per_agent['pnl'] / per_agent['capital']
+    per_agent['hit_rate'] = (per_agent['hits'] / per_agent['calls']).where(per_agent['calls'] > 0)
+    return agreement.join(per_agent, how='outer').reset_index()
+
+def backtest(start: str = None, end: str = None, agents: bool = True, horizon: int = hitHorizon,
+             decisions: pd.DataFrame = None, opinions: pd.DataFrame = None, prices: pd.DataFrame = None) -> dict:
+    """
+    Backtests the debates' decisions in mdmemory, and each agent's opinions in mddebate, against HistoricalData.
+
+    :param start: First date (YYYY-MM-DD), inclusive.
+    :param end: Last date (YYYY-MM-DD), inclusive.
+    :param agents: Whether to backtest every agent's opinions as well.
+    :param horizon: Trading days a BUY or SELL call is scored over for the hit rate.
+    :param decisions: The mdmemory decisions, loaded from the database if None.
+    :param opinions: The mddebate opinions, loaded from the database if None.
+    :param prices: The prices, loaded from HistoricalData if None.
+    :return: A dictionary with the 'daily' equity curves and the 'summary' per ticker, model and version, and
+        with agents the 'opinions' summary per agent series and the agents' 'attribution'. Empty if there is nothing to backtest.
+    """
+    decisions = load_decisions('mdmemory', start, end) if decisions is None else decisions
+    opinions = (load_decisions('mddebate', start, end) if opinions is None else opinions) if agents else None
+    if prices is None:
+        tickers = set(decisions['ticker']) | (set(opinions['ticker']) if agents else set())
+        prices = load_prices(tickers)
+    if end is not None:
+        prices = prices[prices['date'] <= pd.Timestamp(end)]
+    if decisions.empty or prices.empty:
+        print("No decisions with historical prices to backtest.")
+        return {}
+
+    daily = simulate(decisions, prices, horizon=horizon)
+    result = {'daily': daily, 'summary': summarize(daily)}
+
+    if agents and not opinions.empty:
+        keys = seriesKeys + ['agent']
+        opinion_daily = simulate(opinions, prices, keys, horizon)
+        opinion_summary = summarize(opinion_daily, keys)
+        result['opinions'] = opinion_summary
+        result['attribution'] = agent_attribution(opinion_daily, daily, opinion_summary)
+    return result
+
+if __name__ == "__main__":
+    # python backtest.py [START] [END] => backtests the stored decisions, e.g. python backtest.py 2024-01-01 2024-12-31
+    start = sys.argv[1] if len(sys.argv) > 1 else None
+    end = sys.argv[2] if len(sys.argv) > 2 else None
+
+    began = time.perf_counter()
+    result = backtest(start, end)
+    elapsed = time.perf_counter() - began
+
+    if result:
+        print(result['summary'].to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+        if 'attribution' in result:
+            print()
+            print(result['attribution'].to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+        print(f"\nBacktested {len(result['summary'])} series, {len(result['daily'])} series-days in {elapsed:.2f}s")
+    close_pool()
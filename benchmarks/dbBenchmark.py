@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Run as python benchmarks/dbBenchmark.py, the modules are in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dbPool import get_connection, close_pool
+from postgresSetup import create_tables, migrate
+from consensus import backfill_consensus
+
+load_dotenv()
+
+# The benchmark runs in its own schema, so the real mdmemory and mddebate tables are never touched
+benchSchema = 'mdbench'
+
+tickers = ['TSLA', 'MSFT', 'NVDA', 'META']
+models = ['GPT3.5', 'MISTRAL']
+versions = ['V1', 'V2']
+agents = ['MDfinAnalyst', 'MDnewsAnalyst', 'MDnrelAnalyst', 'MDtserAnalyst', 'MDearnAnalyst', 'MDkeyAnalyst']
+
+# Same queries as get_summary and get_opinions in MDInit.py
+summaryQuery = """
+    SELECT * FROM mdmemory
+    WHERE ticker = %s AND model = %s AND version = %s
+    ORDER BY date DESC
+    LIMIT 1
+"""
+
+opinionsQuery = """
+    SELECT date, ticker, agent, model, content, decision, price, position, positionsize
+    FROM mddebate
+    WHERE date = %s AND ticker = %s AND model = %s
+    ORDER BY id DESC
+"""
+
+def seed(cur, years: int):
+    """
+    Fills mdmemory and mddebate with one row per day for every ticker, model, version (and agent).
+    """
+    cur.execute("""
+        INSERT INTO mdmemory (date, ticker, model, version, content, decision, price, position, positionsize)
+        SELECT day::date, ticker, model, version, 'synthetic summary',
+            (ARRAY['BUY', 'SELL', 'HOLD'])[1 + floor(random() * 3)::int]::trade_decision, (100 + random() * 50)::numeric(10, 2),
+            random() > 0.5, floor(random() * 100)
+        FROM generate_series(current_date - make_interval(years => %s), current_date, interval '1 day') AS day,
+            unnest(%s) AS ticker, unnest(%s) AS model, unnest(%s) AS version
+    """, (years, tickers, models, versions))
+
+    cur.execute("""
+        INSERT INTO mddebate (key, date, ticker, agent, model, version, content, decision, price, position, positionsize)
+        SELECT 1, day::date, ticker, agent, model, version, 'synthetic opinion',
+            (ARRAY['BUY', 'SELL', 'HOLD'])[1 + floor(random() * 3)::int]::trade_decision, (100 + random() * 50)::numeric(10, 2),
+            random() > 0.5, floor(random() * 100)
+        FROM generate_series(current_date - make_interval(years => %s), current_date, interval '1 day') AS day,
+            unnest(%s) AS ticker, unnest(%s) AS agent, unnest(%s) AS model, unnest(%s) AS version
+    """, (years, tickers, agents, models, versions))
+    cur.execute("ANALYZE mdmemory")
+    cur.execute("ANALYZE mddebate")
+
+def time_queries(cur, repeats: int = 200) -> dict:
+    """
+    :return: The mean latency in milliseconds of the get_summary and get_opinions queries.
+    """
+    cur.execute("SELECT min(date), max(date) FROM mddebate")
+    first_day, last_day = cur.fetchone()
+    middle_day = first_day + (last_day - first_day) / 2
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        cur.execute(summaryQuery, (tickers[i % len(tickers)], models[i % len(models)], versions[i % len(versions)]))
+        cur.fetchall()
+    summary_ms = (time.perf_counter() - start) / repeats * 1000
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        cur.execute(opinionsQuery, (middle_day, tickers[i % len(tickers)], models[i % len(models)]))
+        cur.fetchall()
+    opinions_ms = (time.perf_counter() - start) / repeats * 1000
+
+    return {'get_summary': summary_ms, 'get_opinions': opinions_ms}
+
+if __name__ == "__main__":
+    # python benchmarks/dbBenchmark.py 5 => seeds 5 years of synthetic rows (default 3)
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    with get_connection() as con:
+        with con.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {benchSchema} CASCADE")
+            cur.execute(f"CREATE SCHEMA {benchSchema}")
+            cur.execute(f"SET search_path TO {benchSchema}")
+            try:
+                create_tables(cur)
+                seed(cur, years)
+                cur.execute("SELECT (SELECT count(*) FROM mdmemory), (SELECT count(*) FROM mddebate)")
+                print("Seeded %s mdmemory rows and %s mddebate rows" % cur.fetchone())
+
+                before = time_queries(cur)
+                migrate(cur)
+                cur.execute("ANALYZE mdmemory")
+                cur.execute("ANALYZE mddebate")
+                after = time_queries(cur)
+
+                for query in before:
+                    print(f"{query}: {before[query]:.3f} ms without indexes, {after[query]:.3f} ms with indexes")
+
+                start = time.perf_counter()
+                rows = backfill_consensus(cur, 'mdconsensus')
+                print(f"consensus backfill: {rows} day-ticker groups in {time.perf_counter() - start:.2f}s")
+            finally:
+                cur.execute(f"DROP SCHEMA IF EXISTS {benchSchema} CASCADE")
+                cur.execute("SET search_path TO DEFAULT")
+
+    close_pool()
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+# Run as python benchmarks/historyBenchmark.py, the modules are in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from historyParser import parse_reports
+
+agents = ['MDfinAnalyst', 'MDnewsAnalyst', 'MDnrelAnalyst', 'MDtserAnalyst', 'MDearnAnalyst', 'MDkeyAnalyst']
+
+def legacy_reports(content: str) -> list:
+    """
+    The string scanning displayHistory.py used before historyParser.py, kept as the baseline.
+    """
+    cleaned_content = ""
+    while "'tool_calls': [{" in content:
+        start_index = content.find("'tool_calls': [{")
+        pre_text = content[:start_index]
+        content = content[start_index:]
+        end_index = content.find("}]") + 2
+        cleaned_content += pre_text
+        content = content[end_index:]
+    cleaned_content += content
+    cleaned_content = cleaned_content.replace("\\n", "\n")
+
+    start_indicator = "'content': \"###"
+    reports = []
+    for report in cleaned_content.split(start_indicator)[1:]:
+        end_of_report = report.find("'content':")
+        if end_of_report != -1:
+            report = report[:end_of_report]
+        reports.append(start_indicator + report.strip("\""))
+    return reports
+
+def synthetic_chat(rng: random.Random, agent: str, rows: int) -> list:
+    """
+    One analyst chat shaped like the stored histories: the task, tool calls with nested JSON arguments,
+    a large gather_csv response, the report and its send_opinion call.
+    """
+    decision = rng.choice(['BUY', 'SELL', 'HOLD'])
+    data = [{"Open": round(rng.uniform(100, 900), 4), "Close": round(rng.uniform(100, 900), 4),
+             "Volume": rng.randint(10 ** 6, 10 ** 8), "Date": f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2024"}
+            for _ in range(rows)]
+    report = (f"### Last trading days position: True\n### Today's Opening Price: {data[-1]['Open']}\n\n"
+              f"### Insights: {agent} expects the stock to move, 'quoted' and [bracketed] {{text}} included.\n"
+              f"### Decision: {decision}\n### End-of-Day Position Size: 100")
+
+    def call(name, arguments):
+        return {'id': f"call_{rng.getrandbits(48):x}", 'function': {'arguments': json.dumps(arguments), 'name': name}, 'type': 'function'}
+
+    return [
+        {'content': f"Perform the following task list for {agent}:\n(1) ...", 'role': 'assistant'},
+        {'tool_calls': [call('get_summary', {'ticker': 'TSLA', 'model': 'GPT3.5', 'version': 'V2'})], 'content': None, 'role': 'assistant'},
+        {'content': '{"id": 1, "content": "[previous] {summary}"}', 'tool_responses': [{'tool_call_id': 'call_1', 'role': 'tool', 'content': '{"id": 1}'}], 'role': 'tool'},
+        {'tool_calls': [call('gather_csv', {'ticker': 'TSLA', 'folder': 'HistoricalData'})], 'content': None, 'role': 'assistant'},
+        {'content': json.dumps(data), 'tool_responses': [{'tool_call_id': 'call_2', 'role': 'tool', 'content': json.dumps(data)}], 'role': 'tool'},
+        {'content': report, 'tool_calls': [call('send_opinion', {
+            'key': 1, 'date': '2024-04-04', 'ticker': 'TSLA', 'agent': agent, 'model': 'GPT3.5', 'version': 'V2',
+            'content': 'Insights: {nested} [brackets]', 'decision': decision, 'price': data[-1]['Open'], 'position': True, 'positionsize': 100,
+        })], 'role': 'assistant'},
+        {'content': 'true', 'tool_responses': [{'tool_call_id': 'call_3', 'role': 'tool', 'content': 'true'}], 'role': 'tool'},
+        {'content': 'TERMINATE', 'role': 'user'},
+    ]
+
+def write_synthetic_history(filepath: str, megabytes: float, seed: int = 0) -> int:
+    """
+    Writes a history in the .txt format of write_chat_history until the file reaches the given size.
+
+    :return: The number of chats written.
+    """
+    rng = random.Random(seed)
+    chats = 0
+    with open(filepath, 'w') as f:
+        while f.tell() < megabytes * 1024 * 1024:
+            f.write(f"*****{chats}th chat*******:\n")
+            f.write(str(synthetic_chat(rng, agents[chats % len(agents)], rows=300)) + "\n")
+            f.write("Conversation cost: " + str({'total_cost': 0}) + "\n\n")
+            chats += 1
+    return chats
+
+def time_parsers(filepath: str) -> dict:
+    """
+    :return: The seconds the legacy scan and parse_reports take for the file, and the reports each found.
+    """
+    start = time.perf_counter()
+    with open(filepath) as f:
+        legacy = legacy_reports(f.read())
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reports = list(parse_reports(filepath))
+    parser_seconds = time.perf_counter() - start
+
+    return {'legacy': legacy_seconds, 'parser': parser_seconds, 'legacy_reports': len(legacy), 'reports': len(reports)}
+
+if __name__ == "__main__":
+    # python benchmarks/historyBenchmark.py 1 4 16 => synthetic histories of 1, 4 and 16 MB (default 1, 4 and 8).
+    # The old scan is quadratic: about even at 1 MB, 2.5x at 4 MB, 4x at 8 MB and 25x at 32 MB
+    sizes = [float(size) for size in sys.argv[1:]] or [1, 4, 8]
+
+    with tempfile.TemporaryDirectory() as folder:
+        for megabytes in sizes:
+            filepath = os.path.join(folder, f"2024-04-04_TSLA_GPT3.5_V{megabytes:g}.txt")
+            chats = write_synthetic_history(filepath, megabytes)
+            result = time_parsers(filepath)
+            print(f"{megabytes:g} MB, {chats} chats: legacy {result['legacy']:.3f}s ({result['legacy_reports']} reports), "
+                  f"parser {result['parser']:.3f}s ({result['reports']} reports), "
+                  f"{result['legacy'] / result['parser']:.1f}x")
@@ -0,0 +1,227 @@
+import sys
+import time
+from collections import Counter
+import statistics
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictCursor
+from dbPool import get_connection, close_pool
+
+load_dotenv()
+
+# The DECISION RULES of sumTask in MDInit.py, applied in code instead of by the MDmanager agent
+decisions = ('BUY', 'SELL', 'HOLD')
+tieDecision = 'HOLD'
+
+# Today's stored opinions and the previous trading day's positionsize
+opinionsQuery = """
+    SELECT agent, content, decision::text AS decision, price, positionsize
+    FROM mddebate
+    WHERE date = %s AND ticker = %s AND model = %s AND version = %s
+    ORDER BY agent
+"""
+
+previousQuery = """
+    SELECT positionsize FROM mdmemory
+    WHERE ticker = %s AND model = %s AND version = %s AND date < %s
+    ORDER BY date DESC
+    LIMIT 1
+"""
+
+summaryUpsert = """
+    INSERT INTO mdmemory (date, ticker, model, version, content, decision, price, position, positionsize)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (ticker, model, version, date) DO UPDATE SET
+        content = EXCLUDED.content, decision = EXCLUDED.decision, price = EXCLUDED.price,
+        position = EXCLUDED.position, positionsize = EXCLUDED.positionsize
+"""
+
+def decide(opinions: list, previous_positionsize: float = 0.0) -> dict:
+    """
+    Applies the DECISION RULES to the analysts' opinions. The decision with the most votes wins, a tie for the
+    most votes (2x2x2, 3x3x0) is HOLD. The positionsize is the average positionsize of the agents that picked the
+    winning decision, or the previous trading day's positionsize (0 if there is none) when the decision is HOLD.
+
+    :param opinions: The opinions as returned by get_opinions, with 'agent', 'decision', 'price' and 'positionsize'.
+    :param previous_positionsize: The positionsize of the previous trading day.
+    :return: A dictionary with the 'decision', 'positionsize', 'position', 'price', the 'votes' per decision and the 'winners'.
+    """
+    votes = Counter(opinion['decision'] for opinion in opinions if opinion['decision'] in decisions)
+    ranking = votes.most_common()
+    if not ranking or (len(ranking) > 1 and ranking[0][1] == ranking[1][1]):
+        decision = tieDecision
+    else:
+        decision = ranking[0][0]
+
+    winners = [opinion for opinion in opinions if opinion['decision'] == decision]
+    sizes = [float(opinion['positionsize']) for opinion in winners if opinion['positionsize'] is not None]
+    if decision == 'HOLD' or not sizes:
+        positionsize = float(previous_positionsize or 0)
+    else:
+        positionsize = sum(sizes) / len(sizes)
+
+    # Every agent reads the same opening price with gather_price, the median ignores a single misread
+    prices = [float(opinion['price']) for opinion in opinions if opinion['price'] is not None]
+
+    return {
+        'decision': decision,
+        'positionsize': positionsize,
+        'position': positionsize > 0,
+        'price': statistics.median(prices) if prices else None,
+        'votes': {name: votes.get(name, 0) for name in decisions},
+        'winners': [opinion['agent'] for opinion in winners],
+    }
+
+def consensus_content(opinions: list) -> str:
+    # Each agent's content, formatted like 'MDfinAnalyst:', 'MDnewsAnalyst:', etc. as the MDmanager summary was
+    return "\n\n".join(f"{opinion['agent']}: {opinion['content']}" for opinion in opinions)
+
+def aggregate_debate(todaysDate, ticker: str, model: str, version: str, narrator=None, writer=None) -> dict:
+    """
+    Decides today's trade from the opinions in mddebate and writes it to mdmemory, without any LLM call.
+    Reading the opinions takes one connection, writing the summary one query.
+
+    :param todaysDate: Date of the debate.
+    :param ticker: Stock ticker.
+    :param model: The LLM model used.
+    :param version: Version of the debate structure.
+    :param narrator: Optional function (opinions, result) -> str that writes the summary content, e.g. with an LLM.
+        The decision and positionsize are never changed by it.
+    :param writer: A dbWriter.BufferedWriter (DB_WRITE_MODE=buffered). Its opinions of the debate that aren't
+        committed yet are counted, and the summary is buffered with them, so the debate is committed in one transaction.
+    :return: The result of decide with the 'content' written, or an empty dictionary if there are no opinions.
+    """
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(opinionsQuery, (todaysDate, ticker, model, version))
+            opinions = cur.fetchall()
+            cur.execute(previousQuery, (ticker, model, version, todaysDate))
+            previous = cur.fetchone()
+
+    if writer is not None:
+        # The buffered opinion of an agent replaces its stored one, like the upsert of the flush will
+        buffered = {row['agent']: row for row in writer.pending((str(todaysDate), ticker, model, version), 'mddebate')}
+        opinions = sorted([opinion for opinion in opinions if opinion['agent'] not in buffered] + list(buffered.values()),
+                          key=lambda opinion: opinion['agent'])
+
+    if not opinions:
+        print(f"No opinions found for {ticker} {model} {version} on {todaysDate}.")
+        return {}
+
+    result = decide(opinions, previous['positionsize'] if previous else None)
+    content = consensus_content(opinions)
+    if narrator is not None:
+        content = narrator(opinions, result) or content
+    result['content'] = content
+
+    if writer is not None:
+        writer.add('mdmemory', {
+            'date': str(todaysDate), 'ticker': ticker, 'model': model, 'version': version, 'content': content,
+            'decision': result['decision'], 'price': result['price'], 'position': result['position'],
+            'positionsize': result['positionsize'],
+        })
+        return result
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(summaryUpsert, (todaysDate, ticker, model, version, content, result['decision'], result['price'],
+                                        result['position'], result['positionsize']))
+    return result
+
+# BATCH BACKFILL
+# The same DECISION RULES as decide, for every (date, ticker, model, version) in mddebate in one set-based query.
+# A HOLD carries the positionsize of the last BUY or SELL day forward, or the mdmemory positionsize from before
+# the first debate day (0 if there is none).
+consensusQuery = """
+    WITH votes AS (
+        SELECT date, ticker, model, version,
+            count(*) FILTER (WHERE decision = 'BUY') AS buy_votes,
+            count(*) FILTER (WHERE decision = 'SELL') AS sell_votes,
+            count(*) FILTER (WHERE decision = 'HOLD') AS hold_votes,
+            avg(positionsize) FILTER (WHERE decision = 'BUY') AS buy_size,
+            avg(positionsize) FILTER (WHERE decision = 'SELL') AS sell_size,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY price)::numeric AS price,
+            string_agg(agent || ': ' || content, E'\\n\\n' ORDER BY agent) AS content
+        FROM mddebate
+        WHERE (%(start)s::date IS NULL OR date >= %(start)s::date) AND (%(end)s::date IS NULL OR date <= %(end)s::date)
+        GROUP BY date, ticker, model, version
+    ),
+    decided AS (
+        -- A tie for the most votes falls through to HOLD
+        SELECT *,
+            CASE
+                WHEN buy_votes > sell_votes AND buy_votes > hold_votes THEN 'BUY'
+                WHEN sell_votes > buy_votes AND sell_votes > hold_votes THEN 'SELL'
+                ELSE 'HOLD'
+            END AS decision
+        FROM votes
+    ),
+    runs AS (
+        -- Every BUY or SELL day starts a new run, the HOLD days after it keep its positionsize
+        SELECT *,
+            CASE decision WHEN 'BUY' THEN buy_size WHEN 'SELL' THEN sell_size END AS winner_size,
+            count(CASE decision WHEN 'BUY' THEN buy_size WHEN 'SELL' THEN sell_size END)
+                OVER (PARTITION BY ticker, model, version ORDER BY date) AS run,
+            min(date) OVER (PARTITION BY ticker, model, version) AS first_date
+        FROM decided
+    ),
+    consensus AS (
+        SELECT r.date, r.ticker, r.model, r.version, r.content, r.decision, r.price, r.buy_votes, r.sell_votes, r.hold_votes,
+            CASE WHEN r.run = 0 THEN COALESCE(
+                (SELECT m.positionsize FROM mdmemory m
+                 WHERE m.ticker = r.ticker AND m.model = r.model AND m.version = r.version AND m.date < r.first_date
+                 ORDER BY m.date DESC
+                 LIMIT 1), 0)
+            ELSE first_value(r.winner_size) OVER (PARTITION BY r.ticker, r.model, r.version, r.run ORDER BY r.date)
+            END AS positionsize
+        FROM runs r
+    )
+"""
+
+backfillTargets = {
+    # Re-derived rows replace the previous ones in the shadow table
+    'mdconsensus': """
+        INSERT INTO mdconsensus (date, ticker, model, version, content, decision, price, position, positionsize, buy_votes, sell_votes, hold_votes)
+        SELECT date, ticker, model, version, content, decision::trade_decision, price, positionsize > 0, positionsize, buy_votes, sell_votes, hold_votes
+        FROM consensus
+        ON CONFLICT (ticker, model, version, date) DO UPDATE SET
+            content = EXCLUDED.content, decision = EXCLUDED.decision, price = EXCLUDED.price, position = EXCLUDED.position,
+            positionsize = EXCLUDED.positionsize, buy_votes = EXCLUDED.buy_votes, sell_votes = EXCLUDED.sell_votes,
+            hold_votes = EXCLUDED.hold_votes
+    """,
+    # Existing mdmemory rows keep their content (the summary narrative), only the decision is re-derived
+    'mdmemory': """
+        INSERT INTO mdmemory (date, ticker, model, version, content, decision, price, position, positionsize)
+        SELECT date, ticker, model, version, content, decision::trade_decision, price, positionsize > 0, positionsize
+        FROM consensus
+        ON CONFLICT (ticker, model, version, date) DO UPDATE SET
+            decision = EXCLUDED.decision, price = EXCLUDED.price, position = EXCLUDED.position, positionsize = EXCLUDED.positionsize
+    """,
+}
+
+def backfill_consensus(cur, target: str = 'mdconsensus', start=None, end=None) -> int:
+    """
+    Re-derives the final decision of every debate in mddebate, e.g. after changing the tie rule, in a single statement.
+
+    :param cur: A database cursor, the caller commits.
+    :param target: 'mdconsensus' (the shadow table) or 'mdmemory'.
+    :param start: Optional first date to re-derive, as YYYY-MM-DD.
+    :param end: Optional last date to re-derive, as YYYY-MM-DD.
+    :return: The number of (date, ticker, model, version) rows written.
+    """
+    if target not in backfillTargets:
+        raise ValueError(f"Unknown backfill target {target}, use one of {', '.join(backfillTargets)}.")
+    cur.execute(consensusQuery + backfillTargets[target], {'start': start, 'end': end})
+    return cur.rowcount
+
+if __name__ == "__main__":
+    # python consensus.py [mdconsensus|mdmemory] [START] [END] => re-derives the decisions, into the shadow table by default
+    target = sys.argv[1] if len(sys.argv) > 1 else 'mdconsensus'
+    start = sys.argv[2] if len(sys.argv) > 2 else None
+    end = sys.argv[3] if len(sys.argv) > 3 else None
+
+    begin = time.perf_counter()
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            rows = backfill_consensus(cur, target, start, end)
+    print(f"Wrote {rows} decisions to {target} in {time.perf_counter() - begin:.2f}s")
+    close_pool()
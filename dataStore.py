@@ -0,0 +1,237 @@
+import os
+import glob
+import json
+import threading
+from datetime import date
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'csv' => one CSV per folder and ticker (default), 'parquet' => typed columnar datasets, 'both' => writes both
+dataBackend = os.getenv('DATA_BACKEND', 'csv').lower()
+storeFolder = 'DataStore'
+
+# Maps each data folder to its CSV filename suffix and its dataset name in the columnar store
+csvSuffixes = {
+    'HistoricalData': 'Historical',
+    'EarningsData': 'Earnings',
+    'ESGScores': 'ESGscore',
+    'Financial Analytics Metrics': 'Financials',
+    'Trend Indicator Scores': 'TrendScores',
+    'Key Statistics': 'KeyStatistics',
+    'News': 'News',
+}
+
+datasetNames = {
+    'HistoricalData': 'historical',
+    'EarningsData': 'earnings',
+    'ESGScores': 'esg',
+    'Financial Analytics Metrics': 'finance',
+    'Trend Indicator Scores': 'trend',
+    'Key Statistics': 'keystats',
+    'News': 'news',
+}
+
+# Columns stored as dates, all in the '%d-%m-%Y' format written by InitMemory.py
+dateColumns = ['Date', 'Publishing Date']
+
+fmtSuffixes = {'k': 1e3, 'M': 1e6, 'B': 1e9, 'T': 1e12}
+
+def csv_path(ticker: str, folder: str) -> str:
+    suffix = csvSuffixes.get(folder)
+    filename = f"{ticker}_{suffix}.csv" if suffix else f"{ticker}.csv"
+    return os.path.join(folder, filename)
+
+def dataset_path(folder: str) -> str:
+    return os.path.join(storeFolder, datasetNames.get(folder, folder))
+
+def parse_fmt(value):
+    """
+    Parses a Yahoo 'fmt' string such as '1.23B', '12.50%' or '1,234.5' into a number.
+
+    :param value: The value to parse.
+    :return: The number, or the value unchanged if it is not a formatted number.
+    """
+    if not isinstance(value, str):
+        return value
+
+    text = value.strip().replace(',', '')
+    try:
+        if text.endswith('%'):
+            return float(text[:-1]) / 100
+        if text[-1:] in fmtSuffixes:
+            return float(text[:-1]) * fmtSuffixes[text[-1]]
+        return float(text)
+    except ValueError:
+        return value
+
+def typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the string columns of a dataframe to typed columns, so readers never reparse the 'fmt' strings.
+    A column is only converted if every value in it parses.
+
+    :param df: The dataframe as written to CSV by InitMemory.py.
+    :return: A copy with date and numeric columns typed.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype != object and not pd.api.types.is_string_dtype(df[column]):
+            continue
+
+        if column in dateColumns:
+            dates = pd.to_datetime(df[column], format='%d-%m-%Y', errors='coerce')
+            if dates.notna().sum() == df[column].notna().sum():
+                df[column] = dates
+            continue
+
+        parsed = df[column].map(parse_fmt)
+        if all(isinstance(value, float) for value in parsed.dropna()):
+            df[column] = parsed.astype('float64')
+    return df
+
+def write_parquet(df: pd.DataFrame, folder: str, ticker: str, snapshot: str = None) -> str:
+    """
+    Writes a dataframe into the columnar dataset of its folder, partitioned by ticker and snapshot date.
+
+    :param df: The dataframe to store.
+    :param folder: The data folder the dataframe belongs to, e.g. 'HistoricalData'.
+    :param ticker: The stock ticker.
+    :param snapshot: The snapshot date as YYYY-MM-DD, defaults to today.
+    :return: The path of the written file.
+    """
+    snapshot = snapshot or date.today().isoformat()
+    partition = os.path.join(dataset_path(folder), f"ticker={ticker}", f"date={snapshot}")
+    if not os.path.exists(partition):
+        os.makedirs(partition)
+
+    filepath = os.path.join(partition, 'part-0.parquet')
+    typed_frame(df).to_parquet(filepath, index=False)
+    return filepath
+
+def latest_partition(ticker: str, folder: str) -> str:
+    partitions = sorted(glob.glob(os.path.join(dataset_path(folder), f"ticker={ticker}", "date=*")))
+    if not partitions:
+        raise FileNotFoundError(f"No {datasetNames.get(folder, folder)} data stored for {ticker}.")
+    return os.path.join(partitions[-1], 'part-0.parquet')
+
+def source_path(ticker: str, folder: str, backend: str = None) -> str:
+    """
+    :return: The file load_frame reads for a ticker and folder. Raises FileNotFoundError if nothing is stored.
+    """
+    backend = backend or dataBackend
+    if backend == 'csv':
+        filepath = csv_path(ticker, folder)
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"File {filepath} not found.")
+        return filepath
+    return latest_partition(ticker, folder)
+
+def load_frame(ticker: str, folder: str, columns: list = None, backend: str = None) -> pd.DataFrame:
+    """
+    Loads the newest data for a ticker from the selected backend, reading only the requested columns.
+
+    :param ticker: The stock ticker.
+    :param folder: The data folder, e.g. 'HistoricalData'.
+    :param columns: The columns to load, None loads every column.
+    :param backend: 'csv' or 'parquet', defaults to the DATA_BACKEND setting ('both' reads parquet).
+    :return: The dataframe. Raises FileNotFoundError if nothing is stored.
+    """
+    backend = backend or dataBackend
+    if backend == 'csv':
+        return pd.read_csv(csv_path(ticker, folder), usecols=columns)
+    return pd.read_parquet(latest_partition(ticker, folder), columns=columns)
+
+def save_frame(df: pd.DataFrame, folder: str, ticker: str, backend: str = None) -> str:
+    """
+    Saves a dataframe to the selected backend, replacing any previous CSV file for the ticker.
+
+    :return: The path of the written file (the CSV file when writing both).
+    """
+    backend = backend or dataBackend
+    filepath = None
+
+    if backend in ('parquet', 'both'):
+        filepath = write_parquet(df, folder, ticker)
+
+    if backend in ('csv', 'both'):
+        #create folder if doesnt exist
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        #deletes any previous files in the folder with the given ticker
+        for filename in os.listdir(folder):
+            if filename.startswith(ticker):
+                os.remove(os.path.join(folder, filename))
+
+        #save the dataframe to folder
+        filepath = csv_path(ticker, folder)
+        df.to_csv(filepath, index=False)
+
+    return filepath
+
+class SnapshotCache:
+    """
+    In-memory snapshot of the data files, so every (ticker, folder) is read from disk once per run no matter
+    how many agents ask for it. An entry is reloaded when the modification time or size of its file changes.
+    """
+
+    def __init__(self, backend: str = None):
+        self.backend = backend
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _entry(self, ticker: str, folder: str) -> dict:
+        filepath = source_path(ticker, folder, self.backend)
+        stat = os.stat(filepath)
+        stamp = (filepath, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get((ticker, folder))
+            if entry is not None and entry['stamp'] == stamp:
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            df = load_frame(ticker, folder, backend=self.backend)
+            entry = {
+                'stamp': stamp,
+                'frame': df,
+                # The agent-readable records are built once, instead of a to_json/json.loads round trip per call
+                'records': json.loads(df.to_json(orient='records', date_format='iso')),
+            }
+            self.entries[(ticker, folder)] = entry
+            return entry
+
+    def frame(self, ticker: str, folder: str, columns: list = None) -> pd.DataFrame:
+        """
+        :return: A copy of the stored dataframe, limited to 'columns' if given. Raises FileNotFoundError if nothing is stored.
+        """
+        return self.snapshot(ticker, folder, columns)[0]
+
+    def snapshot(self, ticker: str, folder: str, columns: list = None) -> tuple:
+        """
+        :return: A (frame, stamp) tuple, the frame as returned by frame() and the (path, mtime_ns, size) of the
+            file it was read from, for caches derived from the frame.
+        """
+        entry = self._entry(ticker, folder)
+        df = entry['frame']
+        return (df[columns].copy() if columns else df.copy()), entry['stamp']
+
+    def records(self, ticker: str, folder: str) -> list:
+        """
+        :return: The stored data as a list of records. Raises FileNotFoundError if nothing is stored.
+        """
+        return [dict(record) for record in self._entry(ticker, folder)['records']]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+# Shared by all the tool functions of a run
+snapshotCache = SnapshotCache()
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_CONFIG = {
+    'database': os.getenv('DATABASE_NAME'),
+    'user': os.getenv('DATABASE_USER'),
+    'port': os.getenv('DATABASE_PORT'),
+    'password': os.getenv('DATABASE_PASSWORD'),
+    'host': os.getenv('DATABASE_HOST')
+}
+
+poolMinSize = int(os.getenv('DB_POOL_MIN', 1))
+poolMaxSize = int(os.getenv('DB_POOL_MAX', 10))
+pingAfter = float(os.getenv('DB_POOL_PING_AFTER', 60)) # seconds a connection may sit idle before it is checked with SELECT 1
+poolTimeout = float(os.getenv('DB_POOL_TIMEOUT', 300)) # seconds a caller waits for a free connection before PoolError is raised
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# ThreadedConnectionPool raises PoolError instead of waiting once every connection is out,
+# so a checkout first takes one of poolMaxSize slots and waits for it when the pool is busy
+_slots = None
+_last_used = {}
+
+def get_pool() -> ThreadedConnectionPool:
+    """
+    Returns the shared connection pool, creating it on first use.
+    """
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _slots = threading.BoundedSemaphore(poolMaxSize)
+                _pool = ThreadedConnectionPool(poolMinSize, poolMaxSize, **DATABASE_CONFIG)
+    return _pool
+
+def close_pool():
+    """
+    Closes every connection of the shared pool, the next get_connection creates a new pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+def _healthy(conn) -> bool:
+    if conn.closed:
+        return False
+
+    # Only connections that sat idle for a while are pinged, so a busy run doesn't pay an extra round trip per call
+    if time.monotonic() - _last_used.get(id(conn), 0) < pingAfter:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def get_connection():
+    """
+    Borrows a healthy connection from the shared pool. The transaction is committed when the block
+    finishes and rolled back if it raises, broken connections are dropped from the pool.
+    When all DB_POOL_MAX connections are in use, the caller waits for one to be returned (at most DB_POOL_TIMEOUT seconds).
+
+    Usage:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(...)
+    """
+    pool = get_pool()
+    slots = _slots
+    if not slots.acquire(timeout=poolTimeout):
+        raise PoolError(f"No database connection free after {poolTimeout:g}s, raise DB_POOL_MAX ({poolMaxSize})")
+
+    try:
+        conn = pool.getconn()
+        while not _healthy(conn):
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+    except Exception:
+        slots.release()
+        raise
+
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _last_used[id(conn)] = time.monotonic()
+        try:
+            pool.putconn(conn, close=broken or conn.closed)
+        finally:
+            slots.release()
+
+def connection_latency(calls: int = 50) -> tuple:
+    """
+    Runs SELECT 1 calls times on a fresh connection per call, then on a pooled connection per call.
+
+    :return: The mean seconds per call of both, as a (direct, pooled) tuple.
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        with psycopg2.connect(**DATABASE_CONFIG) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+        conn.close()
+    direct = (time.perf_counter() - start) / calls
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+    pooled = (time.perf_counter() - start) / calls
+
+    return direct, pooled
+
+if __name__ == "__main__":
+    # Compares the latency of a fresh connection per call with a pooled connection per call
+    direct, pooled = connection_latency(50)
+    print(f"psycopg2.connect per call: {direct * 1000:.2f} ms")
+    print(f"pooled connection per call: {pooled * 1000:.2f} ms")
+    close_pool()
@@ -0,0 +1,270 @@
+import os
+import re
+import glob
+import json
+import threading
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from dbPool import get_connection, close_pool
+
+load_dotenv()
+
+# 'immediate' => every send_opinion/insert_summary call commits its own row (default),
+# 'buffered' => the rows of a debate are collected and written with multi-row inserts in one transaction
+writeMode = os.getenv('DB_WRITE_MODE', 'immediate').lower()
+
+# Buffered rows are journaled here until they are committed, so a crash never loses an agent's opinion
+journalFolder = 'WriteJournal'
+
+# A journal is named {date}_{ticker}_{model}_{version}.pid{pid}.jsonl after the process writing it, and
+# .pid{pid}.recovering{n}.jsonl while a process replays it. Only the journals of processes that are gone are recovered
+journalOwner = re.compile(r'\.pid(\d+)(\.recovering\d+)?\.jsonl$')
+
+tableColumns = {
+    'mddebate': {
+        'columns': ['key', 'date', 'ticker', 'agent', 'model', 'version', 'content', 'decision', 'price', 'position', 'positionsize'],
+        'conflict': ['date', 'ticker', 'model', 'version', 'agent'],
+    },
+    'mdmemory': {
+        'columns': ['date', 'ticker', 'model', 'version', 'content', 'decision', 'price', 'position', 'positionsize'],
+        'conflict': ['ticker', 'model', 'version', 'date'],
+    },
+}
+
+def upsert_query(table: str) -> str:
+    spec = tableColumns[table]
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in spec['columns'] if column not in spec['conflict'])
+    return (f"INSERT INTO {table} ({', '.join(spec['columns'])}) VALUES %s "
+            f"ON CONFLICT ({', '.join(spec['conflict'])}) DO UPDATE SET {updates}")
+
+def write_rows(cur, table: str, rows: list) -> int:
+    """
+    Upserts rows into mddebate or mdmemory with a single multi-row INSERT.
+
+    :param cur: A database cursor, the caller commits.
+    :param table: 'mddebate' or 'mdmemory'.
+    :param rows: The rows as dictionaries with every column of the table.
+    :return: The number of rows written.
+    """
+    # One INSERT can't update the same row twice, so the last row per key wins, like separate upserts would
+    spec = tableColumns[table]
+    unique = {tuple(row[column] for column in spec['conflict']): row for row in rows}
+    execute_values(cur, upsert_query(table), [tuple(row[column] for column in spec['columns']) for row in unique.values()])
+    return len(unique)
+
+def pid_alive(pid: int) -> bool:
+    """
+    :return: True if a process with this id is running.
+    """
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows, ask for its exit code instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259 # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def journal_owner(filepath: str):
+    """
+    :return: The id of the process that wrote the journal, None for a journal without one.
+    """
+    match = journalOwner.search(os.path.basename(filepath))
+    return int(match.group(1)) if match else None
+
+def journal_debate(filepath: str) -> str:
+    # The {date}_{ticker}_{model}_{version} part of a journal's name
+    name = os.path.basename(filepath)
+    match = journalOwner.search(name)
+    return name[:match.start()] if match else name[:-len('.jsonl')]
+
+def read_journal(filepath: str) -> list:
+    entries = []
+    with open(filepath) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A line cut short by a crash was never acknowledged to the agent
+                continue
+    return entries
+
+class BufferedWriter:
+    """
+    Collects the mddebate and mdmemory rows of each debate and writes them in one transaction when the debate
+    is flushed. Every row is appended to a journal file (and fsynced) before it is acknowledged, the journal
+    is deleted once its rows are committed and replayed by recover() after a crash.
+    The lock only guards the buffers and journals, the transaction of a flush runs without it.
+    """
+
+    def __init__(self, folder: str = journalFolder):
+        self.folder = folder
+        self.buffers = {}
+        self.flushing = {} # the batches of each debate whose transaction is running
+        self.rows = 0
+        self.transactions = 0
+        self.lock = threading.Lock()
+
+    def journal_path(self, debate: tuple) -> str:
+        return os.path.join(self.folder, f"{'_'.join(debate)}.pid{os.getpid()}.jsonl")
+
+    def pending(self, debate: tuple, table: str) -> list:
+        """
+        :return: The rows of a debate for 'mddebate' or 'mdmemory' that aren't committed yet, oldest first.
+        """
+        with self.lock:
+            entries = [entry for batch in self.flushing.get(debate, []) for entry in batch] + self.buffers.get(debate, [])
+        return [dict(row) for name, row in entries if name == table]
+
+    def rewrite_journal(self, debate: tuple):
+        # Called with the lock held: the journal keeps only the rows that aren't committed yet
+        entries = [entry for batch in self.flushing.get(debate, []) for entry in batch] + self.buffers.get(debate, [])
+        filepath = self.journal_path(debate)
+        if not entries:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return
+
+        with open(filepath + '.tmp', 'w') as f:
+            for table, row in entries:
+                f.write(json.dumps({'table': table, 'row': row}, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(filepath + '.tmp', filepath)
+
+    def finish(self, debate: tuple, batch: list):
+        # Called with the lock held once the transaction of a batch is over
+        batches = self.flushing.get(debate, [])
+        for i, running in enumerate(batches):
+            if running is batch:
+                del batches[i]
+                break
+        if not batches:
+            self.flushing.pop(debate, None)
+
+    def add(self, table: str, row: dict) -> bool:
+        """
+        Buffers a row for 'mddebate' or 'mdmemory'.
+
+        :return: True once the row is journaled on disk.
+        """
+        debate = (str(row['date']), row['ticker'], row['model'], row['version'])
+        with self.lock:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+            with open(self.journal_path(debate), 'a') as f:
+                f.write(json.dumps({'table': table, 'row': row}, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.buffers.setdefault(debate, []).append((table, row))
+        return True
+
+    def flush(self, debate: tuple = None) -> int:
+        """
+        Writes the buffered rows in one transaction. If the transaction fails the rows stay buffered and journaled.
+
+        :param debate: (date, ticker, model, version) to flush a single debate, None flushes everything.
+        :return: The number of rows written.
+        """
+        # The rows are taken out of the buffers, so the analysts can keep adding rows while the transaction runs
+        with self.lock:
+            debates = [debate] if debate is not None else list(self.buffers)
+            batches = {key: self.buffers.pop(key) for key in debates if self.buffers.get(key)}
+            for key, batch in batches.items():
+                self.flushing.setdefault(key, []).append(batch)
+        if not batches:
+            return 0
+
+        written = 0
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    for table in tableColumns:
+                        rows = [row for batch in batches.values() for name, row in batch if name == table]
+                        if rows:
+                            written += write_rows(cur, table, rows)
+        except Exception:
+            # Back in front of any row added since, they are still journaled
+            with self.lock:
+                for key, batch in batches.items():
+                    self.finish(key, batch)
+                    self.buffers[key] = batch + self.buffers.get(key, [])
+            raise
+
+        with self.lock:
+            for key, batch in batches.items():
+                self.finish(key, batch)
+                self.rewrite_journal(key)
+            self.rows += written
+            self.transactions += 1
+        return written
+
+    def orphaned_journals(self) -> list:
+        """
+        :return: The journals of processes that are no longer running, the journals of this process and of
+            other running processes (e.g. portfolioRunner workers) are left to them.
+        """
+        journals = []
+        for filepath in glob.glob(os.path.join(self.folder, '*.jsonl')):
+            owner = journal_owner(filepath)
+            if owner is not None and (owner == os.getpid() or pid_alive(owner)):
+                continue
+            journals.append(filepath)
+        return journals
+
+    def recover(self) -> int:
+        """
+        Writes the rows of the journals left behind by crashed runs, in one transaction. A journal is first renamed
+        to this process, so two runs starting at the same time never replay the same journal.
+
+        :return: The number of rows written.
+        """
+        journals = []
+        for i, filepath in enumerate(self.orphaned_journals()):
+            claimed = os.path.join(self.folder, f"{journal_debate(filepath)}.pid{os.getpid()}.recovering{i}.jsonl")
+            try:
+                os.rename(filepath, claimed)
+            except OSError:
+                # Claimed by another run
+                continue
+            journals.append(claimed)
+        if not journals:
+            return 0
+
+        entries = [entry for filepath in journals for entry in read_journal(filepath)]
+        written = 0
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                for table in tableColumns:
+                    rows = [entry['row'] for entry in entries if entry['table'] == table]
+                    if rows:
+                        written += write_rows(cur, table, rows)
+
+        for filepath in journals:
+            os.remove(filepath)
+        print(f"Recovered {written} rows from {len(journals)} journal files")
+        return written
+
+    def stats(self) -> dict:
+        with self.lock:
+            pending = sum(len(batch) for batch in self.buffers.values())
+            pending += sum(len(batch) for batches in self.flushing.values() for batch in batches)
+        return {'rows': self.rows, 'transactions': self.transactions, 'pending': pending}
+
+# Shared by the send_opinion and insert_summary tools of a run, None in immediate mode
+bufferedWriter = BufferedWriter() if writeMode == 'buffered' else None
+
+if __name__ == "__main__":
+    # python dbWriter.py => replays the journals of a crashed buffered run
+    BufferedWriter().recover()
+    close_pool()
@@ -1,63 +1,225 @@
 import os
+import sys
 import tkinter as tk
-from tkinter import scrolledtext
+from tkinter import scrolledtext, filedialog
+from historyParser import historyFolder, history_files, parse_reports
 
-def load_and_display_filtered_reports(file_name):
-    folder_path = 'Chat History'
-    file_path = os.path.join(folder_path, file_name)
+allAgents = 'All agents'
 
-    try:
-        with open(file_path, 'r') as file:
-            content = file.read()
+class ReportPager:
+    """
+    Reads the reports of a Chat History file lazily: a report is only parsed once it is shown, or when the
+    viewer loads the rest of the file in the background.
+    """
 
-        # Initialize the GUI window
-        window = tk.Tk()
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.reports = []
+        self.source = parse_reports(filepath)
+        self.done = False
+
+    def load(self, count: int = 1) -> int:
+        """
+        Parses up to count more reports.
+
+        :return: The number of reports parsed.
+        """
+        loaded = 0
+        while not self.done and loaded < count:
+            try:
+                self.reports.append(next(self.source))
+                loaded += 1
+            except StopIteration:
+                self.done = True
+        return loaded
+
+    def get(self, index: int) -> dict:
+        """
+        :return: The report at the index, parsing up to it if needed, None past the last report.
+        """
+        if index < 0:
+            return None
+        self.load(index + 1 - len(self.reports))
+        return self.reports[index] if index < len(self.reports) else None
+
+    def find(self, start: int, step: int = 1, agent: str = None, chat: int = None) -> int:
+        """
+        :return: The index of the first report from start on (or back from start with step=-1) that matches the
+            agent and chat, None if there is none.
+        """
+        index = start
+        while True:
+            report = self.get(index)
+            if report is None:
+                return None
+            if (agent is None or report['agent'] == agent) and (chat is None or report['chat'] == chat):
+                return index
+            index += step
+
+class ReportViewer:
+    """
+    Shows one agent report at a time. The files of the folder are listed on the left, the reports of the open
+    file can be stepped through, filtered by agent, or jumped to by chat id.
+    """
+
+    def __init__(self, window: tk.Tk, folder: str = historyFolder):
+        self.window = window
+        self.folder = folder
+        self.pager = None
+        self.index = None
         window.title("Reports")
 
-        # Create a scrolled text widget
-        text_area = scrolledtext.ScrolledText(window, wrap=tk.WORD, width=50, height=60)
-        text_area.pack(padx=10, pady=10)
-        text_area.insert(tk.INSERT, "**** Agent Reports ****:")
+        # Left: the transcripts of the folder
+        side = tk.Frame(window)
+        side.pack(side=tk.LEFT, fill=tk.Y, padx=(10, 0), pady=10)
+        tk.Button(side, text="Open folder...", command=self.choose_folder).pack(fill=tk.X)
+        self.file_list = tk.Listbox(side, width=40, exportselection=False)
+        self.file_list.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
+        self.file_list.bind("<<ListboxSelect>>", lambda event: self.open_selected())
+
+        # Top: navigation
+        main = tk.Frame(window)
+        main.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
+        navigation = tk.Frame(main)
+        navigation.pack(fill=tk.X)
+        tk.Button(navigation, text="< Previous", command=lambda: self.step(-1)).pack(side=tk.LEFT)
+        tk.Button(navigation, text="Next >", command=lambda: self.step(1)).pack(side=tk.LEFT)
+
+        self.agent = tk.StringVar(value=allAgents)
+        self.agent_menu = tk.OptionMenu(navigation, self.agent, allAgents)
+        self.agent_menu.pack(side=tk.LEFT, padx=5)
+        self.agent.trace_add("write", lambda *args: self.show_first())
+
+        tk.Label(navigation, text="Chat id:").pack(side=tk.LEFT)
+        self.chat = tk.Entry(navigation, width=4)
+        self.chat.pack(side=tk.LEFT)
+        self.chat.bind("<Return>", lambda event: self.go_to_chat())
+        tk.Button(navigation, text="Go", command=self.go_to_chat).pack(side=tk.LEFT)
+
+        self.status = tk.Label(navigation, anchor=tk.E)
+        self.status.pack(side=tk.RIGHT)
 
-        # Clean the document from 'tool_calls'
-        cleaned_content = ""
-        while "'tool_calls': [{" in content:
-            start_index = content.find("'tool_calls': [{")
-            pre_text = content[:start_index]
-            content = content[start_index:]
-            end_index = content.find("}]") + 2
+        # The report itself
+        self.text_area = scrolledtext.ScrolledText(main, wrap=tk.WORD, width=90, height=50)
+        self.text_area.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
 
-            # Append the text before 'tool_calls' and skip 'tool_calls' content
-            cleaned_content += pre_text
-            content = content[end_index:]
+        self.list_files()
 
-        cleaned_content += content  # Add any remaining content after the last 'tool_calls'
+    def list_files(self):
+        self.files = history_files(self.folder)
+        self.file_list.delete(0, tk.END)
+        for filepath in self.files:
+            self.file_list.insert(tk.END, os.path.basename(filepath))
 
-        # Convert escaped newlines back to actual newline characters
-        cleaned_content = cleaned_content.replace("\\n", "\n")
+    def choose_folder(self):
+        folder = filedialog.askdirectory(initialdir=self.folder)
+        if folder:
+            self.folder = folder
+            self.list_files()
 
-        # Process the cleaned content to extract and display the reports
-        start_indicator = "'content': \"###"
-        reports = cleaned_content.split(start_indicator)[1:]  # Skip the first split part if it doesn't start with 'Content: ###'
+    def open_selected(self):
+        selection = self.file_list.curselection()
+        if selection:
+            self.open_file(self.files[selection[0]])
 
-        for report in reports:
-            # Extract up to the next occurrence of 'content': to avoid including subsequent reports
-            end_of_report = report.find("'content':")
-            if end_of_report != -1:
-                report = report[:end_of_report]
+    def open_file(self, filepath: str):
+        # Only the first report is parsed before it is shown, the rest is loaded while the window stays responsive
+        self.pager = ReportPager(filepath)
+        self.agent.set(allAgents)
+        if filepath in self.files:
+            self.file_list.selection_clear(0, tk.END)
+            self.file_list.selection_set(self.files.index(filepath))
+        self.window.title(f"Reports - {os.path.basename(filepath)}")
+        self.show_first()
+        self.window.after_idle(self.load_more, self.pager)
 
-            chat_indicator = "\n\n\n\n\n\n\n-------------------- New chat --------------------\n"
-            clean_report = chat_indicator + start_indicator + report.strip("\"")
-            text_area.insert(tk.INSERT, clean_report + "\n\n")
+    def load_more(self, pager: ReportPager):
+        # Stops once the file is fully loaded, or when another file was opened in the meantime
+        if pager is not self.pager or pager.done:
+            return
+        pager.load(6)
+        self.update_agents()
+        self.update_status()
+        self.window.after(1, self.load_more, pager)
 
+    def update_agents(self):
+        agents = sorted({report['agent'] for report in self.pager.reports if report['agent']})
+        menu = self.agent_menu["menu"]
+        if menu.index(tk.END) == len(agents):
+            return
+        menu.delete(0, tk.END)
+        for name in [allAgents] + agents:
+            menu.add_command(label=name, command=lambda name=name: self.agent.set(name))
+
+    def selected_agent(self) -> str:
+        agent = self.agent.get()
+        return None if agent == allAgents else agent
+
+    def show_first(self):
+        if self.pager is not None:
+            self.show(self.pager.find(0, agent=self.selected_agent()))
+
+    def step(self, step: int):
+        if self.pager is None or self.index is None:
+            return
+        index = self.pager.find(self.index + step, step, agent=self.selected_agent())
+        if index is not None:
+            self.show(index)
+
+    def go_to_chat(self):
+        try:
+            chat = int(self.chat.get())
+        except ValueError:
+            return
+        if self.pager is not None:
+            index = self.pager.find(0, agent=self.selected_agent(), chat=chat)
+            if index is not None:
+                self.show(index)
+
+    def show(self, index: int):
+        self.index = index
+        self.text_area.configure(state='normal')
+        self.text_area.delete("1.0", tk.END)
+        report = self.pager.get(index) if index is not None else None
+        if report is None:
+            self.text_area.insert(tk.END, "No reports found.")
+        else:
+            self.text_area.insert(tk.END, f"{report['agent'] or 'Unknown agent'} (chat {report['chat']}), {report['date']} {report['ticker']}\n"
+                                          f"Decision: {report['decision'] or '-'}, price: {report['price']}, positionsize: {report['positionsize']}\n\n")
+            self.text_area.insert(tk.END, report['report'])
         # Disable editing in the text area
-        text_area.configure(state='disabled')
+        self.text_area.configure(state='disabled')
+        self.update_status()
 
-        # Start the GUI event loop
-        window.mainloop()
+    def update_status(self):
+        if self.pager is None:
+            return
+        total = f"{len(self.pager.reports)}{'' if self.pager.done else '+'}"
+        position = '-' if self.index is None else self.index + 1
+        self.status.configure(text=f"Report {position} of {total}")
 
-    except FileNotFoundError:
+def load_and_display_filtered_reports(file_name, folder_path=historyFolder):
+    file_path = os.path.join(folder_path, file_name)
+    if not os.path.exists(file_path):
         print(f"The file {file_name} was not found in {folder_path}.")
+        return
+
+    window = tk.Tk()
+    viewer = ReportViewer(window, folder_path)
+    viewer.open_file(file_path)
+
+    # Start the GUI event loop
+    window.mainloop()
 
-# Ensure you have the correct file name
-load_and_display_filtered_reports('2024-04-04_TSLA_GPT3.5_V2.txt')
\ No newline at end of file
+if __name__ == "__main__":
+    # python displayHistory.py => browse the Chat History folder, opening the newest transcript
+    # python displayHistory.py FOLDER or FILE => browse another folder, or open a file directly
+    target = sys.argv[1] if len(sys.argv) > 1 else historyFolder
+    if os.path.isfile(target):
+        load_and_display_filtered_reports(os.path.basename(target), os.path.dirname(target) or '.')
+    else:
+        window = tk.Tk()
+        viewer = ReportViewer(window, target)
+        if viewer.files:
+            viewer.open_file(viewer.files[0])
+        window.mainloop()
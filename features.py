@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from dataStore import snapshotCache
+
+load_dotenv()
+
+hisFolder = 'HistoricalData'
+
+# The signals of each ticker are cached here per snapshot of its HistoricalData file, e.g. Features/TSLA_2024-04-04_3f2a9c81d0e4.json,
+# the date of the newest bar followed by a hash of the file's (path, mtime_ns, size)
+featureFolder = 'Features'
+
+tradingDays = 252
+smaWindows = [5, 20, 50]
+returnWindows = [1, 5, 20]
+volatilityWindow = 20
+volumeWindow = 20
+rsiWindow = 14
+
+def compute_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the technical indicators for every day of the price history, vectorized over the whole frame.
+
+    :param df: The historical data with 'Date', 'Open', 'Close' and 'Volume' columns, in any order.
+    :return: The history sorted oldest to newest, with one column per indicator.
+    """
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
+    df = df.sort_values('Date').reset_index(drop=True)
+    close = df['Close'].astype('float64')
+    volume = df['Volume'].astype('float64')
+
+    for window in smaWindows:
+        df[f'SMA{window}'] = close.rolling(window).mean()
+    for window in returnWindows:
+        df[f'Return{window}d'] = close.pct_change(window)
+
+    # Annualized volatility of the daily log returns
+    log_returns = np.log(close).diff()
+    df['Volatility'] = log_returns.rolling(volatilityWindow).std() * np.sqrt(tradingDays)
+
+    # RSI with Wilder's smoothing
+    change = close.diff()
+    gain = change.clip(lower=0).ewm(alpha=1 / rsiWindow, min_periods=rsiWindow, adjust=False).mean()
+    loss = (-change.clip(upper=0)).ewm(alpha=1 / rsiWindow, min_periods=rsiWindow, adjust=False).mean()
+    df['RSI'] = 100 - 100 / (1 + gain / loss)
+
+    # MACD (12, 26, 9)
+    df['MACD'] = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    df['MACDSignal'] = df['MACD'].ewm(span=9, adjust=False).mean()
+    df['MACDHistogram'] = df['MACD'] - df['MACDSignal']
+
+    volume_mean = volume.rolling(volumeWindow).mean()
+    volume_std = volume.rolling(volumeWindow).std()
+    df['VolumeZ'] = (volume - volume_mean) / volume_std
+
+    df['Drawdown'] = close / close.cummax() - 1
+    return df
+
+def latest_signals(df: pd.DataFrame) -> dict:
+    """
+    Condenses the newest day of compute_features into a compact, rounded dictionary for an agent.
+    """
+    features = compute_features(df)
+    last = features.iloc[-1]
+
+    def value(column, digits=4):
+        number = last[column]
+        return None if pd.isna(number) else round(float(number), digits)
+
+    return {
+        'date': last['Date'].strftime('%d-%m-%Y'),
+        'close': value('Close', 2),
+        'open': value('Open', 2),
+        'sma': {str(window): value(f'SMA{window}', 2) for window in smaWindows},
+        'close_above_sma': {str(window): None if pd.isna(last[f'SMA{window}']) else bool(last['Close'] > last[f'SMA{window}'])
+                            for window in smaWindows},
+        'returns': {f'{window}d': value(f'Return{window}d') for window in returnWindows},
+        'volatility_annualized': value('Volatility'),
+        'rsi': value('RSI', 1),
+        'macd': {'macd': value('MACD'), 'signal': value('MACDSignal'), 'histogram': value('MACDHistogram')},
+        'volume_zscore': value('VolumeZ', 2),
+        'drawdown': value('Drawdown'),
+        'max_drawdown': round(float(features['Drawdown'].min()), 4),
+        'days': len(features),
+    }
+
+def ticker_signals(ticker: str) -> dict:
+    """
+    Returns the technical signals for the newest day of a ticker's HistoricalData, computed once per version of
+    the file, so a bar that is revised in place (same newest date) gets new signals.
+    Raises FileNotFoundError if no historical data is stored.
+    """
+    df, stamp = snapshotCache.snapshot(ticker, hisFolder, columns=['Date', 'Open', 'Close', 'Volume'])
+    newest = pd.to_datetime(df['Date'], format='%d-%m-%Y').max().strftime('%Y-%m-%d')
+    digest = hashlib.sha1(repr(stamp).encode('utf-8')).hexdigest()[:12]
+    filepath = os.path.join(featureFolder, f"{ticker}_{newest}_{digest}.json")
+
+    if os.path.exists(filepath):
+        with open(filepath) as f:
+            return json.load(f)
+
+    signals = latest_signals(df)
+    if not os.path.exists(featureFolder):
+        os.makedirs(featureFolder)
+
+    # Written to a temporary file first, so a concurrent reader never sees half a file
+    temporary = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(signals, f)
+    os.replace(temporary, filepath)
+
+    # The signals of the ticker's older files are never read again
+    for filename in os.listdir(featureFolder):
+        if filename.startswith(f"{ticker}_") and filename.endswith('.json') and filename != os.path.basename(filepath):
+            try:
+                os.remove(os.path.join(featureFolder, filename))
+            except FileNotFoundError:
+                pass
+    return signals
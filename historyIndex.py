@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+from historyParser import historyFolder, history_files, parse_reports
+
+# The reports of every Chat History file, with a full-text index over the report text and the content sent to the database
+historyIndexFile = os.path.join('HistoryIndex', 'history.sqlite')
+
+reportColumns = ['date', 'ticker', 'model', 'version', 'chat', 'agent', 'decision', 'price', 'position', 'positionsize', 'report', 'opinion']
+
+class HistoryIndex:
+    """
+    Full-text index (SQLite FTS5) of the reports in the Chat History folder. update() only parses the files
+    that are new or changed since the last update, and drops the reports of files that were deleted.
+    """
+
+    def __init__(self, path: str = historyIndexFile):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                reports INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS reports (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                date TEXT,
+                ticker TEXT,
+                model TEXT,
+                version TEXT,
+                chat INTEGER,
+                agent TEXT,
+                decision TEXT,
+                price REAL,
+                position INTEGER,
+                positionsize REAL,
+                report TEXT,
+                opinion TEXT
+            );
+            CREATE INDEX IF NOT EXISTS reports_path ON reports (path);
+            CREATE INDEX IF NOT EXISTS reports_filters ON reports (agent, decision, date);
+            CREATE INDEX IF NOT EXISTS reports_ticker ON reports (ticker, date);
+
+            -- External content table: the text is stored once in reports, the triggers keep the index in sync
+            CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(report, opinion, content='reports', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS reports_insert AFTER INSERT ON reports BEGIN
+                INSERT INTO reports_fts (rowid, report, opinion) VALUES (new.id, new.report, new.opinion);
+            END;
+            CREATE TRIGGER IF NOT EXISTS reports_delete AFTER DELETE ON reports BEGIN
+                INSERT INTO reports_fts (reports_fts, rowid, report, opinion) VALUES ('delete', old.id, old.report, old.opinion);
+            END;
+        """)
+        self.conn.commit()
+
+    def update(self, folder: str = historyFolder) -> dict:
+        """
+        Brings the index up to date with the folder, a file is (re)indexed when its size or modification time changed.
+
+        :return: The number of files indexed, removed and left unchanged, and the reports added.
+        """
+        with self.lock:
+            indexed = {row['path']: (row['size'], row['mtime']) for row in self.conn.execute("SELECT path, size, mtime FROM files")}
+            current = {}
+            for filepath in history_files(folder):
+                stat = os.stat(filepath)
+                current[filepath] = (stat.st_size, stat.st_mtime)
+
+            changed = [filepath for filepath, version in current.items() if indexed.get(filepath) != version]
+            removed = [filepath for filepath in indexed if filepath not in current]
+            added = 0
+
+            for filepath in removed:
+                self.conn.execute("DELETE FROM reports WHERE path = ?", (filepath,))
+                self.conn.execute("DELETE FROM files WHERE path = ?", (filepath,))
+
+            for filepath in changed:
+                try:
+                    reports = list(parse_reports(filepath))
+                except (OSError, EOFError) as e:
+                    # E.g. a gzip transcript that is still being written, indexed on the next update
+                    print(f"Could not index {filepath}: {e}")
+                    continue
+
+                self.conn.execute("DELETE FROM reports WHERE path = ?", (filepath,))
+                self.conn.executemany(
+                    f"INSERT INTO reports (path, {', '.join(reportColumns)}) VALUES (?, {', '.join('?' * len(reportColumns))})",
+                    [(filepath, *(report[column] for column in reportColumns)) for report in reports]
+                )
+                self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, reports) VALUES (?, ?, ?, ?)",
+                                  (filepath, *current[filepath], len(reports)))
+                added += len(reports)
+
+            self.conn.commit()
+        return {'indexed': len(changed), 'removed': len(removed), 'unchanged': len(current) - len(changed), 'reports': added}
+
+    def search(self, text: str = None, agent: str = None, decision: str = None, ticker: str = None, model: str = None,
+               version: str = None, start: str = None, end: str = None, limit: int = 50) -> list:
+        """
+        Searches the indexed reports, e.g. search('tariff', agent='MDnewsAnalyst', decision='SELL', start='2024-01-01', end='2024-12-31').
+
+        :param text: FTS5 query over the report text and the content sent to the database, None matches every report.
+        :param start: First date (YYYY-MM-DD), inclusive.
+        :param end: Last date (YYYY-MM-DD), inclusive.
+        :return: The matching reports as dictionaries, newest first, with a snippet around the match when text is given.
+        """
+        filters, params = [], []
+        for column, value in (('agent', agent), ('decision', decision and decision.upper()), ('ticker', ticker and ticker.upper()),
+                              ('model', model), ('version', version)):
+            if value is not None:
+                filters.append(f"r.{column} = ?")
+                params.append(value)
+        if start is not None:
+            filters.append("r.date >= ?")
+            params.append(start)
+        if end is not None:
+            filters.append("r.date <= ?")
+            params.append(end)
+
+        if text:
+            query = ("SELECT r.*, snippet(reports_fts, -1, '[', ']', '...', 12) AS snippet "
+                     "FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid WHERE reports_fts MATCH ?")
+            params.insert(0, text)
+            if filters:
+                query += " AND " + " AND ".join(filters)
+        else:
+            query = "SELECT r.*, NULL AS snippet FROM reports r"
+            if filters:
+                query += " WHERE " + " AND ".join(filters)
+        query += " ORDER BY r.date DESC, r.chat LIMIT ?"
+        params.append(int(limit))
+
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query, params)]
+
+    def stats(self) -> dict:
+        with self.lock:
+            files, reports = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(reports), 0) FROM files").fetchone()
+        return {'files': files, 'reports': reports}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+if __name__ == "__main__":
+    # python historyIndex.py tariff --agent=MDnewsAnalyst --decision=SELL --start=2024-01-01 --end=2024-12-31
+    # => updates the index, then prints the matching reports. Without a search text every report matching the options is listed.
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    text = ' '.join(arg for arg in sys.argv[1:] if not arg.startswith('--')) or None
+
+    index = HistoryIndex()
+    print(f"Index update: {index.update()}")
+
+    start = time.perf_counter()
+    results = index.search(text, **options)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    for result in results:
+        excerpt = result['snippet'] or result['report'][:120]
+        print(f"{result['date']} {result['ticker']} {result['model']} {result['version']} {result['agent']} {result['decision']}: "
+              f"{' '.join(excerpt.split())}")
+    print(f"{len(results)} reports in {elapsed:.1f} ms")
+    index.close()
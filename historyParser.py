@@ -0,0 +1,192 @@
+import os
+import re
+import ast
+import json
+from transcriptWriter import read_transcript
+
+historyFolder = 'Chat History'
+
+# The .txt files hold one chat per block: a header line, the chat history as a Python repr on one line, and its cost
+chatHeader = re.compile(r"^\*{5}(\d+)th chat\*{7}:$")
+costPrefix = "Conversation cost: "
+
+# {date}_{ticker}_{model}_{version}.txt, .jsonl or .jsonl.gz. Transcripts rotated by date are just {date}.jsonl
+fileName = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:_([^_]+)_(.+)_([^_]+?))?\.(txt|jsonl|jsonl\.gz)$")
+
+# The format used when a debate is stored in more than one, the transcript has the timing and the chat ids
+formatPreference = ['jsonl', 'jsonl.gz', 'txt']
+
+# The tool calls that write an agent's decision to the database
+decisionTools = {'send_opinion': 'mddebate', 'insert_summary': 'mdmemory'}
+
+def parse_filename(path: str) -> dict:
+    """
+    :return: The date, ticker, model, version and format of a Chat History file, None if the name doesn't match.
+    """
+    match = fileName.match(os.path.basename(path))
+    if match is None:
+        return None
+    day, ticker, model, version, extension = match.groups()
+    return {'date': day, 'ticker': ticker, 'model': model, 'version': version, 'format': extension}
+
+def parse_txt(path: str):
+    """
+    Reads a .txt history line by line and yields one chat at a time, each block is parsed with ast.literal_eval.
+    A block that doesn't parse (e.g. a file cut short by a crash) is skipped.
+    """
+    meta = parse_filename(path) or {}
+    chat = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            header = chatHeader.match(line)
+            if header:
+                if chat is not None:
+                    yield chat
+                chat = {**meta, 'chat': int(header.group(1)), 'messages': [], 'cost': None}
+            elif chat is None or not line:
+                continue
+            elif line.startswith(costPrefix):
+                try:
+                    chat['cost'] = ast.literal_eval(line[len(costPrefix):])
+                except (ValueError, SyntaxError):
+                    pass
+            elif line.startswith('['):
+                try:
+                    chat['messages'] = ast.literal_eval(line)
+                except (ValueError, SyntaxError) as e:
+                    print(f"Skipping chat {chat['chat']} of {path}: {e}")
+    if chat is not None:
+        yield chat
+
+def parse_jsonl(path: str):
+    """
+    Reads a .jsonl or .jsonl.gz transcript and yields one chat at a time, as soon as its chat_end record is read.
+    The messages are converted to the shape of the .txt chat histories, with the sending agent as 'name'.
+    """
+    chats = {}
+    for record in read_transcript(path):
+        key = (record.get('date'), record.get('ticker'), record.get('model'), record.get('version'), record.get('chat_id'))
+        chat = chats.get(key)
+        if chat is None:
+            chat = chats[key] = {
+                'date': record.get('date'), 'ticker': record.get('ticker'), 'model': record.get('model'),
+                'version': record.get('version'), 'format': 'jsonl', 'chat': record.get('chat_id'), 'messages': [], 'cost': None,
+            }
+        if record.get('type') == 'chat_end':
+            chat['cost'] = record.get('cost')
+            yield chats.pop(key)
+            continue
+        chat['messages'].append({
+            field: record[field] for field in ('content', 'role', 'tool_calls', 'tool_responses', 'elapsed', 'latency') if field in record
+        } | {'name': record.get('agent')})
+
+    # Chats of a run that stopped before they finished
+    yield from chats.values()
+
+def parse_history(path: str):
+    """
+    Yields the chats of a Chat History file, in either format.
+    """
+    if path.endswith('.txt'):
+        return parse_txt(path)
+    return parse_jsonl(path)
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def decision_call(message: dict) -> dict:
+    # The arguments of a send_opinion or insert_summary call in the message, if any
+    for call in message.get('tool_calls') or []:
+        function = call.get('function', {})
+        if function.get('name') in decisionTools:
+            try:
+                arguments = json.loads(function.get('arguments') or '{}')
+            except json.JSONDecodeError:
+                arguments = {}
+            return {'tool': function['name'], **arguments}
+    return None
+
+def extract_reports(chat: dict) -> list:
+    """
+    Turns a chat into its reports: every message whose content starts with '###', together with the decision
+    the agent sent to the database in the same or a later message of the chat.
+
+    :return: A list of report dictionaries with the date, ticker, model, version, chat, agent, decision, price,
+        position, positionsize, the report text and the content sent to the database.
+    """
+    messages = chat['messages']
+    reports = []
+    for i, message in enumerate(messages):
+        content = message.get('content')
+        if not isinstance(content, str) or not content.lstrip().startswith('###'):
+            continue
+
+        call = next((found for found in map(decision_call, messages[i:]) if found is not None), None) or {}
+        agent = call.get('agent') or ('MDmanager' if call.get('tool') == 'insert_summary' else message.get('name'))
+        decision = call.get('decision')
+        reports.append({
+            'date': chat.get('date') or call.get('date'),
+            'ticker': chat.get('ticker') or call.get('ticker'),
+            'model': chat.get('model') or call.get('model'),
+            'version': chat.get('version') or call.get('version'),
+            'chat': chat['chat'],
+            'agent': agent,
+            'decision': decision.strip().upper() if isinstance(decision, str) else None,
+            'price': to_number(call.get('price')),
+            'position': call.get('position'),
+            'positionsize': to_number(call.get('positionsize')),
+            'report': content.strip(),
+            'opinion': call.get('content'),
+        })
+    return reports
+
+def parse_reports(path: str):
+    """
+    Yields the reports of a Chat History file, one chat at a time.
+    """
+    for chat in parse_history(path):
+        yield from extract_reports(chat)
+
+def file_debates(path: str) -> set:
+    """
+    :return: The (date, ticker, model, version) of the debates in a Chat History file. A transcript rotated by date
+        holds every debate of its day, so its records are read.
+    """
+    meta = parse_filename(path)
+    if meta['ticker'] is not None:
+        return {(meta['date'], meta['ticker'], meta['model'], meta['version'])}
+    try:
+        return {(record.get('date'), record.get('ticker'), record.get('model'), record.get('version'))
+                for record in read_transcript(path)}
+    except (OSError, EOFError) as e:
+        # E.g. a gzip transcript that is still being written, listed so it is picked up once it is complete
+        print(f"Could not read the debates of {path}: {e}")
+        return {path}
+
+def history_files(folder: str = historyFolder) -> list:
+    """
+    :return: The Chat History files in the folder, newest date first. A debate stored in more than one file
+        (CHAT_HISTORY_FORMAT=both, with either TRANSCRIPT_ROTATION) is listed once, preferring the transcript
+        (see formatPreference): a file is left out when all of its debates are in a file of a preferred format.
+    """
+    if not os.path.exists(folder):
+        return []
+
+    files = []
+    for name in os.listdir(folder):
+        meta = parse_filename(name)
+        if meta is not None:
+            files.append((formatPreference.index(meta['format']), name))
+
+    covered = set()
+    listed = []
+    for _, name in sorted(files):
+        debates = file_debates(os.path.join(folder, name))
+        if not debates <= covered:
+            listed.append(name)
+            covered |= debates
+    return [os.path.join(folder, name) for name in sorted(listed, reverse=True)]
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+from openai.types.chat import ChatCompletion
+
+load_dotenv()
+
+# 'off' => every request goes to the model (default), 'on' => LLM completions are cached on disk and reused for identical requests
+llmCacheMode = os.getenv('LLM_CACHE', 'off').lower()
+llmCacheFile = os.path.join('LLMCache', 'completions.sqlite')
+llmCacheMaxMB = float(os.getenv('LLM_CACHE_MAX_MB', 512))
+
+class SQLiteCache:
+    """
+    Content-addressed cache of model completions for AutoGen (pass it as cache= to initiate_chat or client.create).
+    AutoGen keys each request on its full parameters: the model, temperature, the message list and the tool schema.
+    The least recently used entries are evicted once the cache grows past max_bytes. Completions are stored as JSON,
+    so reading the cache file never runs code.
+    """
+
+    def __init__(self, path: str = llmCacheFile, max_bytes: int = int(llmCacheMaxMB * 1024 * 1024)):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+        # One connection shared by the parallel analyst chats, every access holds the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def digest(key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def dumps(value) -> str:
+        """
+        :return: The value as JSON. Raises TypeError or ValueError if it is neither a ChatCompletion nor plain JSON.
+        """
+        if isinstance(value, ChatCompletion):
+            # AutoGen adds cost (kept) and the message_retrieval_function, config_id and pass_filter of the request (not kept)
+            data = value.model_dump(mode='json', exclude={'message_retrieval_function', 'config_id', 'pass_filter'})
+            return json.dumps({'type': 'ChatCompletion', 'value': data})
+        return json.dumps({'type': 'json', 'value': value})
+
+    @staticmethod
+    def loads(text):
+        entry = json.loads(text)
+        if entry['type'] == 'ChatCompletion':
+            return ChatCompletion.model_validate(entry['value'])
+        return entry['value']
+
+    def get(self, key: str, default=None):
+        digest = self.digest(key)
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM completions WHERE key = ?", (digest,)).fetchone()
+            if row is not None:
+                try:
+                    value = self.loads(row[0])
+                except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+                    # An entry that isn't our JSON (e.g. a pickle of an older cache file) is dropped and requested again
+                    self.conn.execute("DELETE FROM completions WHERE key = ?", (digest,))
+                    self.conn.commit()
+                    row = None
+            if row is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), digest))
+            self.conn.commit()
+        return value
+
+    def set(self, key: str, value) -> None:
+        try:
+            blob = self.dumps(value)
+        except (TypeError, ValueError) as e:
+            print(f"LLM response not cached: {e}")
+            return
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (self.digest(key), blob, len(blob), time.time())
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        # Called with the lock held
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM completions ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+        self.evicted += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM completions")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted, 'entries': entries, 'bytes': size}
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    # AutoGen opens the cache with a with-block around every request, so leaving the block keeps the connection open
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        return None
+
+# Shared by every chat of a run, None unless LLM_CACHE=on
+llmCache = SQLiteCache() if llmCacheMode == 'on' else None
@@ -0,0 +1,157 @@
+import os
+import json
+import threading
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'full' => gather_csv returns every row and column (default), 'compact' => its payloads are trimmed to the calling agent's token budget
+payloadMode = os.getenv('PAYLOAD_MODE', 'full').lower()
+
+# Tokens a single gather_csv result may use, per agent
+defaultTokenBudget = int(os.getenv('TOKEN_BUDGET', 1500))
+agentTokenBudgets = {
+    'MDnewsAnalyst': 2500,
+    'MDnrelAnalyst': 3000,
+}
+
+# Columns kept per folder, as name prefixes. A folder without a whitelist (or where none of them match) keeps every column.
+folderColumns = {
+    'HistoricalData': ['Date', 'Open', 'Close', 'Volume'],
+    'Financial Analytics Metrics': [
+        'currentPrice', 'targetHighPrice', 'targetLowPrice', 'targetMeanPrice', 'targetMedianPrice', 'totalRevenue',
+        'revenueGrowth', 'earningsGrowth', 'grossMargins', 'operatingMargins', 'profitMargins', 'returnOnAssets',
+        'returnOnEquity', 'debtToEquity', 'currentRatio', 'totalCash', 'totalDebt', 'freeCashflow',
+    ],
+    'Trend Indicator Scores': [
+        'period', 'endDate', 'growth', 'earningsEstimate_avg', 'earningsEstimate_growth', 'revenueEstimate_avg',
+        'revenueEstimate_growth', 'epsTrend_current', 'epsTrend_30daysAgo', 'epsTrend_90daysAgo',
+    ],
+    'Key Statistics': [
+        'enterpriseValue', 'forwardPE', 'trailingEps', 'forwardEps', 'pegRatio', 'priceToBook', 'beta', 'profitMargins',
+        'earningsQuarterlyGrowth', 'shortRatio', 'heldPercentInsiders', 'heldPercentInstitutions', '52WeekChange',
+        'enterpriseToRevenue', 'enterpriseToEbitda',
+    ],
+    'News': ['Title', 'Short Description', 'Publishing Date'],
+}
+
+# Newest rows kept per folder, and per agent where an agent needs a longer window
+folderRowWindows = {
+    'HistoricalData': 30,
+    'News': 15,
+}
+agentRowWindows = {
+    # MDnrelAnalyst matches news articles with the price on their publishing date
+    'MDnrelAnalyst': {'HistoricalData': 60},
+}
+
+maxTextLength = 300
+dateColumns = ['Date', 'Publishing Date']
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with tiktoken, or estimates them (4 characters per token) if the encoding can't be loaded.
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                # The encoding is downloaded on first use, which fails offline
+                _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4
+
+def payload_text(payload) -> str:
+    # The text the agent receives, AutoGen serializes a tool's result with json.dumps
+    return json.dumps(payload, ensure_ascii=False)
+
+def round_value(value):
+    if isinstance(value, float):
+        if pd.isna(value):
+            return None
+        return round(value, 2) if abs(value) >= 1 else float(f"{value:.3g}")
+    if isinstance(value, str) and len(value) > maxTextLength:
+        return value[:maxTextLength] + '...'
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%d-%m-%Y')
+    return value
+
+def select_columns(df: pd.DataFrame, folder: str) -> pd.DataFrame:
+    prefixes = folderColumns.get(folder)
+    if not prefixes:
+        return df
+    columns = [column for column in df.columns if column.startswith(tuple(prefixes))]
+    return df[columns] if columns else df
+
+def newest_rows(df: pd.DataFrame, rows: int) -> pd.DataFrame:
+    # Sorted oldest to newest by the date column, so the window keeps the newest rows
+    for column in dateColumns:
+        if column in df.columns:
+            dates = pd.to_datetime(df[column], format='%d-%m-%Y', errors='coerce')
+            df = df.iloc[dates.argsort(kind='stable')]
+            break
+    return df.tail(rows)
+
+def encode(df: pd.DataFrame):
+    """
+    Columnar encoding: the column names are sent once instead of once per row. A single row is sent as a flat record.
+    """
+    rows = [[round_value(value) for value in row] for row in df.itertuples(index=False, name=None)]
+    if len(rows) == 1:
+        return dict(zip(df.columns, rows[0]))
+    return {'columns': list(df.columns), 'rows': rows}
+
+def compact_payload(df: pd.DataFrame, folder: str, agent: str = None, records: list = None) -> tuple:
+    """
+    Compacts a data folder's dataframe for an agent: whitelisted columns, the newest rows, rounded numbers and a
+    columnar encoding. The row window is halved until the payload fits the agent's token budget.
+
+    :param df: The dataframe as stored for the folder.
+    :param folder: The data folder, e.g. 'HistoricalData'.
+    :param agent: The calling agent, selects the token budget and row windows.
+    :param records: The records PAYLOAD_MODE=full sends for the folder, built from df if None.
+    :return: (payload, tokens before, tokens after), both token counts of the JSON text the agent receives.
+    """
+    if records is None:
+        records = json.loads(df.to_json(orient='records', date_format='iso'))
+    before = count_tokens(payload_text(records))
+    budget = agentTokenBudgets.get(agent, defaultTokenBudget)
+    rows = agentRowWindows.get(agent, {}).get(folder, folderRowWindows.get(folder, len(df)))
+
+    df = select_columns(df, folder)
+    while True:
+        payload = encode(newest_rows(df, rows))
+        after = count_tokens(payload_text(payload))
+        if after <= budget or rows <= 1:
+            return payload, before, after
+        rows = max(1, rows // 2)
+
+class PayloadStats:
+    """
+    Totals of the tokens gather_csv would have sent and did send in a run.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.before = 0
+        self.after = 0
+        self.lock = threading.Lock()
+
+    def add(self, before: int, after: int):
+        with self.lock:
+            self.calls += 1
+            self.before += before
+            self.after += after
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'tokens_before': self.before, 'tokens_after': self.after}
+
+payloadStats = PayloadStats()
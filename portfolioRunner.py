@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from MDInit import run_debate, LLMLimiter, snapshotCache, bufferedWriter, payloadStats, llmCache
+
+load_dotenv()
+
+portfolioWorkers = int(os.getenv('PORTFOLIO_WORKERS', 4)) # number of debates running at the same time
+maxLLMRequests = int(os.getenv('MAX_LLM_REQUESTS', 8)) # number of LLM requests in flight across all debates
+
+def run_job(job: tuple, todaysDate, llm_limiter: LLMLimiter, resume: bool = True) -> dict:
+    """
+    Runs the debate for one (ticker, model, version) job. A failing job is reported, not raised,
+    so it never stops the rest of the portfolio.
+
+    :return: A dictionary with the job, its status and the seconds it took.
+    """
+    ticker, model, version = job
+    start = time.perf_counter()
+    try:
+        run_debate(ticker, model, version, todaysDate, llm_limiter, resume)
+        status, error = "ok", None
+    except Exception as e:
+        print(f"Debate for {ticker} {model} {version} failed: {e}")
+        status, error = "failed", str(e)
+
+    return {
+        "ticker": ticker,
+        "model": model,
+        "version": version,
+        "status": status,
+        "error": error,
+        "seconds": time.perf_counter() - start,
+    }
+
+def run_portfolio(jobs: list, workers: int = portfolioWorkers, max_llm_requests: int = maxLLMRequests, todaysDate=None, resume: bool = True) -> dict:
+    """
+    Runs the debate for every (ticker, model, version) job across a thread pool. Every job builds its own agents,
+    all jobs share one cap on the number of LLM requests in flight.
+
+    :param jobs: A list of (ticker, model, version) tuples.
+    :param workers: The number of debates running at the same time.
+    :param max_llm_requests: The number of LLM requests in flight across all debates.
+    :param todaysDate: Date of the debates, defaults to today.
+    :param resume: If True (default) debates that are already complete are skipped and partial ones resume, see run_debate.
+    :return: A summary with the result of every job and the throughput of the run.
+    """
+    todaysDate = todaysDate or date.today()
+    llm_limiter = LLMLimiter(max_llm_requests)
+    if bufferedWriter is not None:
+        bufferedWriter.recover()
+
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job, todaysDate, llm_limiter, resume) for job in jobs]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    # Rows an agent sent with a date or ticker that didn't match its debate are written here
+    if bufferedWriter is not None:
+        bufferedWriter.flush()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "jobs": results,
+        "completed": sum(result["status"] == "ok" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "seconds": elapsed,
+        "jobs_per_minute": len(results) / elapsed * 60 if elapsed else 0.0,
+        "llm_requests": llm_limiter.calls,
+    }
+
+def print_summary(summary: dict):
+    for result in sorted(summary["jobs"], key=lambda result: result["seconds"]):
+        print(f"{result['ticker']} {result['model']} {result['version']}: {result['status']} in {result['seconds']:.1f}s")
+    print(f"{summary['completed']} completed, {summary['failed']} failed in {summary['seconds']:.1f}s "
+          f"({summary['jobs_per_minute']:.2f} debates/min, {summary['llm_requests']} LLM requests)")
+    print(f"Data snapshot cache: {snapshotCache.stats()}")
+    print(f"gather_csv payloads: {payloadStats.stats()}")
+    if llmCache is not None:
+        print(f"LLM cache: {llmCache.stats()}")
+    if bufferedWriter is not None:
+        print(f"Buffered writes: {bufferedWriter.stats()}")
+
+if __name__ == "__main__":
+    # python portfolioRunner.py TSLA MSFT NVDA:MISTRAL:V1 => TICKER or TICKER:MODEL:VERSION, the model and version default to GPT3.5 and V2
+    # add --rerun to run completed debates again instead of skipping them
+    args = [arg for arg in sys.argv[1:] if arg != "--rerun"]
+    resume = "--rerun" not in sys.argv[1:]
+
+    jobs = []
+    for arg in args or ["TSLA", "MSFT", "NVDA", "META"]:
+        parts = arg.split(":")
+        model = parts[1] if len(parts) > 1 else "GPT3.5"
+        version = parts[2] if len(parts) > 2 else "V2"
+        jobs.append((parts[0].upper(), model, version))
+
+    print_summary(run_portfolio(jobs, resume=resume))
@@ -1,68 +1,260 @@
-import psycopg2
-import os
 from dotenv import load_dotenv
+from dbPool import get_connection, close_pool
 
 load_dotenv()
 
 # POSTGRES DB
 
-con = psycopg2.connect(
-    host= os.getenv('DATABASE_HOST'), port= os.getenv('DATABASE_PORT'),
-    database= os.getenv('DATABASE_NAME'), user= os.getenv('DATABASE_USER'), password= os.getenv('DATABASE_PASSWORD'))
-
-cur = con.cursor()
-
-cur.execute("""
-    CREATE TABLE IF NOT EXISTS mdmemory (
-        id SERIAL PRIMARY KEY,
-        date DATE NOT NULL,
-        ticker VARCHAR(10) NOT NULL,
-        model VARCHAR(255) NOT NULL,
-        version VARCHAR(10) NOT NULL,
-        content TEXT NOT NULL,
-        decision VARCHAR(15) NOT NULL,
-        price VARCHAR(25) NOT NULL,  
-        position BOOL NOT NULL, 
-        positionSize VARCHAR(50) NOT NULL    
-    )
-""")
-
-cur.execute("""
-    CREATE TABLE IF NOT EXISTS mddebate (
-        id SERIAL PRIMARY KEY,
-        key VARCHAR(10) NOT NULL,
-        date DATE NOT NULL,
-        ticker VARCHAR(10) NOT NULL,
-        agent VARCHAR(20) NOT NULL,
-        model VARCHAR(255) NOT NULL,
-        version VARCHAR(10) NOT NULL,
-        content TEXT NOT NULL,
-        decision VARCHAR(15) NOT NULL,
-        price VARCHAR(25) NOT NULL,    
-        position BOOL NOT NULL, 
-        positionSize VARCHAR(50) NOT NULL    
-    )
-""")
-
-def insert_summary(date, ticker, model, version, content, decision, price, position, positionsize):
+# Trading decisions are stored as an enum, so vote counts are plain GROUP BY queries
+decisions = ('BUY', 'SELL', 'HOLD')
+
+def create_types(cur):
+    cur.execute("""
+        DO $$ BEGIN
+            CREATE TYPE trade_decision AS ENUM (%s);
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+    """ % ', '.join(f"'{decision}'" for decision in decisions))
+
+def create_tables(cur):
+    create_types(cur)
+
+    # price stays NULL until the first trading day, the first entries HOLD no shares (see insert_first_entries)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mdmemory (
+            id SERIAL PRIMARY KEY,
+            date DATE NOT NULL,
+            ticker VARCHAR(10) NOT NULL,
+            model VARCHAR(255) NOT NULL,
+            version VARCHAR(10) NOT NULL,
+            content TEXT NOT NULL,
+            decision trade_decision NOT NULL,
+            price NUMERIC(14, 4),
+            position BOOL NOT NULL,
+            positionSize NUMERIC(14, 4) NOT NULL
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mddebate (
+            id SERIAL PRIMARY KEY,
+            key INTEGER NOT NULL,
+            date DATE NOT NULL,
+            ticker VARCHAR(10) NOT NULL,
+            agent VARCHAR(20) NOT NULL,
+            model VARCHAR(255) NOT NULL,
+            version VARCHAR(10) NOT NULL,
+            content TEXT NOT NULL,
+            decision trade_decision NOT NULL,
+            price NUMERIC(14, 4),
+            position BOOL NOT NULL,
+            positionSize NUMERIC(14, 4) NOT NULL
+        )
+    """)
+
+    # Shadow table for consensus.backfill_consensus, so re-derived decisions can be compared with mdmemory before replacing them
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mdconsensus (
+            id SERIAL PRIMARY KEY,
+            date DATE NOT NULL,
+            ticker VARCHAR(10) NOT NULL,
+            model VARCHAR(255) NOT NULL,
+            version VARCHAR(10) NOT NULL,
+            content TEXT NOT NULL,
+            decision trade_decision NOT NULL,
+            price NUMERIC(14, 4),
+            position BOOL NOT NULL,
+            positionSize NUMERIC(14, 4) NOT NULL,
+            buy_votes INTEGER NOT NULL,
+            sell_votes INTEGER NOT NULL,
+            hold_votes INTEGER NOT NULL,
+            UNIQUE (ticker, model, version, date)
+        )
+    """)
+
+# Backfill expressions for the typed migration, they parse the strings the agents used to send
+# ('$172.50', '172.5', '35 shares', 'BUY MORE'). They give NULL for a value that doesn't parse.
+numberExpression = r"""
+    CASE WHEN regexp_replace({column}, '[^0-9.-]', '', 'g') ~ '^-?[0-9]+(\.[0-9]+)?$'
+        THEN regexp_replace({column}, '[^0-9.-]', '', 'g')::numeric END
+"""
+
+integerExpression = """
+    CASE WHEN trim({column}) ~ '^[0-9]+$' THEN trim({column})::integer END
+"""
+
+# 'BUY MORE' counts as BUY and 'NON-ACTION' (do nothing) as HOLD
+decisionExpression = """
+    CASE
+        WHEN upper(trim({column})) LIKE 'BUY%' THEN 'BUY'
+        WHEN upper(trim({column})) LIKE 'SELL%' THEN 'SELL'
+        WHEN upper(trim({column})) IN ('HOLD', 'NON-ACTION') THEN 'HOLD'
+    END::trade_decision
+"""
+
+# The first entries were stored with '-' for the values they didn't have yet
+placeholders = ('', '-')
+placeholderList = ', '.join(f"'{value}'" for value in placeholders)
+
+typedColumns = [
+    # (table, column, type, backfill expression, value of a placeholder, NOT NULL)
+    ('mdmemory', 'decision', 'trade_decision', decisionExpression, "'HOLD'", True),
+    ('mdmemory', 'price', 'NUMERIC(14, 4)', numberExpression, 'NULL', False),
+    ('mdmemory', 'positionsize', 'NUMERIC(14, 4)', numberExpression, '0', True),
+    ('mddebate', 'key', 'INTEGER', integerExpression, 'NULL', True),
+    ('mddebate', 'decision', 'trade_decision', decisionExpression, "'HOLD'", True),
+    ('mddebate', 'price', 'NUMERIC(14, 4)', numberExpression, 'NULL', False),
+    ('mddebate', 'positionsize', 'NUMERIC(14, 4)', numberExpression, '0', True),
+]
+
+def column_type(cur, table: str, column: str) -> str:
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    result = cur.fetchone()
+    return result[0] if result else None
+
+def column_nullable(cur, table: str, column: str) -> bool:
+    cur.execute("""
+        SELECT is_nullable = 'YES' FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    result = cur.fetchone()
+    return bool(result and result[0])
+
+def conversion(column: str, expression: str, placeholder: str) -> str:
+    # The typed value of a stored string, a placeholder ('-') becomes the column's placeholder value
+    return f"CASE WHEN trim({column}) IN ({placeholderList}) THEN {placeholder} ELSE {expression.format(column=column)} END"
+
+def unconvertible_rows(cur, table: str, column: str, expression: str, placeholder: str, not_null: bool) -> list:
+    """
+    :return: The (id, value) of every row whose stored value doesn't parse, or would leave a NOT NULL column empty.
+    """
+    cur.execute(f"""
+        SELECT id, {column} FROM {table}
+        WHERE ({conversion(column, expression, placeholder)}) IS NULL
+            AND ({'TRUE' if not_null else 'FALSE'} OR trim(coalesce({column}, '')) NOT IN ({placeholderList}))
+        ORDER BY id
+    """)
+    return cur.fetchall()
+
+def migrate_types(cur):
+    """
+    Converts the VARCHAR price, positionSize, key and decision columns of an existing database
+    to typed columns, parsing the stored strings. Columns that are already typed are left alone.
+    Nothing is converted if a stored value doesn't parse: the rows are listed and ValueError is raised,
+    so they can be fixed before rerunning.
+    """
+    create_types(cur)
+    pending = [entry for entry in typedColumns if column_type(cur, entry[0], entry[1]) == 'character varying']
+
+    failed = 0
+    for table, column, sqltype, expression, placeholder, not_null in pending:
+        for row_id, value in unconvertible_rows(cur, table, column, expression, placeholder, not_null):
+            print(f"{table}.{column} of row {row_id} can't be converted to {sqltype}: {value!r}")
+            failed += 1
+    if failed:
+        raise ValueError(f"{failed} stored values can't be converted, fix or remove the rows listed above and rerun postgresSetup.py.")
+
+    for table, column, sqltype, expression, placeholder, not_null in pending:
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL")
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {sqltype} USING {conversion(column, expression, placeholder)}")
+        if not_null:
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        print(f"Converted {table}.{column} to {sqltype}")
+
+    # Databases converted while decision was still nullable, the rows it was emptied on can't be recovered here
+    for table, column, sqltype, expression, placeholder, not_null in typedColumns:
+        if not not_null or not column_nullable(cur, table, column):
+            continue
+        cur.execute(f"SELECT id FROM {table} WHERE {column} IS NULL ORDER BY id")
+        empty = [row[0] for row in cur.fetchall()]
+        if empty:
+            print(f"{table}.{column} stays nullable, it is empty on rows {', '.join(map(str, empty))}")
+        else:
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+
+# The columns that identify a row, one summary per (date, ticker, model, version) and one opinion per agent of it
+uniqueKeys = {
+    'mdmemory': ['date', 'ticker', 'model', 'version'],
+    'mddebate': ['date', 'ticker', 'model', 'version', 'agent'],
+}
+
+def move_duplicates(cur, table: str) -> int:
+    """
+    Moves the older rows of every duplicated key of table into {table}_duplicates, so the unique index can be
+    created without losing them. The newest row (highest id) of each key stays in the table.
+
+    :return: The number of rows moved.
+    """
+    match = ' AND '.join(f"a.{column} = b.{column}" for column in uniqueKeys[table])
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table} a JOIN {table} b ON {match} AND a.id < b.id)")
+    if not cur.fetchone()[0]:
+        return 0
+
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {table}_duplicates (LIKE {table})")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {table} a USING {table} b
+            WHERE {match} AND a.id < b.id
+            RETURNING a.*
+        )
+        INSERT INTO {table}_duplicates SELECT * FROM moved
+    """)
+    print(f"Moved {cur.rowcount} duplicate rows from {table} to {table}_duplicates, the newest row of each "
+          f"({', '.join(uniqueKeys[table])}) is kept")
+    return cur.rowcount
+
+def migrate(cur):
+    """
+    Brings an existing database up to date, safe to run any number of times.
+    Duplicate rows are moved to mdmemory_duplicates/mddebate_duplicates before the unique indexes are created
+    (the newest row is kept).
+    """
+    for table in uniqueKeys:
+        move_duplicates(cur, table)
+
+    migrate_types(cur)
+
+    # Serves get_summary: WHERE ticker, model, version ORDER BY date DESC LIMIT 1, and the insert_summary upsert
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS mdmemory_summary_key
+        ON mdmemory (ticker, model, version, date)
+    """)
+
+    # Serves get_opinions: WHERE date, ticker, model, and the send_opinion upsert
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS mddebate_opinion_key
+        ON mddebate (date, ticker, model, version, agent)
+    """)
+
+def insert_summary(cur, date, ticker, model, version, content, decision, price, position, positionsize):
     cur.execute("""
         INSERT INTO mdmemory (date, ticker, model, version, content, decision, price,  position, positionsize)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (ticker, model, version, date) DO NOTHING
     """, (date, ticker, model, version, content, decision, price, position, positionsize))
-    con.commit()
 
-insert_summary("2024-03-12", "TSLA", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
-insert_summary("2024-03-12", "TSLA", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
+def insert_first_entries(cur):
+    insert_summary(cur, "2024-03-12", "TSLA", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
+    insert_summary(cur, "2024-03-12", "TSLA", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
+
+    insert_summary(cur, "2024-03-12", "MSFT", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
+    insert_summary(cur, "2024-03-12", "MSFT", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
 
-insert_summary("2024-03-12", "MSFT", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
-insert_summary("2024-03-12", "MSFT", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
+    insert_summary(cur, "2024-03-12", "NVDA", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
+    insert_summary(cur, "2024-03-12", "NVDA", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
 
-insert_summary("2024-03-12", "NVDA", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
-insert_summary("2024-03-12", "NVDA", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
+    insert_summary(cur, "2024-03-12", "META", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
+    insert_summary(cur, "2024-03-12", "META", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "HOLD", None, False, 0)
 
-insert_summary("2024-03-12", "META", "GPT3.5", "V1", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
-insert_summary("2024-03-12", "META", "GPT3.5", "V2", "This is the first data entry. The database is waiting for your first day investing", "-", "-", "False", "0")
-con.commit()
+if __name__ == "__main__":
+    # The connection comes from the same pool the MDInit.py tools use, it is committed when the block ends
+    with get_connection() as con:
+        with con.cursor() as cur:
+            create_tables(cur)
+            migrate(cur)
+            insert_first_entries(cur)
 
-cur.close()
-con.close()
\ No newline at end of file
+    close_pool()
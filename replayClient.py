@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+from dotenv import load_dotenv
+from openai.types.chat import ChatCompletion
+from historyParser import parse_history
+
+load_dotenv()
+
+# The config_list of LLM_BACKEND=replay in MDInit.py, AutoGen hands every request of the agents to ReplayClient
+replayConfigList = [{"model": "replay", "model_client_cls": "ReplayClient"}]
+
+# The Chat History file (.txt or .jsonl) whose tool calls are replayed, empty => the built-in script of every agent
+replayHistory = os.getenv('REPLAY_HISTORY', '')
+
+# Seconds every replayed completion waits, to stand in for the model's latency (0 => as fast as possible)
+replayLatency = float(os.getenv('REPLAY_LATENCY', 0))
+
+replayAgents = ["MDfinAnalyst", "MDnewsAnalyst", "MDnrelAnalyst", "MDtserAnalyst", "MDearnAnalyst", "MDkeyAnalyst", "MDmanager"]
+
+# The data each analyst's task asks for after get_summary and gather_price, see the tasks in MDInit.py
+agentTools = {
+    "MDfinAnalyst": [("gather_csv", {"folder": "Financial Analytics Metrics"}), ("gather_features", {})],
+    "MDnewsAnalyst": [("gather_csv", {"folder": "News"}), ("gather_csv", {"folder": "Trend Indicator Scores"}), ("gather_csv", {"folder": "ESGScores"})],
+    "MDnrelAnalyst": [("gather_csv", {"folder": "News"}), ("gather_csv", {"folder": "HistoricalData"})],
+    "MDtserAnalyst": [("gather_timeseries", {}), ("gather_features", {})],
+    "MDearnAnalyst": [("gather_csv", {"folder": "Trend Indicator Scores"}), ("gather_csv", {"folder": "EarningsData"})],
+    "MDkeyAnalyst": [("gather_csv", {"folder": "Key Statistics"}), ("gather_csv", {"folder": "Financial Analytics Metrics"})],
+}
+
+# The tool arguments that are replaced with the values of the debate being run
+contextArguments = {"ticker": "ticker", "model": "model", "version": "version", "date": "todaysDate"}
+
+_recorded = {}
+
+def tool_call(name: str, arguments: dict) -> dict:
+    return {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+def replay_decision(agent: str, context: dict) -> str:
+    # The same agent gives the same decision for the same debate, so the votes of a run are reproducible
+    digest = hashlib.sha256(f"{agent}_{context['ticker']}_{context['todaysDate']}".encode('utf-8')).digest()
+    return ("BUY", "SELL", "HOLD")[digest[0] % 3]
+
+def synthetic_script(agent: str, context: dict) -> list:
+    """
+    :return: The turns of an agent following its task: the tool calls, the report with its send_opinion (or
+        insert_summary) call, then TERMINATE.
+    """
+    ticker, model, version, day = context["ticker"], context["model"], context["version"], str(context["todaysDate"])
+    decision = replay_decision(agent, context)
+
+    if agent == "MDmanager":
+        report = f"### Todays Decision: {decision}\n### Replayed summary of the {ticker} debate."
+        return [
+            {"content": None, "tool_calls": [tool_call("get_opinions", {"date": day, "ticker": ticker, "model": model})]},
+            {"content": report, "tool_calls": [tool_call("insert_summary", {
+                "date": day, "ticker": ticker, "model": model, "version": version, "content": report,
+                "decision": decision, "price": None, "position": decision != "SELL", "positionsize": 100 if decision == "BUY" else 0,
+            })]},
+            {"content": "TERMINATE"},
+        ]
+
+    data = [tool_call(name, {"ticker": ticker, **arguments}) for name, arguments in agentTools.get(agent, [])]
+    report = (f"### Last trading days position: {decision != 'SELL'}\n### Today's Opening Price: see gather_price\n\n"
+              f"### Insights: replayed report of {agent} on {ticker}.\n### Decision: {decision}\n### End-of-Day Position Size: 100")
+    return [
+        {"content": None, "tool_calls": [tool_call("get_summary", {"ticker": ticker, "model": model, "version": version}),
+                                         tool_call("gather_price", {"ticker": ticker})]},
+        {"content": None, "tool_calls": data},
+        {"content": report, "tool_calls": [tool_call("send_opinion", {
+            "key": 1, "date": day, "ticker": ticker, "agent": agent, "model": model, "version": version,
+            "content": f"Replayed opinion of {agent}.", "decision": decision, "price": None,
+            "position": decision != "SELL", "positionsize": 100 if decision != "SELL" else 0,
+        })]},
+        {"content": "TERMINATE"},
+    ]
+
+def chat_agent(chat: dict, turns: list) -> str:
+    # The agent of a recorded chat: named in the transcript, by the decision it sent, or by the chat's place in the run
+    for message in turns:
+        if message.get("name"):
+            return message["name"]
+        for call in message.get("tool_calls") or []:
+            name = call.get("function", {}).get("name")
+            if name == "insert_summary":
+                return "MDmanager"
+            if name == "send_opinion":
+                try:
+                    return json.loads(call["function"].get("arguments") or "{}").get("agent")
+                except json.JSONDecodeError:
+                    pass
+    index = chat.get("chat")
+    # The .txt histories count the chats from 0, the transcripts by chat_id from 1
+    if isinstance(index, int) and chat.get("format") == "jsonl":
+        index -= 1
+    return replayAgents[index] if isinstance(index, int) and 0 <= index < len(replayAgents) else None
+
+def recorded_scripts(path: str) -> dict:
+    """
+    Reads the turns of every agent from a Chat History file: the messages the agent sent, without the
+    tool responses and the replies of the user_proxy.
+
+    :return: A dictionary with the turns by agent name.
+    """
+    if path in _recorded:
+        return _recorded[path]
+
+    scripts = {}
+    for chat in parse_history(path):
+        messages = chat["messages"]
+        if any(message.get("name") for message in messages):
+            turns = [message for message in messages if message.get("name") not in (None, "user_proxy") and message.get("role") != "tool"]
+        else:
+            # The .txt histories are the user_proxy's side of the chat, the agent's messages are 'user' or carry its tool calls
+            turns = [message for message in messages[1:] if not message.get("tool_responses")
+                     and (message.get("tool_calls") or message.get("role") == "user")]
+        agent = chat_agent(chat, turns)
+        # A transcript rotated by date holds several debates, the first chat of each agent is replayed
+        if agent and turns and agent not in scripts:
+            scripts[agent] = [{"content": message.get("content") or None, "tool_calls": message.get("tool_calls") or None} for message in turns]
+
+    _recorded[path] = scripts
+    return scripts
+
+def rewrite_call(call: dict, agent: str, context: dict) -> dict:
+    # A recorded call runs for the ticker, model, version and date of this debate
+    try:
+        arguments = json.loads(call["function"].get("arguments") or "{}")
+    except json.JSONDecodeError:
+        return call
+    for argument, key in contextArguments.items():
+        if argument in arguments:
+            arguments[argument] = str(context[key])
+    if "agent" in arguments:
+        arguments["agent"] = agent
+    return tool_call(call["function"]["name"], arguments)
+
+def replay_script(agent: str, context: dict = None) -> list:
+    """
+    :return: The turns ReplayClient answers the agent's requests with, from REPLAY_HISTORY when the agent is in it.
+    """
+    if context is None or agent not in replayAgents:
+        return []
+    if replayHistory:
+        turns = recorded_scripts(replayHistory).get(agent)
+        if turns:
+            return [{"content": turn["content"], "tool_calls": [rewrite_call(call, agent, context) for call in turn["tool_calls"]] or None}
+                    if turn["tool_calls"] else turn for turn in turns]
+    return synthetic_script(agent, context)
+
+def newest_price(messages: list):
+    # The opening price gather_price returned earlier in the chat, for the calls that leave the price open
+    for message in reversed(messages):
+        if message.get("role") == "tool" and "newest_open_price" in str(message.get("content")):
+            try:
+                return json.loads(message["content"]).get("newest_open_price")
+            except (json.JSONDecodeError, TypeError):
+                return None
+    return None
+
+class ReplayClient:
+    """
+    Scripted stand-in for the model, following AutoGen's ModelClient protocol. The n-th request of an agent in a chat
+    is answered with the n-th turn of its script (see replay_script), once the script is done every request is
+    answered with TERMINATE. With narrative=True every request gets the summary text of MANAGER_MODE=narrative instead.
+    No request leaves the process.
+    """
+
+    def __init__(self, config: dict, agent: str = None, context: dict = None, narrative: bool = False, latency: float = None):
+        self.model = config.get("model", "replay")
+        self.agent = agent
+        self.context = context
+        self.narrative = narrative
+        self.script = [] if narrative else replay_script(agent, context)
+        self.latency = replayLatency if latency is None else latency
+
+    def create(self, params: dict) -> ChatCompletion:
+        if self.latency:
+            time.sleep(self.latency)
+
+        messages = params.get("messages", [])
+        # The agent's earlier turns in this chat are its 'assistant' messages, so a rerun of the chat replays from the start
+        step = sum(1 for message in messages if message.get("role") == "assistant")
+
+        if self.narrative:
+            turn = {"content": f"Replayed summary of the {self.context['ticker'] if self.context else ''} debate."}
+        elif step < len(self.script):
+            turn = self.script[step]
+        else:
+            turn = {"content": "TERMINATE"}
+
+        calls = []
+        for call in turn.get("tool_calls") or []:
+            arguments = json.loads(call["function"]["arguments"])
+            if "price" in arguments and arguments["price"] is None:
+                arguments["price"] = newest_price(messages)
+                call = {**call, "function": {**call["function"], "arguments": json.dumps(arguments)}}
+            calls.append(call)
+
+        return ChatCompletion.model_validate({
+            "id": f"replay-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "tool_calls" if calls else "stop",
+                "message": {"role": "assistant", "content": turn.get("content"), "tool_calls": calls or None},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def message_retrieval(self, response: ChatCompletion) -> list:
+        return [choice.message if choice.message.tool_calls else choice.message.content for choice in response.choices]
+
+    def cost(self, response: ChatCompletion) -> float:
+        return 0.0
+
+    @staticmethod
+    def get_usage(response: ChatCompletion) -> dict:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0, "model": response.model}
@@ -0,0 +1,265 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import functools
+import contextlib
+from datetime import date
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Read by MDInit.py and llmCache.py when they are imported: every request goes to ReplayClient, none is answered from the cache
+os.environ['LLM_BACKEND'] = 'replay'
+os.environ['LLM_CACHE'] = 'off'
+
+import logging
+import autogen
+import dbPool
+import dataStore
+import replayClient
+import transcriptWriter
+import MDInit
+from dbPool import get_connection, close_pool
+from dbWriter import writeMode
+from historyParser import historyFolder, history_files
+from postgresSetup import create_tables, migrate
+
+# AutoGen logs every client it creates with a custom model client, a few hundred lines per run
+logging.getLogger('autogen.oai.client').setLevel(logging.WARNING)
+
+# Replayed debates are stored under their own version, in a schema of their own (like benchmarks/dbBenchmark.py) of
+# REPLAY_DATABASE_URL, or of the database of .env if it isn't set, so the tables of real debates are never written to
+replayVersion = 'REPLAY'
+replaySchema = 'mdreplay'
+replayDatabaseUrl = os.getenv('REPLAY_DATABASE_URL')
+
+# The tool calls that read or write the database, and those that read the data files
+dbTools = ['get_summary', 'send_opinion', 'get_opinions', 'insert_summary']
+dataTools = ['gather_csv', 'gather_price', 'gather_timeseries', 'gather_features']
+
+class StageTimer:
+    """
+    Adds up the seconds spent in each stage of the pipeline by wrapping the functions that make up a stage.
+    The analyst chats run in parallel, so the stages of a run can add up to more than its wall time.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.patched = []
+
+    def add(self, stage: str, seconds: float):
+        with self.lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def wrap(self, owner, attribute: str, stage):
+        """
+        Replaces owner.attribute with a timed version until restore() is called.
+
+        :param stage: The name of the stage, or a function of the call's arguments returning it.
+        """
+        original = getattr(owner, attribute)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage(*args, **kwargs) if callable(stage) else stage, time.perf_counter() - start)
+
+        setattr(owner, attribute, timed)
+        self.patched.append((owner, attribute, original))
+
+    def restore(self):
+        for owner, attribute, original in reversed(self.patched):
+            setattr(owner, attribute, original)
+        self.patched = []
+
+    def reset(self):
+        with self.lock:
+            self.seconds.clear()
+            self.calls.clear()
+
+    def report(self, runs: int) -> list:
+        """
+        :return: One row per stage with its calls, total seconds and milliseconds per call and per run, plus the
+            totals of the database and data file tool calls.
+        """
+        groups = {'db i/o': [f"tool {name}" for name in dbTools], 'csv loading': [f"tool {name}" for name in dataTools]}
+        rows = [(stage, self.calls[stage], self.seconds[stage]) for stage in sorted(self.seconds)]
+        for group, stages in groups.items():
+            found = [stage for stage in stages if stage in self.seconds]
+            if found:
+                rows.append((group, sum(self.calls[stage] for stage in found), sum(self.seconds[stage] for stage in found)))
+        return [{'stage': stage, 'calls': calls, 'seconds': seconds, 'ms_per_call': seconds / calls * 1000,
+                 'ms_per_run': seconds / runs * 1000} for stage, calls, seconds in rows]
+
+def tool_stage(agent, func_call, *args, **kwargs) -> str:
+    return f"tool {func_call.get('name')}"
+
+def instrument(timer: StageTimer):
+    # The stages of run_debate: every completion, tool call, transcript record, checkpoint query and the decision
+    timer.wrap(replayClient.ReplayClient, 'create', 'llm (replay)')
+    timer.wrap(autogen.ConversableAgent, 'execute_function', tool_stage)
+    timer.wrap(dataStore, 'load_frame', 'data file load')
+    timer.wrap(transcriptWriter.TranscriptWriter, 'append', 'transcript')
+    timer.wrap(MDInit, 'build_agents', 'build agents')
+    timer.wrap(MDInit, 'debate_progress', 'checkpoint')
+    timer.wrap(MDInit, 'aggregate_debate', 'decision')
+    timer.wrap(MDInit, 'write_chat_history', 'chat history')
+    if MDInit.bufferedWriter is not None:
+        timer.wrap(MDInit.bufferedWriter, 'flush', 'buffered flush')
+
+def replay_database_config(config: dict) -> dict:
+    """
+    :return: The connection settings of the replay database, with the replay schema as the only search_path.
+    """
+    base = {'dsn': replayDatabaseUrl} if replayDatabaseUrl else dict(config)
+    return {**base, 'options': f"-c search_path={replaySchema}"}
+
+@contextlib.contextmanager
+def replay_database():
+    """
+    Reopens the dbPool pool on the replay schema until the block ends, with the tables of postgresSetup.py created in it.
+    Raises RuntimeError if the connections don't use the replay schema.
+    """
+    config = dbPool.DATABASE_CONFIG
+    close_pool()
+    dbPool.DATABASE_CONFIG = replay_database_config(config)
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {replaySchema}")
+                cur.execute("SELECT current_schema()")
+                schema = cur.fetchone()[0]
+                if schema != replaySchema:
+                    raise RuntimeError(f"The replay connections use schema {schema}, not {replaySchema}")
+                create_tables(cur)
+                migrate(cur)
+        yield
+    finally:
+        close_pool()
+        dbPool.DATABASE_CONFIG = config
+
+def remove_debate(ticker: str, model: str, version: str, todaysDate):
+    if version != replayVersion:
+        raise ValueError(f"Only the {replayVersion} debates are removed, not version {version}")
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for table in ('mddebate', 'mdmemory'):
+                cur.execute(f"DELETE FROM {table} WHERE date = %s AND ticker = %s AND model = %s AND version = %s",
+                            (todaysDate, ticker, model, version))
+        conn.commit()
+
+def run_replay(ticker: str, model: str = 'GPT3.5', version: str = replayVersion, todaysDate=None, runs: int = 10,
+               warmup: int = 1, history: str = None, latency: float = None, cold: bool = False, verbose: bool = False) -> dict:
+    """
+    Runs the full debate (six analyst chats and the decision) runs times against the replay schema (see replay_database),
+    with ReplayClient answering every request. The rows of the debate are overwritten on every run and removed at the end.
+
+    :param history: The Chat History file whose tool calls are replayed, None => the built-in script of every agent.
+    :param latency: Seconds every replayed completion waits, defaults to REPLAY_LATENCY.
+    :param cold: If True the data files are read again on every run, instead of once by the snapshot cache.
+    :param verbose: If True the chats are printed like in a live run.
+    :return: The runs, the chats of the last run, the wall seconds, runs per second and the timings per stage.
+    """
+    if version != replayVersion:
+        raise ValueError(f"Replayed debates are stored under version {replayVersion}, not {version}")
+
+    todaysDate = todaysDate or date.today()
+    replayClient.replayHistory = history or ''
+    if latency is not None:
+        replayClient.replayLatency = latency
+
+    # The transcripts and write journals of the replayed runs are written, and timed, in a folder of their own,
+    # so a crashed replay never leaves a journal for the next real run to recover
+    folder = tempfile.mkdtemp(prefix='replay_')
+    transcripts = transcriptWriter.transcriptFolder
+    transcriptWriter.transcriptFolder = folder
+    if MDInit.bufferedWriter is not None:
+        journals = MDInit.bufferedWriter.folder
+        MDInit.bufferedWriter.folder = os.path.join(folder, 'WriteJournal')
+
+    timer = StageTimer()
+    instrument(timer)
+    sink = None if verbose else open(os.devnull, 'w')
+    walls = []
+    chats = 0
+    try:
+        with replay_database():
+            try:
+                for i in range(warmup + runs):
+                    if cold:
+                        MDInit.snapshotCache.clear()
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(sink) if sink else contextlib.nullcontext():
+                        results = MDInit.run_debate(ticker, model, version, todaysDate, resume=False)
+                    if i < warmup:
+                        timer.reset()
+                    else:
+                        walls.append(time.perf_counter() - start)
+                        chats = len(results)
+            finally:
+                remove_debate(ticker, model, version, todaysDate)
+    finally:
+        timer.restore()
+        if sink:
+            sink.close()
+        transcriptWriter.transcriptFolder = transcripts
+        if MDInit.bufferedWriter is not None:
+            MDInit.bufferedWriter.folder = journals
+        shutil.rmtree(folder, ignore_errors=True)
+
+    seconds = sum(walls)
+    return {
+        'runs': runs,
+        'chats': chats,
+        'seconds': seconds,
+        'runs_per_second': runs / seconds if seconds else 0.0,
+        'ms_per_run': seconds / runs * 1000 if runs else 0.0,
+        'stages': timer.report(runs),
+    }
+
+if __name__ == "__main__":
+    # python replayHarness.py META --runs=20 --warmup=1 --model=GPT3.5 --version=REPLAY --date=2024-04-04
+    #   --history=PATH|synthetic --latency=0.05 --cold --verbose
+    # => replays the debate offline and prints the runs per second and the time spent in every stage.
+    # Without --history the newest file in the Chat History folder is replayed, the built-in scripts if there is none.
+    options = dict(arg[2:].split('=', 1) if '=' in arg else (arg[2:], '1') for arg in sys.argv[1:] if arg.startswith('--'))
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+    history = options.get('history')
+    if history is None:
+        files = history_files(historyFolder) if os.path.isdir(historyFolder) else []
+        history = files[0] if files else None
+    elif history == 'synthetic':
+        history = None
+
+    ticker = args[0] if args else 'META'
+    result = run_replay(
+        ticker,
+        options.get('model', 'GPT3.5'),
+        options.get('version', replayVersion),
+        options.get('date'),
+        runs=int(options.get('runs', 10)),
+        warmup=int(options.get('warmup', 1)),
+        history=history,
+        latency=float(options['latency']) if 'latency' in options else None,
+        cold='cold' in options,
+        verbose='verbose' in options,
+    )
+
+    print(f"Replaying {history or 'the built-in scripts'}, MANAGER_MODE={MDInit.managerMode}, DB_WRITE_MODE={writeMode}")
+    print(f"{ticker}: {result['runs']} runs of {result['chats']} chats in {result['seconds']:.3f}s, "
+          f"{result['runs_per_second']:.2f} runs/s, {result['ms_per_run']:.1f} ms per run")
+    print(f"{'stage':<24}{'calls':>8}{'total s':>10}{'ms/call':>10}{'ms/run':>10}")
+    for row in result['stages']:
+        print(f"{row['stage']:<24}{row['calls']:>8}{row['seconds']:>10.3f}{row['ms_per_call']:>10.2f}{row['ms_per_run']:>10.2f}")
+    close_pool()
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from historyParser import historyFolder, history_files, parse_reports
+
+exportFolder = 'Reports'
+exportFormats = ['markdown', 'json', 'parquet']
+
+# Parquet needs pyarrow or fastparquet, so it is only written when asked for
+defaultFormats = ['markdown', 'json']
+formatExtensions = {'markdown': 'md', 'json': 'json', 'parquet': 'parquet'}
+
+def group_reports(reports) -> dict:
+    """
+    :return: The reports grouped per debate and agent, {(date, ticker, model, version, agent): [reports]}.
+    """
+    groups = {}
+    for report in reports:
+        key = (report['date'], report['ticker'], report['model'], report['version'], report['agent'] or 'Unknown')
+        groups.setdefault(key, []).append(report)
+    return groups
+
+def to_markdown(key: tuple, reports: list) -> str:
+    day, ticker, model, version, agent = key
+    lines = [f"# {agent}: {ticker} on {day}", "", f"Model: {model}, version: {version}", ""]
+    for report in reports:
+        lines += [
+            f"## Chat {report['chat']}",
+            "",
+            f"- Decision: {report['decision'] or '-'}",
+            f"- Price: {report['price']}",
+            f"- Position: {report['position']}",
+            f"- Position size: {report['positionsize']}",
+            "",
+            report['report'],
+            "",
+        ]
+        if report['opinion']:
+            lines += ["### Content for Database", "", report['opinion'], ""]
+    return "\n".join(lines)
+
+def export_path(out: str, fmt: str, key: tuple) -> str:
+    day, ticker, model, version, agent = key
+    if fmt == 'parquet':
+        # Partitioned like the DataStore datasets, so pd.read_parquet(out + '/parquet') reads every report at once
+        return os.path.join(out, fmt, f"agent={agent}", f"date={day}", f"{ticker}_{model}_{version}.parquet")
+    return os.path.join(out, fmt, f"{day}_{ticker}_{model}_{version}_{agent}.{formatExtensions[fmt]}")
+
+def export_file(filepath: str, out: str = exportFolder, formats: list = defaultFormats) -> dict:
+    """
+    Extracts the reports of one Chat History file and writes one file per agent and day in every format.
+    Runs in a worker process of export_folder.
+
+    :return: The number of reports and files written, and the error if the file couldn't be exported.
+    """
+    try:
+        groups = group_reports(parse_reports(filepath))
+        written = 0
+        for key, reports in groups.items():
+            for fmt in formats:
+                path = export_path(out, fmt, key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if fmt == 'markdown':
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(to_markdown(key, reports))
+                elif fmt == 'json':
+                    with open(path, 'w', encoding='utf-8') as f:
+                        json.dump(reports, f, indent=2, default=str)
+                else:
+                    pd.DataFrame(reports).drop(columns=['agent', 'date']).to_parquet(path, index=False)
+                written += 1
+        return {'file': filepath, 'reports': sum(len(reports) for reports in groups.values()), 'written': written, 'error': None}
+    except Exception as e:
+        return {'file': filepath, 'reports': 0, 'written': 0, 'error': str(e)}
+
+def export_folder(folder: str = historyFolder, out: str = exportFolder, formats: list = defaultFormats, workers: int = None) -> dict:
+    """
+    Exports every Chat History file in the folder in parallel, one file per worker task.
+
+    :param folder: The folder with the .txt and .jsonl transcripts.
+    :param out: The folder the exports are written to, with a subfolder per format.
+    :param formats: 'markdown', 'json' and/or 'parquet'.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    :return: Totals of the files, reports and exports, and the files that failed.
+    """
+    unknown = [fmt for fmt in formats if fmt not in exportFormats]
+    if unknown:
+        raise ValueError(f"Unknown export formats {unknown}, use {exportFormats}")
+
+    files = history_files(folder)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(export_file, files, [out] * len(files), [formats] * len(files), chunksize=8))
+
+    failed = {result['file']: result['error'] for result in results if result['error']}
+    for filepath, error in failed.items():
+        print(f"Could not export {filepath}: {error}")
+
+    return {
+        'files': len(files),
+        'reports': sum(result['reports'] for result in results),
+        'written': sum(result['written'] for result in results),
+        'failed': len(failed),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+if __name__ == "__main__":
+    # python reportExport.py [FOLDER] --format=markdown,json,parquet --out=Reports --workers=8
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+    formats = options['format'].split(',') if 'format' in options else defaultFormats
+    workers = int(options['workers']) if 'workers' in options else None
+    print(export_folder(args[0] if args else historyFolder, options.get('out', exportFolder), formats, workers))
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+
+cacheFolder = 'ResponseCache'
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses keyed by URL. Entries are served without a request while they are fresh,
+    once they expire they are revalidated with If-None-Match/If-Modified-Since when the upstream sent an
+    ETag or Last-Modified header, a 304 answer keeps the stored body.
+    """
+
+    def __init__(self, folder: str = cacheFolder, enabled: bool = True):
+        """
+        :param folder: The folder the cached responses are stored in.
+        :param enabled: If False every lookup is a miss and nothing is stored (bypass).
+        """
+        self.folder = folder
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.lock = threading.Lock()
+
+        if enabled and not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.folder, hashlib.sha256(url.encode()).hexdigest() + '.json')
+
+    def _load(self, url: str) -> dict:
+        try:
+            with open(self._path(url), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save(self, entry: dict):
+        # Write to a temporary file first, so a crash never leaves half an entry behind
+        path = self._path(entry['url'])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _count(self, counter: str):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def _response(entry: dict) -> requests.Response:
+        # Rebuild a requests.Response, so cached and fresh responses are handled the same way
+        response = requests.Response()
+        response.url = entry['url']
+        response.status_code = entry['status']
+        response._content = entry['body'].encode()
+        response.headers.update(entry['headers'])
+        return response
+
+    def fresh(self, url: str) -> requests.Response:
+        """
+        Returns the cached response for the URL if it has not expired yet.
+
+        :param url: The URL of the request.
+        :return: The cached response, or None if there is no fresh entry.
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._load(url)
+        if entry is None or entry['expires'] <= time.time():
+            return None
+
+        self._count('hits')
+        return self._response(entry)
+
+    def validators(self, url: str) -> dict:
+        """
+        Returns the conditional request headers for an expired entry.
+
+        :param url: The URL of the request.
+        :return: A dictionary with If-None-Match and/or If-Modified-Since, empty if the upstream sent neither.
+        """
+        if not self.enabled:
+            return {}
+
+        entry = self._load(url)
+        if entry is None:
+            return {}
+
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def store(self, url: str, response: requests.Response, ttl) -> requests.Response:
+        """
+        Stores a response from the upstream. A 304 answer refreshes the stored entry and returns it instead.
+
+        :param url: The URL of the request.
+        :param response: The response from the upstream.
+        :param ttl: Seconds the entry stays fresh, or a function taking the response JSON and returning the seconds.
+            0 => the endpoint is never cached, the response is handed on without being counted or stored.
+        :return: The response to hand on to the caller.
+        """
+        if not self.enabled or response is None or (not callable(ttl) and ttl <= 0):
+            return response
+
+        entry = self._load(url) if response.status_code == 304 else None
+        if entry is not None:
+            self._count('revalidated')
+        else:
+            self._count('misses')
+            if not response.ok:
+                return response
+            entry = {
+                'url': url,
+                'status': response.status_code,
+                'headers': {key: response.headers[key] for key in ['ETag', 'Last-Modified', 'Content-Type'] if key in response.headers},
+                'body': response.text,
+            }
+
+        if callable(ttl):
+            try:
+                seconds = ttl(json.loads(entry['body']))
+            except (ValueError, TypeError, AttributeError, KeyError) as e:
+                # A body the ttl function can't read is handed on, but not stored
+                print(f"Not caching {url}: {e}")
+                return self._response(entry)
+        else:
+            seconds = ttl
+        if seconds > 0 or 'ETag' in entry['headers'] or 'Last-Modified' in entry['headers']:
+            entry['expires'] = time.time() + seconds
+            self._save(entry)
+
+        return self._response(entry)
+
+    def stats(self) -> dict:
+        """
+        :return: A dictionary with the hit, miss and revalidation counters.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated}
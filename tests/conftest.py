@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+# The modules live at the top of the repository, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def database(tmp_path_factory):
+    """
+    A throwaway Postgres server (pgserver) with the tables of postgresSetup.py, used by every test that reaches
+    the database through dbPool. The database of .env is never touched.
+    """
+    pgserver = pytest.importorskip('pgserver', reason='the database tests need an embedded Postgres (pip install pgserver)')
+    import dbPool
+    from postgresSetup import create_tables, migrate
+
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+    dbPool.close_pool()
+    dbPool.DATABASE_CONFIG = {'dsn': server.get_uri()}
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            create_tables(cur)
+            migrate(cur)
+
+    yield server
+    dbPool.close_pool()
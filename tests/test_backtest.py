@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+from backtest import simulate, summarize
+
+days = pd.to_datetime(['2024-04-01', '2024-04-02', '2024-04-03', '2024-04-04', '2024-04-05'])
+
+def toy_prices() -> pd.DataFrame:
+    return pd.DataFrame({'ticker': 'TOY', 'date': days, 'open': [100.0, 102.0, 106.0, 104.0, 101.0],
+                         'close': [102.0, 105.0, 104.0, 101.0, 106.0]})
+
+def toy_decisions() -> pd.DataFrame:
+    rows = [
+        # V2 buys 10 shares, sells them two days later and calls SELL again on the fourth day
+        (days[0], 'V2', 'BUY', 10.0), (days[2], 'V2', 'SELL', 0.0), (days[3], 'V2', 'SELL', 0.0),
+        # V1 holds 5 shares from the second day on and never calls
+        (days[1], 'V1', 'HOLD', 5.0),
+    ]
+    return pd.DataFrame([{'date': day, 'ticker': 'TOY', 'model': 'GPT3.5', 'version': version, 'decision': decision,
+                          'price': None, 'positionsize': size} for day, version, decision, size in rows])
+
+def test_pnl_follows_the_positionsizes():
+    daily = simulate(toy_decisions(), toy_prices(), horizon=2)
+    v2 = daily[daily['version'] == 'V2']
+    v1 = daily[daily['version'] == 'V1']
+
+    assert list(v2['shares']) == [10.0, 10.0, 0.0, 0.0, 0.0]
+    assert list(v2['trade']) == [10.0, 0.0, -10.0, 0.0, 0.0]
+    # Bought at the open of 100, marked at the closes of 102 and 105, sold at the open of 106 that closed at 104
+    assert list(v2['pnl']) == [20.0, 30.0, 10.0, 0.0, 0.0]
+    assert list(v2['equity']) == [1040.0, 1070.0, 1080.0, 1080.0, 1080.0]
+
+    # A series starts on its first decision
+    assert list(v1['date']) == list(days[1:])
+    assert list(v1['pnl']) == [15.0, -5.0, -15.0, 25.0]
+
+def test_hit_rate_scores_the_calls_over_the_horizon():
+    daily = simulate(toy_decisions(), toy_prices(), horizon=2)
+    v2 = daily[daily['version'] == 'V2']
+
+    # BUY at 100 closed at 105 the next day, SELL at 106 closed at 101, SELL at 104 closed at 106
+    assert list(v2['called']) == [True, False, True, True, False]
+    assert list(v2['hit'].dropna()) == [1.0, 1.0, 0.0]
+
+    summary = summarize(daily).set_index('version')
+    assert summary.loc['V2', 'pnl'] == 60.0
+    assert summary.loc['V2', 'capital'] == 1020.0
+    assert summary.loc['V2', 'total_return'] == pytest.approx(60 / 1020)
+    assert summary.loc['V2', 'hit_rate'] == pytest.approx(2 / 3)
+    assert summary.loc['V2', 'max_drawdown'] == 0.0
+
+    assert summary.loc['V1', 'pnl'] == 20.0
+    assert summary.loc['V1', 'calls'] == 0 and np.isnan(summary.loc['V1', 'hit_rate'])
+    assert summary.loc['V1', 'max_drawdown'] == pytest.approx(525 / 545 - 1)
@@ -0,0 +1,101 @@
+import pytest
+from psycopg2.extras import RealDictCursor
+import dbPool
+from consensus import decide, backfill_consensus
+
+# Five days of debates of one ticker: HOLD, BUY, a 2x2x2 tie, SELL, HOLD
+debateDays = {
+    '2024-04-01': ['HOLD', 'HOLD', 'HOLD', 'HOLD', 'BUY', 'SELL'],
+    '2024-04-02': ['BUY', 'BUY', 'BUY', 'BUY', 'SELL', 'HOLD'],
+    '2024-04-03': ['BUY', 'BUY', 'SELL', 'SELL', 'HOLD', 'HOLD'],
+    '2024-04-04': ['BUY', 'HOLD', 'SELL', 'SELL', 'SELL', 'SELL'],
+    '2024-04-05': ['HOLD', 'HOLD', 'HOLD', 'BUY', 'BUY', 'SELL'],
+}
+
+def opinion(agent: str, decision: str, positionsize: float = None, price: float = 100.0) -> dict:
+    return {'agent': agent, 'content': f"{agent} says {decision}", 'decision': decision, 'price': price, 'positionsize': positionsize}
+
+def votes(*decisions, sizes=None) -> list:
+    sizes = sizes or [10] * len(decisions)
+    return [opinion(f"MD{i}Analyst", decision, size) for i, (decision, size) in enumerate(zip(decisions, sizes))]
+
+def test_majority_wins_with_the_average_size_of_its_voters():
+    result = decide(votes('BUY', 'BUY', 'BUY', 'SELL', 'HOLD', 'BUY', sizes=[10, 20, 30, 99, 0, 40]), previous_positionsize=5)
+
+    assert result['decision'] == 'BUY'
+    assert result['positionsize'] == 25.0
+    assert result['position'] is True
+    assert result['votes'] == {'BUY': 4, 'SELL': 1, 'HOLD': 1}
+    assert result['winners'] == ['MD0Analyst', 'MD1Analyst', 'MD2Analyst', 'MD5Analyst']
+
+@pytest.mark.parametrize('decisions', [
+    ('BUY', 'BUY', 'SELL', 'SELL', 'HOLD', 'HOLD'),
+    ('BUY', 'BUY', 'BUY', 'SELL', 'SELL', 'SELL'),
+])
+def test_a_tie_for_the_most_votes_is_hold(decisions):
+    result = decide(votes(*decisions), previous_positionsize=15)
+
+    assert result['decision'] == 'HOLD'
+    assert result['positionsize'] == 15.0
+
+def test_hold_keeps_the_previous_positionsize():
+    result = decide(votes('HOLD', 'HOLD', 'HOLD', 'HOLD', 'BUY', 'SELL', sizes=[50, 50, 50, 50, 10, 10]), previous_positionsize=12)
+    assert result['decision'] == 'HOLD'
+    assert result['positionsize'] == 12.0
+
+    # Without a previous trading day the position stays closed
+    result = decide(votes('HOLD', 'HOLD', 'BUY'), previous_positionsize=None)
+    assert result['positionsize'] == 0.0
+    assert result['position'] is False
+
+def test_unknown_decisions_are_not_counted():
+    result = decide([opinion('MDfinAnalyst', None, 10), opinion('MDnewsAnalyst', 'MAYBE', 10)], previous_positionsize=3)
+    assert result['decision'] == 'HOLD'
+    assert result['votes'] == {'BUY': 0, 'SELL': 0, 'HOLD': 0}
+    assert result['positionsize'] == 3.0
+
+def test_price_is_the_median_of_the_opinions():
+    opinions = [opinion(f"MD{i}Analyst", 'SELL', 5, price) for i, price in enumerate([172.5, 172.5, 1725.0, 172.4, None])]
+    assert decide(opinions)['price'] == 172.5
+    assert decide([opinion('MDfinAnalyst', 'SELL', 5, None)])['price'] is None
+
+@pytest.fixture
+def debates(database):
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            # The positionsize the ticker held before the first debate
+            cur.execute("""
+                INSERT INTO mdmemory (date, ticker, model, version, content, decision, price, position, positionsize)
+                VALUES ('2024-03-29', 'CONS', 'GPT3.5', 'V2', 'first entry', 'HOLD', NULL, TRUE, 7)
+            """)
+            for day, decisions in debateDays.items():
+                for i, decision in enumerate(decisions):
+                    cur.execute("""
+                        INSERT INTO mddebate (key, date, ticker, agent, model, version, content, decision, price, position, positionsize)
+                        VALUES (1, %s, 'CONS', %s, 'GPT3.5', 'V2', 'opinion', %s, %s, TRUE, %s)
+                    """, (day, f"MD{i}Analyst", decision, 100 + i, 10 * (i + 1)))
+    yield
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            for table in ('mddebate', 'mdmemory', 'mdconsensus'):
+                cur.execute(f"DELETE FROM {table} WHERE ticker = 'CONS'")
+
+def test_backfill_agrees_with_decide(debates):
+    with dbPool.get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            assert backfill_consensus(cur, 'mdconsensus') == len(debateDays)
+            cur.execute("SELECT date::text, decision::text, positionsize, price FROM mdconsensus WHERE ticker = 'CONS' ORDER BY date")
+            backfilled = cur.fetchall()
+
+            # decide, day by day, with the positionsize decided the day before
+            expected = []
+            previous = 7
+            for day in debateDays:
+                cur.execute("SELECT agent, decision::text AS decision, price, positionsize FROM mddebate WHERE ticker = 'CONS' AND date = %s", (day,))
+                result = decide(cur.fetchall(), previous)
+                expected.append((day, result['decision'], result['positionsize'], result['price']))
+                previous = result['positionsize']
+
+    assert [(row['date'], row['decision'], float(row['positionsize']), float(row['price'])) for row in backfilled] == expected
+    # The first HOLD keeps the positionsize from before the debates, the later ones that of the last BUY or SELL
+    assert [(row[1], row[2]) for row in expected] == [('HOLD', 7.0), ('BUY', 25.0), ('HOLD', 25.0), ('SELL', 45.0), ('HOLD', 45.0)]
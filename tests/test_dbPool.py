@@ -0,0 +1,86 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import pytest
+import dbPool
+
+@pytest.fixture
+def small_pool(database, monkeypatch):
+    # A pool of 2 connections for 8 threads, like 24 analyst tool threads on the default DB_POOL_MAX of 10
+    dbPool.close_pool()
+    monkeypatch.setattr(dbPool, 'poolMaxSize', 2)
+    monkeypatch.setattr(dbPool, 'poolMinSize', 1)
+    yield
+    dbPool.close_pool()
+
+def test_callers_wait_for_a_free_connection(small_pool):
+    lock = threading.Lock()
+    in_use = [0, 0] # current, highest
+
+    def query(i):
+        with dbPool.get_connection() as conn:
+            with lock:
+                in_use[0] += 1
+                in_use[1] = max(in_use)
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_sleep(0.05), %s", (i,))
+                value = cur.fetchone()[1]
+            with lock:
+                in_use[0] -= 1
+        return value
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(query, range(16)))
+
+    assert results == list(range(16))
+    assert in_use[1] == 2
+
+def test_checkout_times_out(small_pool, monkeypatch):
+    monkeypatch.setattr(dbPool, 'poolTimeout', 0.1)
+    with dbPool.get_connection():
+        with dbPool.get_connection():
+            start = time.perf_counter()
+            with pytest.raises(psycopg2.pool.PoolError):
+                with dbPool.get_connection():
+                    pass
+            assert time.perf_counter() - start >= 0.1
+
+    # Both slots are free again
+    with dbPool.get_connection() as first, dbPool.get_connection() as second:
+        assert first is not second
+
+def test_rollback_on_error(database):
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE IF NOT EXISTS pooltest (value INTEGER)")
+            cur.execute("TRUNCATE pooltest")
+
+    with pytest.raises(ValueError):
+        with dbPool.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("INSERT INTO pooltest VALUES (1)")
+            raise ValueError("rolled back")
+
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM pooltest")
+            assert cur.fetchone()[0] == 0
+
+def test_closed_connection_is_replaced(small_pool):
+    # E.g. the server restarted: the block fails, the connection is dropped from the pool
+    with pytest.raises(psycopg2.InterfaceError):
+        with dbPool.get_connection() as conn:
+            conn.close()
+
+    with dbPool.get_connection() as conn:
+        assert not conn.closed
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            assert cur.fetchone()[0] == 1
+
+def test_pooled_calls_are_faster_than_a_connection_per_call(database):
+    # The pooled call skips the connection setup (a new server process and authentication) of every call
+    dbPool.connection_latency(5)
+    direct, pooled = dbPool.connection_latency(50)
+    assert pooled * 3 < direct
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+import pytest
+import dbPool
+import dbWriter
+from consensus import aggregate_debate
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+debate = ('2024-05-02', 'JRNL', 'GPT3.5', 'V2')
+
+def opinion(agent: str, decision: str = 'BUY', positionsize: float = 10) -> dict:
+    return {'key': 1, 'date': debate[0], 'ticker': debate[1], 'agent': agent, 'model': debate[2], 'version': debate[3],
+            'content': f"{agent} opinion", 'decision': decision, 'price': 100.0, 'position': True, 'positionsize': positionsize}
+
+def stored(table: str) -> list:
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT decision::text, positionsize FROM {table} WHERE ticker = %s ORDER BY id", (debate[1],))
+            return [(decision, float(size)) for decision, size in cur.fetchall()]
+
+@pytest.fixture
+def clean(database):
+    yield
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM mddebate WHERE ticker = %s", (debate[1],))
+            cur.execute("DELETE FROM mdmemory WHERE ticker = %s", (debate[1],))
+
+def test_journal_of_a_crashed_run_is_replayed(tmp_path, clean):
+    # The run journals two opinions and dies before it flushes them
+    script = (f"import os, dbWriter\n"
+              f"writer = dbWriter.BufferedWriter({str(tmp_path)!r})\n"
+              f"writer.add('mddebate', {opinion('MDfinAnalyst')!r})\n"
+              f"writer.add('mddebate', {opinion('MDnewsAnalyst', 'SELL', 5)!r})\n"
+              f"os._exit(1)\n")
+    subprocess.run([sys.executable, '-c', script], cwd=repoFolder, check=False)
+    journals = list(tmp_path.glob('*.jsonl'))
+    assert len(journals) == 1
+    with open(journals[0], 'a') as f:
+        f.write('{"table": "mddebate", "row": {"agent"') # cut short by the crash
+
+    assert dbWriter.BufferedWriter(str(tmp_path)).recover() == 2
+    assert stored('mddebate') == [('BUY', 10.0), ('SELL', 5.0)]
+    assert list(tmp_path.iterdir()) == []
+
+def test_journals_of_running_processes_are_left_alone(tmp_path, clean):
+    # The parent of the test process is running, like a portfolioRunner worker in the middle of its debate
+    journal = tmp_path / f"{'_'.join(debate)}.pid{os.getppid()}.jsonl"
+    journal.write_text(json.dumps({'table': 'mddebate', 'row': opinion('MDfinAnalyst')}) + '\n')
+    writer = dbWriter.BufferedWriter(str(tmp_path))
+    writer.add('mddebate', opinion('MDnewsAnalyst'))
+
+    assert writer.recover() == 0
+    assert journal.exists()
+    assert stored('mddebate') == []
+
+def test_rows_can_be_added_while_a_flush_commits(tmp_path, clean, monkeypatch):
+    writer = dbWriter.BufferedWriter(str(tmp_path))
+    writer.add('mddebate', opinion('MDfinAnalyst'))
+
+    committing, release = threading.Event(), threading.Event()
+    write_rows = dbWriter.write_rows
+
+    def slow_write_rows(cur, table, rows):
+        committing.set()
+        release.wait(5)
+        return write_rows(cur, table, rows)
+
+    monkeypatch.setattr(dbWriter, 'write_rows', slow_write_rows)
+    flush = threading.Thread(target=writer.flush, args=(debate,))
+    flush.start()
+    assert committing.wait(5)
+
+    # add() doesn't wait for the transaction
+    added = threading.Thread(target=writer.add, args=('mddebate', opinion('MDnewsAnalyst')))
+    added.start()
+    added.join(1)
+    assert not added.is_alive()
+    assert writer.stats()['pending'] == 2
+
+    release.set()
+    flush.join(5)
+    assert stored('mddebate') == [('BUY', 10.0)]
+    # Only the row added during the flush is still buffered and journaled
+    assert [row['agent'] for row in writer.pending(debate, 'mddebate')] == ['MDnewsAnalyst']
+    journal = writer.journal_path(debate)
+    assert [json.loads(line)['row']['agent'] for line in open(journal)] == ['MDnewsAnalyst']
+
+def test_decision_is_committed_with_the_opinions(tmp_path, clean):
+    writer = dbWriter.BufferedWriter(str(tmp_path))
+    for agent, decision in [('MDfinAnalyst', 'BUY'), ('MDnewsAnalyst', 'BUY'), ('MDkeyAnalyst', 'SELL')]:
+        writer.add('mddebate', opinion(agent, decision))
+
+    result = aggregate_debate(debate[0], *debate[1:], writer=writer)
+
+    assert result['decision'] == 'BUY'
+    assert stored('mddebate') == [] and stored('mdmemory') == []
+    assert writer.flush(debate) == 4
+    assert writer.stats()['transactions'] == 1
+    assert stored('mdmemory') == [('BUY', 10.0)]
+    assert len(stored('mddebate')) == 3
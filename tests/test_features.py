@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+import pytest
+import dataStore
+import features
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # The data and Features folders are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(features, 'snapshotCache', dataStore.SnapshotCache('csv'))
+
+    def save(closes: list, mtime: int) -> str:
+        days = pd.date_range('2024-03-01', periods=len(closes), freq='B')
+        df = pd.DataFrame({'Date': days.strftime('%d-%m-%Y'), 'Open': closes, 'Close': closes, 'Volume': [1000] * len(closes)})
+        filepath = dataStore.save_frame(df, features.hisFolder, 'TSLA', backend='csv')
+        os.utime(filepath, ns=(mtime, mtime))
+        return filepath
+
+    return save
+
+def test_signals_are_cached_per_file_version(history):
+    closes = [100.0 + day for day in range(30)]
+    history(closes, 1_000_000_000)
+    first = features.ticker_signals('TSLA')
+    assert features.ticker_signals('TSLA') == first
+    assert len(os.listdir(features.featureFolder)) == 1
+
+    # The newest bar is revised in place: same date, another close
+    history(closes[:-1] + [90.0], 2_000_000_000)
+    revised = features.ticker_signals('TSLA')
+
+    assert revised['date'] == first['date']
+    assert revised['close'] == 90.0 and first['close'] == 129.0
+    assert revised['drawdown'] < 0
+    # Only the signals of the current file are kept
+    assert len(os.listdir(features.featureFolder)) == 1
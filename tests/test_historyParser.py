@@ -0,0 +1,66 @@
+import json
+from historyParser import history_files, parse_reports
+from historyIndex import HistoryIndex
+
+call = {'id': 'call_1', 'type': 'function', 'function': {'name': 'send_opinion', 'arguments': json.dumps({
+    'agent': 'MDfinAnalyst', 'decision': 'BUY', 'price': 100.5, 'position': True, 'positionsize': 10, 'content': 'Tariffs ease.'})}}
+report = "### Decision: BUY\n### Insights: tariffs ease."
+
+def write_debate(folder, stem: str, formats: list):
+    # The same analyst chat in the .txt dump and the .jsonl transcript of CHAT_HISTORY_FORMAT=both
+    folder.mkdir(exist_ok=True)
+    if 'txt' in formats:
+        messages = [{'content': 'task', 'role': 'assistant'}, {'content': report, 'tool_calls': [call], 'role': 'user'}]
+        (folder / f"{stem}.txt").write_text(f"*****0th chat*******:\n{messages}\nConversation cost: {{}}\n\n")
+    if 'jsonl' in formats:
+        day, ticker, model, version = stem.split('_')
+        debate = {'date': day, 'ticker': ticker, 'model': model, 'version': version}
+        records = [
+            {'type': 'message', 'chat_id': 1, 'agent': 'user_proxy', 'role': 'user', 'content': 'task'},
+            {'type': 'message', 'chat_id': 1, 'agent': 'MDfinAnalyst', 'role': 'assistant', 'content': report, 'tool_calls': [call]},
+            {'type': 'chat_end', 'chat_id': 1, 'cost': {}},
+        ]
+        (folder / f"{stem}.jsonl").write_text("".join(json.dumps({**debate, **record}) + "\n" for record in records))
+
+def test_history_files_lists_a_debate_once(tmp_path):
+    write_debate(tmp_path, "2024-04-04_TSLA_GPT3.5_V2", ['txt', 'jsonl'])
+    write_debate(tmp_path, "2024-04-03_TSLA_GPT3.5_V2", ['txt'])
+    (tmp_path / "notes.txt").write_text("not a history")
+
+    names = [path.rsplit('/', 1)[-1] for path in history_files(str(tmp_path))]
+    assert names == ["2024-04-04_TSLA_GPT3.5_V2.jsonl", "2024-04-03_TSLA_GPT3.5_V2.txt"]
+
+def test_both_formats_give_the_same_report(tmp_path):
+    write_debate(tmp_path, "2024-04-04_TSLA_GPT3.5_V2", ['txt', 'jsonl'])
+    txt, = parse_reports(str(tmp_path / "2024-04-04_TSLA_GPT3.5_V2.txt"))
+    jsonl, = parse_reports(str(tmp_path / "2024-04-04_TSLA_GPT3.5_V2.jsonl"))
+
+    fields = ['date', 'ticker', 'agent', 'decision', 'price', 'positionsize', 'report', 'opinion']
+    assert {field: txt[field] for field in fields} == {field: jsonl[field] for field in fields}
+
+def test_index_stores_a_debate_once(tmp_path):
+    folder = tmp_path / 'Chat History'
+    write_debate(folder, "2024-04-04_TSLA_GPT3.5_V2", ['txt', 'jsonl'])
+    index = HistoryIndex(str(tmp_path / 'index.sqlite'))
+
+    assert index.update(str(folder))['reports'] == 1
+    results = index.search('tariffs', agent='MDfinAnalyst')
+    assert len(results) == 1
+    assert results[0]['path'].endswith('.jsonl')
+    index.close()
+
+def test_transcripts_rotated_by_date_replace_the_txt_dumps(tmp_path):
+    # TRANSCRIPT_ROTATION=date with CHAT_HISTORY_FORMAT=both: one transcript of the day, a .txt dump per debate
+    for stem in ["2024-04-04_TSLA_GPT3.5_V2", "2024-04-04_META_GPT3.5_V2"]:
+        write_debate(tmp_path, stem, ['txt', 'jsonl'])
+    rotated = "".join((tmp_path / f"{stem}.jsonl").read_text() for stem in ["2024-04-04_TSLA_GPT3.5_V2", "2024-04-04_META_GPT3.5_V2"])
+    (tmp_path / "2024-04-04.jsonl").write_text(rotated)
+    for stem in ["2024-04-04_TSLA_GPT3.5_V2", "2024-04-04_META_GPT3.5_V2"]:
+        (tmp_path / f"{stem}.jsonl").unlink()
+    # A debate of the day that was only dumped as .txt is still listed
+    write_debate(tmp_path, "2024-04-04_MSFT_GPT3.5_V2", ['txt'])
+
+    names = [path.rsplit('/', 1)[-1] for path in history_files(str(tmp_path))]
+    assert names == ["2024-04-04_MSFT_GPT3.5_V2.txt", "2024-04-04.jsonl"]
+    reports = [report for path in history_files(str(tmp_path)) for report in parse_reports(path)]
+    assert sorted(report['ticker'] for report in reports) == ['META', 'MSFT', 'TSLA']
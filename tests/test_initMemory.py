@@ -0,0 +1,117 @@
+import pandas as pd
+import pytest
+import requests
+import dataStore
+import InitMemory
+
+yahooBase = "http://yahoo.test"
+reutersBase = "http://reuters.test"
+
+class FakeResponse:
+    def __init__(self, payload: dict, status_code: int = 200):
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+class FakeSession:
+    """
+    Stands in for the pooled requests.Session: answers every URL from a dictionary of path fragments.
+    """
+
+    def __init__(self, answers: dict):
+        self.answers = answers
+        self.urls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.urls.append(url)
+        for fragment, answer in self.answers.items():
+            if fragment in url:
+                if isinstance(answer, Exception):
+                    raise answer
+                return answer
+        return FakeResponse({}, 404)
+
+def history_json(days: list, opens: list) -> dict:
+    timestamps = [int(pd.Timestamp(day).timestamp()) for day in days]
+    return {'timestamp': timestamps, 'indicators': {'quote': [{
+        'open': opens, 'close': [value + 1 for value in opens], 'volume': [1000] * len(opens),
+    }]}}
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    # The data folders are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dataStore, 'dataBackend', 'csv')
+    monkeypatch.setattr(InitMemory, 'dataBackend', 'csv')
+    return tmp_path
+
+def test_fetch_all_requests_every_endpoint():
+    session = FakeSession({'/historic/': FakeResponse(history_json(['2024-04-01'], [100.0])), '': FakeResponse({'ok': True})})
+    responses, timings = InitMemory.fetch_all('tsla', session=session, yahoo_base=yahooBase, reuters_base=reutersBase, history_range='5d')
+
+    assert set(responses) == set(InitMemory.endpoint_writers)
+    assert set(timings) == set(InitMemory.endpoint_writers)
+    assert all(response.ok for response in responses.values())
+    assert f"{yahooBase}/historic/tsla/1d/5d" in session.urls
+    assert f"{reutersBase}/get-articles-by-keyword-name/Tesla/0/15" in session.urls
+    assert len(session.urls) == 7
+
+def test_fetch_all_returns_none_for_a_failed_request():
+    session = FakeSession({'get-articles': requests.ConnectionError("refused"), '': FakeResponse({})})
+    responses, timings = InitMemory.fetch_all('tsla', session=session, yahoo_base=yahooBase, reuters_base=reutersBase)
+
+    assert responses['news'] is None
+    assert timings['news'] >= 0
+    assert responses['historical'] is not None
+
+def test_update_historical_appends_new_bars(data_folder):
+    InitMemory.update_historical('tsla', history_json(['2024-04-01', '2024-04-02'], [100.0, 101.0]), window=10)
+    filepath = InitMemory.update_historical('tsla', history_json(['2024-04-02', '2024-04-03'], [101.0, 102.0]), window=10)
+
+    df = pd.read_csv(filepath)
+    assert list(df['Date']) == ['01-04-2024', '02-04-2024', '03-04-2024']
+    assert list(df['Open']) == [100.0, 101.0, 102.0]
+
+def test_update_historical_trims_to_the_window(data_folder):
+    days = [f"2024-04-{day:02d}" for day in range(1, 6)]
+    InitMemory.update_historical('tsla', history_json(days, [100.0, 101.0, 102.0, 103.0, 104.0]), window=4)
+    filepath = InitMemory.update_historical('tsla', history_json(['2024-04-05', '2024-04-06'], [110.0, 105.0]), window=4)
+
+    df = pd.read_csv(filepath)
+    # The oldest bars are dropped, the refetched bar of 5 April replaces the stored one
+    assert list(df['Date']) == ['03-04-2024', '04-04-2024', '05-04-2024', '06-04-2024']
+    assert list(df['Open']) == [102.0, 103.0, 110.0, 105.0]
+
+def test_update_historical_appends_past_a_full_window(data_folder):
+    days = [f"2024-04-{day:02d}" for day in range(1, 10)]
+    InitMemory.update_historical('tsla', history_json(days[:4], [100.0, 101.0, 102.0, 103.0]), window=4, slack=2)
+
+    # A full window is appended to until it holds more than window + slack bars, then trimmed back to the window
+    rows = []
+    for day, price in zip(days[4:7], [104.0, 105.0, 106.0]):
+        filepath = InitMemory.update_historical('tsla', history_json([day], [price]), window=4, slack=2)
+        rows.append(len(pd.read_csv(filepath)))
+    assert rows == [5, 6, 4]
+    assert list(pd.read_csv(filepath)['Date']) == ['04-04-2024', '05-04-2024', '06-04-2024', '07-04-2024']
+
+def test_refresh_tickers_survives_a_bad_response(data_folder):
+    # A malformed earnings body and a failed news request only skip their own files
+    session = FakeSession({
+        '/historic/': FakeResponse(history_json(['2024-04-01'], [100.0])),
+        '/earnings/': FakeResponse({'unexpected': 'shape'}),
+        'get-articles': FakeResponse({}, 500),
+        '': FakeResponse({}, 404),
+    })
+    timings, failed = InitMemory.refresh_tickers(['tsla', 'msft'], session=session, rate=1000, yahoo_base=yahooBase,
+                                                 reuters_base=reutersBase)
+
+    assert set(timings) == {'tsla', 'msft'}
+    assert len(timings['tsla']) == 7
+    assert {(failure['ticker'], failure['endpoint']) for failure in failed} >= {('tsla', 'earnings'), ('msft', 'news')}
+    assert all(failure['endpoint'] != 'historical' for failure in failed)
+    assert (data_folder / 'HistoricalData' / 'tsla_Historical.csv').exists()
+    assert (data_folder / 'HistoricalData' / 'msft_Historical.csv').exists()
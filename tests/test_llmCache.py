@@ -0,0 +1,82 @@
+import os
+import sys
+import subprocess
+import pytest
+from autogen.oai.openai_utils import get_key
+from openai.types.chat import ChatCompletion
+import llmCache
+from llmCache import SQLiteCache
+
+def completion(content: str, cost: float = 0.01) -> ChatCompletion:
+    response = ChatCompletion.model_validate({
+        'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 1714000000, 'model': 'gpt-3.5-turbo',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+    })
+    # What AutoGen sets on a response before it caches it
+    response.cost = cost
+    response.message_retrieval_function = print
+    return response
+
+def request(content: str, temperature: float = 0) -> dict:
+    return {'model': 'gpt-3.5-turbo', 'temperature': temperature, 'messages': [{'role': 'user', 'content': content}]}
+
+@pytest.fixture
+def clock(monkeypatch):
+    # last_used from a counter, so the LRU order doesn't depend on the resolution of time.time()
+    ticks = iter(range(1, 1000))
+    monkeypatch.setattr(llmCache.time, 'time', lambda: float(next(ticks)))
+
+def test_cache_is_off_by_default(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key != 'LLM_CACHE'}
+    folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (f"import sys; sys.path.insert(0, {folder!r}); import llmCache, os\n"
+              f"print(llmCache.llmCacheMode, llmCache.llmCache, os.path.exists('LLMCache'))")
+    output = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            check=True).stdout.split()
+    assert output == ['off', 'None', 'False']
+
+def test_completions_survive_a_reopen(tmp_path):
+    path = str(tmp_path / 'LLMCache' / 'completions.sqlite')
+    with SQLiteCache(path) as cache:
+        cache.set(get_key(request('Analyse TSLA')), completion('BUY', cost=0.25))
+    cache.close()
+
+    # The same request, with its parameters in another order, is a hit in a later run
+    reordered = {'messages': [{'content': 'Analyse TSLA', 'role': 'user'}], 'temperature': 0, 'model': 'gpt-3.5-turbo'}
+    cache = SQLiteCache(path)
+    hit = cache.get(get_key(reordered))
+    assert isinstance(hit, ChatCompletion)
+    assert hit.choices[0].message.content == 'BUY'
+    assert hit.cost == 0.25
+    assert cache.get(get_key(request('Analyse TSLA', temperature=0.7))) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    cache.close()
+
+def test_entries_are_stored_as_json(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'completions.sqlite'))
+    cache.set('key', completion('HOLD'))
+    # Something that isn't JSON isn't cached
+    cache.set('object', object())
+    stored = cache.conn.execute("SELECT value FROM completions").fetchall()
+    assert len(stored) == 1 and stored[0][0].startswith('{"type": "ChatCompletion"')
+
+    # An entry of an older (pickled) cache file is a miss and is dropped
+    cache.conn.execute("UPDATE completions SET value = ?", (b'\x80\x04\x95binary',))
+    assert cache.get('key') is None
+    assert cache.stats()['entries'] == 0
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    size = len(SQLiteCache.dumps(completion('BUY')))
+    cache = SQLiteCache(str(tmp_path / 'completions.sqlite'), max_bytes=2 * size)
+    cache.set('first', completion('BUY'))
+    cache.set('second', completion('BUY'))
+    assert cache.get('first') is not None
+
+    cache.set('third', completion('BUY'))
+
+    assert cache.get('second') is None
+    assert cache.get('first') is not None and cache.get('third') is not None
+    assert cache.stats()['evicted'] == 1
+    assert cache.stats()['bytes'] <= 2 * size
+    cache.close()
@@ -0,0 +1,46 @@
+import os
+
+# Read by MDInit.py and llmCache.py when they are imported: every request goes to ReplayClient, none to a model
+os.environ['LLM_BACKEND'] = 'replay'
+os.environ['LLM_CACHE'] = 'off'
+
+import threading
+import pytest
+import replayClient
+import transcriptWriter
+import MDInit
+
+@pytest.fixture
+def replay(database, tmp_path, monkeypatch):
+    # Transcripts and data folders are relative to the working directory, the debate runs on the built-in scripts
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(transcriptWriter, 'transcriptFolder', str(tmp_path / 'Chat History'))
+    monkeypatch.setattr(replayClient, 'replayHistory', '')
+
+    creates = []
+    lock = threading.Lock()
+    create = replayClient.ReplayClient.create
+
+    def counted_create(self, params):
+        with lock:
+            creates.append(self.agent)
+        return create(self, params)
+
+    monkeypatch.setattr(replayClient.ReplayClient, 'create', counted_create)
+    return creates
+
+def test_every_request_of_a_debate_goes_through_the_limiter(replay):
+    limiter = MDInit.LLMLimiter(2)
+    results = MDInit.run_debate('TSLA', 'GPT3.5', 'TEST', '2024-04-04', llm_limiter=limiter, resume=False)
+
+    assert len(results) == 7
+    assert len(replay) > 0
+    assert limiter.calls == len(replay)
+
+def test_agents_keep_the_limiter_after_their_tools_are_registered(replay):
+    limiter = MDInit.LLMLimiter(1)
+    agents = MDInit.build_agents('TSLA', 'GPT3.5', 'TEST', '2024-04-04', limiter)
+
+    for name, agent in agents.items():
+        agent.client.create(messages=[{'role': 'user', 'content': 'hello'}])
+    assert limiter.calls == len(agents)
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+from datetime import date
+import pytest
+import dbPool
+
+# MDInit reads LLM_BACKEND when it is imported: every chat is answered by replayClient.py, no request leaves the machine
+os.environ['LLM_BACKEND'] = 'replay'
+import MDInit
+import replayClient
+from autogen.agentchat.chat import ChatResult
+
+debateDay = date(2024, 4, 4)
+
+@pytest.fixture
+def debate(database, tmp_path, monkeypatch):
+    # The transcripts are written to the Chat History folder of the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(replayClient, 'replayHistory', '')
+    yield
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM mddebate WHERE ticker = 'MDIN'")
+            cur.execute("DELETE FROM mdmemory WHERE ticker = 'MDIN'")
+
+def test_analyst_chats_run_in_parallel_before_the_decision(debate, monkeypatch):
+    running, peak, order = [0], [0], []
+    lock = threading.Lock()
+
+    def analyst_chat(chat, user_proxy, llm_limiter=None, transcript=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        # The first analyst finishes last
+        time.sleep(0.05 * (7 - chat["chat_id"]))
+        with lock:
+            running[0] -= 1
+            order.append(chat["chat_id"])
+        return ChatResult(chat_id=chat["chat_id"], chat_history=[], summary=chat["recipient"].name)
+
+    def aggregate_debate(*args, **kwargs):
+        # Barrier: the decision is only made once every analyst chat is done
+        assert running[0] == 0 and len(order) == 6
+        return {}
+
+    monkeypatch.setattr(MDInit, 'run_analyst_chat', analyst_chat)
+    monkeypatch.setattr(MDInit, 'aggregate_debate', aggregate_debate)
+
+    results = MDInit.run_debate('MDIN', 'GPT3.5', 'V2', debateDay, resume=False)
+    assert peak[0] == 6
+    assert order == [6, 5, 4, 3, 2, 1]
+    # The results are in chat_id order, not in the order the chats finished
+    assert [result.summary for result in results] == MDInit.analystNames
+
+    order.clear()
+    monkeypatch.setattr(MDInit, 'analystConcurrency', 2)
+    peak[0] = 0
+    MDInit.run_debate('MDIN', 'GPT3.5', 'V2', debateDay, resume=False)
+    assert peak[0] == 2
+
+def stored_analysts() -> set:
+    return MDInit.debate_progress('MDIN', 'GPT3.5', 'V2', debateDay)['analysts']
+
+def test_a_rerun_resumes_at_the_unfinished_analysts(debate, monkeypatch):
+    MDInit.run_debate('MDIN', 'GPT3.5', 'V2', debateDay)
+    assert stored_analysts() == set(MDInit.analystNames)
+    assert MDInit.debate_progress('MDIN', 'GPT3.5', 'V2', debateDay)['summary']
+
+    # The run stopped after four analysts: two opinions and the summary are missing
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM mddebate WHERE ticker = 'MDIN' AND agent IN ('MDearnAnalyst', 'MDkeyAnalyst')")
+            cur.execute("DELETE FROM mdmemory WHERE ticker = 'MDIN'")
+
+    started = []
+    run_analyst_chat = MDInit.run_analyst_chat
+
+    def recorded(chat, *args, **kwargs):
+        started.append(chat["recipient"].name)
+        return run_analyst_chat(chat, *args, **kwargs)
+
+    monkeypatch.setattr(MDInit, 'run_analyst_chat', recorded)
+    results = MDInit.run_debate('MDIN', 'GPT3.5', 'V2', debateDay)
+
+    assert sorted(started) == ['MDearnAnalyst', 'MDkeyAnalyst']
+    assert len(results) == 3
+    assert stored_analysts() == set(MDInit.analystNames)
+    assert MDInit.debate_progress('MDIN', 'GPT3.5', 'V2', debateDay)['summary']
+
+    # Once the summary is written, a rerun does nothing
+    started.clear()
+    assert MDInit.run_debate('MDIN', 'GPT3.5', 'V2', debateDay) == []
+    assert started == []
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import subprocess
+import pandas as pd
+import payloadCompactor
+from payloadCompactor import compact_payload, count_tokens, payload_text
+
+def history(days: int) -> pd.DataFrame:
+    dates = pd.date_range('2023-01-02', periods=days, freq='B')
+    return pd.DataFrame({'Date': dates.strftime('%d-%m-%Y'), 'Open': [100.123456 + day for day in range(days)],
+                         'Close': [101.654321 + day for day in range(days)], 'Volume': [1000000 + day for day in range(days)],
+                         'Adj Close': [101.0] * days})
+
+def test_full_tables_by_default():
+    env = {key: value for key, value in os.environ.items() if key != 'PAYLOAD_MODE'}
+    folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    mode = subprocess.run([sys.executable, '-c', 'import payloadCompactor; print(payloadCompactor.payloadMode)'],
+                          cwd=folder, env=env, capture_output=True, text=True, check=True).stdout.strip()
+    assert mode == 'full'
+
+def test_payloads_fit_each_agents_budget():
+    df = history(400)
+    for agent in ['MDfinAnalyst', 'MDnrelAnalyst', 'MDtserAnalyst']:
+        payload, before, after = compact_payload(df, 'HistoricalData', agent)
+        budget = payloadCompactor.agentTokenBudgets.get(agent, payloadCompactor.defaultTokenBudget)
+        assert after <= budget
+        assert after == count_tokens(payload_text(payload))
+        assert payload['columns'] == ['Date', 'Open', 'Close', 'Volume']
+
+    # MDnrelAnalyst gets a longer window of prices, within its larger budget
+    fin = compact_payload(df, 'HistoricalData', 'MDfinAnalyst')[0]
+    nrel = compact_payload(df, 'HistoricalData', 'MDnrelAnalyst')[0]
+    assert len(fin['rows']) == 30
+    assert len(nrel['rows']) == 60
+    assert nrel['rows'][-1][0] == df['Date'].iloc[-1]
+
+def test_row_window_is_halved_to_the_budget(monkeypatch):
+    monkeypatch.setattr(payloadCompactor, 'defaultTokenBudget', 120)
+    payload, before, after = compact_payload(history(400), 'HistoricalData', 'MDkeyAnalyst')
+    assert after <= 120
+    assert len(payload['rows']) < 30
+
+def test_tokens_before_are_those_of_the_full_json():
+    df = history(50)
+    records = json.loads(df.to_json(orient='records', date_format='iso'))
+    payload, before, after = compact_payload(df, 'HistoricalData', 'MDfinAnalyst', records)
+    assert before == count_tokens(json.dumps(records, ensure_ascii=False))
+    assert after < before
@@ -0,0 +1,103 @@
+import pytest
+import dbPool
+from postgresSetup import migrate, column_type, column_nullable
+
+# The tables as the first version of postgresSetup.py created them, before migrate()
+legacyTables = """
+    CREATE TABLE mdmemory (
+        id SERIAL PRIMARY KEY, date DATE NOT NULL, ticker VARCHAR(10) NOT NULL, model VARCHAR(255) NOT NULL,
+        version VARCHAR(10) NOT NULL, content TEXT NOT NULL, decision VARCHAR(15) NOT NULL, price VARCHAR(25) NOT NULL,
+        position BOOL NOT NULL, positionSize VARCHAR(50) NOT NULL
+    );
+    CREATE TABLE mddebate (
+        id SERIAL PRIMARY KEY, key VARCHAR(10) NOT NULL, date DATE NOT NULL, ticker VARCHAR(10) NOT NULL,
+        agent VARCHAR(20) NOT NULL, model VARCHAR(255) NOT NULL, version VARCHAR(10) NOT NULL, content TEXT NOT NULL,
+        decision VARCHAR(15) NOT NULL, price VARCHAR(25) NOT NULL, position BOOL NOT NULL, positionSize VARCHAR(50) NOT NULL
+    );
+"""
+
+@pytest.fixture
+def legacy(database):
+    """
+    A cursor on a schema of its own holding the legacy tables, dropped after the test.
+    """
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA IF EXISTS legacy CASCADE")
+            cur.execute("CREATE SCHEMA legacy")
+            cur.execute("SET search_path TO legacy")
+            cur.execute(legacyTables)
+            try:
+                yield cur
+            finally:
+                conn.rollback()
+                cur.execute("DROP SCHEMA IF EXISTS legacy CASCADE")
+                cur.execute("SET search_path TO DEFAULT")
+
+def add_summary(cur, day: str, content: str, decision: str = 'BUY', price: str = '$172.50', size: str = '35 shares'):
+    cur.execute("""
+        INSERT INTO mdmemory (date, ticker, model, version, content, decision, price, position, positionsize)
+        VALUES (%s, 'TSLA', 'GPT3.5', 'V2', %s, %s, %s, TRUE, %s)
+    """, (day, content, decision, price, size))
+
+def add_opinion(cur, day: str, agent: str, content: str, decision: str = 'SELL'):
+    cur.execute("""
+        INSERT INTO mddebate (key, date, ticker, agent, model, version, content, decision, price, position, positionsize)
+        VALUES ('1', %s, 'TSLA', %s, 'GPT3.5', 'V2', %s, %s, '172.5', FALSE, '0')
+    """, (day, agent, content, decision))
+
+def test_duplicates_are_moved_aside(legacy):
+    add_summary(legacy, '2024-04-01', 'first run')
+    add_summary(legacy, '2024-04-01', 'rerun')
+    add_summary(legacy, '2024-04-02', 'next day')
+    add_opinion(legacy, '2024-04-01', 'MDfinAnalyst', 'first run')
+    add_opinion(legacy, '2024-04-01', 'MDfinAnalyst', 'rerun')
+    add_opinion(legacy, '2024-04-01', 'MDnewsAnalyst', 'only run')
+
+    migrate(legacy)
+
+    legacy.execute("SELECT content FROM mdmemory ORDER BY date")
+    assert [row[0] for row in legacy.fetchall()] == ['rerun', 'next day']
+    legacy.execute("SELECT content FROM mdmemory_duplicates")
+    assert legacy.fetchall() == [('first run',)]
+    legacy.execute("SELECT agent, content FROM mddebate ORDER BY agent")
+    assert legacy.fetchall() == [('MDfinAnalyst', 'rerun'), ('MDnewsAnalyst', 'only run')]
+    legacy.execute("SELECT agent, content FROM mddebate_duplicates")
+    assert legacy.fetchall() == [('MDfinAnalyst', 'first run')]
+
+def test_migrate_without_duplicates_creates_no_side_table(legacy):
+    add_summary(legacy, '2024-04-01', 'only run')
+    migrate(legacy)
+    migrate(legacy)
+
+    legacy.execute("SELECT to_regclass('mdmemory_duplicates'), to_regclass('mddebate_duplicates')")
+    assert legacy.fetchone() == (None, None)
+
+def test_stored_strings_are_converted(legacy):
+    add_summary(legacy, '2024-03-12', 'first entry', decision='-', price='-', size='0')
+    add_summary(legacy, '2024-04-01', 'debate', decision='BUY MORE', price='$172.50', size='35 shares')
+    add_opinion(legacy, '2024-04-01', 'MDfinAnalyst', 'opinion', decision='NON-ACTION')
+
+    migrate(legacy)
+
+    legacy.execute("SELECT decision::text, price, positionsize FROM mdmemory ORDER BY date")
+    assert [(decision, price, float(size)) for decision, price, size in legacy.fetchall()] == [
+        ('HOLD', None, 0.0), ('BUY', 172.5, 35.0)]
+    legacy.execute("SELECT decision::text FROM mddebate")
+    assert legacy.fetchall() == [('HOLD',)]
+    assert not column_nullable(legacy, 'mdmemory', 'decision')
+    assert not column_nullable(legacy, 'mddebate', 'decision')
+
+def test_unparseable_values_stop_the_migration(legacy, capsys):
+    add_summary(legacy, '2024-04-01', 'debate', decision='MAYBE')
+    add_opinion(legacy, '2024-04-01', 'MDfinAnalyst', 'opinion')
+
+    with pytest.raises(ValueError):
+        migrate(legacy)
+
+    assert "mdmemory.decision of row 1 can't be converted to trade_decision: 'MAYBE'" in capsys.readouterr().out
+    # No column was converted, the stored value is still there
+    assert column_type(legacy, 'mdmemory', 'decision') == 'character varying'
+    assert column_type(legacy, 'mddebate', 'decision') == 'character varying'
+    legacy.execute("SELECT decision FROM mdmemory")
+    assert legacy.fetchall() == [('MAYBE',)]
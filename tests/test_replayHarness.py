@@ -0,0 +1,51 @@
+import os
+import sys
+import subprocess
+import pytest
+import dbPool
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+day = '2024-04-04'
+
+def opinions(schema: str) -> list:
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT agent, version, content FROM {schema}.mddebate WHERE ticker = 'META' ORDER BY agent, version")
+            return cur.fetchall()
+
+def replay(tmp_path, database, *options) -> subprocess.CompletedProcess:
+    env = {**os.environ, 'REPLAY_DATABASE_URL': database.get_uri(), 'PYTHONPATH': repoFolder}
+    return subprocess.run([sys.executable, os.path.join(repoFolder, 'replayHarness.py'), 'META', '--history=synthetic',
+                           f"--date={day}", *options], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=300)
+
+@pytest.fixture
+def real_debate(database):
+    # A real debate of the same ticker and day, and a row that happens to use the replay version
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            for agent, version in [('MDfinAnalyst', 'V2'), ('MDnewsAnalyst', 'V2'), ('MDfinAnalyst', 'REPLAY')]:
+                cur.execute("""
+                    INSERT INTO public.mddebate (key, date, ticker, agent, model, version, content, decision, price, position, positionsize)
+                    VALUES (1, %s, 'META', %s, 'GPT3.5', %s, 'real opinion', 'BUY', 500, TRUE, 10)
+                """, (day, agent, version))
+    yield opinions('public')
+    with dbPool.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM public.mddebate WHERE ticker = 'META'")
+            cur.execute("DROP SCHEMA IF EXISTS mdreplay CASCADE")
+
+def test_replay_runs_in_its_own_schema(tmp_path, database, real_debate):
+    result = replay(tmp_path, database, '--runs=2', '--warmup=0')
+
+    assert result.returncode == 0, result.stderr
+    assert "2 runs of" in result.stdout and "tool send_opinion" in result.stdout
+    assert opinions('public') == real_debate
+    # The replayed rows were written to the replay schema and removed at the end
+    assert opinions('mdreplay') == []
+
+def test_other_versions_are_refused(tmp_path, database, real_debate):
+    result = replay(tmp_path, database, '--runs=1', '--warmup=0', '--version=V2')
+
+    assert result.returncode != 0
+    assert "stored under version REPLAY, not V2" in result.stderr
+    assert opinions('public') == real_debate
@@ -0,0 +1,15 @@
+import os
+from reportExport import export_folder
+from test_historyParser import write_debate
+
+def test_a_debate_is_exported_once(tmp_path):
+    # CHAT_HISTORY_FORMAT=both with TRANSCRIPT_ROTATION=date: the day's transcript and a .txt dump of the same debate
+    folder = tmp_path / 'Chat History'
+    write_debate(folder, "2024-04-04_TSLA_GPT3.5_V2", ['txt', 'jsonl'])
+    os.rename(folder / "2024-04-04_TSLA_GPT3.5_V2.jsonl", folder / "2024-04-04.jsonl")
+
+    result = export_folder(str(folder), str(tmp_path / 'Reports'), ['markdown', 'json'], workers=2)
+
+    assert result['files'] == 1 and result['failed'] == 0
+    assert result['reports'] == 1
+    assert sorted(os.listdir(tmp_path / 'Reports' / 'json')) == ["2024-04-04_TSLA_GPT3.5_V2_MDfinAnalyst.json"]
@@ -0,0 +1,46 @@
+import os
+import requests
+from responseCache import ResponseCache
+
+url = "http://yahoo.test/esg-score/tsla"
+
+def make_response(body: str, status_code: int = 200, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = body.encode()
+    response.headers.update(headers or {})
+    return response
+
+def test_ttl_zero_is_never_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    response = make_response('{"a": 1}', headers={'ETag': '"v1"'})
+
+    assert cache.store(url, response, 0) is response
+    assert os.listdir(tmp_path) == []
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'revalidated': 0}
+
+def test_fresh_entry_is_served(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(url, make_response('{"a": 1}'), 60)
+
+    cached = cache.fresh(url)
+    assert cached.json() == {'a': 1}
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'revalidated': 0}
+
+def test_not_modified_keeps_the_stored_body(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store(url, make_response('{"a": 1}', headers={'ETag': '"v1"'}), 60)
+    assert cache.validators(url) == {'If-None-Match': '"v1"'}
+
+    refreshed = cache.store(url, make_response('', 304), 60)
+    assert refreshed.status_code == 200
+    assert refreshed.json() == {'a': 1}
+    assert cache.stats()['revalidated'] == 1
+
+def test_malformed_body_with_a_ttl_function_is_not_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    response = cache.store(url, make_response('not json'), lambda body: 60)
+
+    assert response.text == 'not json'
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,31 @@
+import os
+import transcriptWriter
+from transcriptWriter import TranscriptWriter, transcript_path, read_transcript
+
+def test_transcript_names_per_rotation():
+    folder = transcriptWriter.transcriptFolder
+    assert transcript_path('TSLA', 'GPT3.5', 'V2', '2024-04-04', rotation='ticker', compress=False) == \
+        os.path.join(folder, '2024-04-04_TSLA_GPT3.5_V2.jsonl')
+    assert transcript_path('TSLA', 'GPT3.5', 'V2', '2024-04-04', rotation='ticker', compress=True) == \
+        os.path.join(folder, '2024-04-04_TSLA_GPT3.5_V2.jsonl.gz')
+    assert transcript_path('TSLA', 'GPT3.5', 'V2', '2024-04-04', rotation='date', compress=False) == \
+        os.path.join(folder, '2024-04-04.jsonl')
+    assert transcript_path('MSFT', 'MISTRAL', 'V1', '2024-04-04', rotation='date', compress=True) == \
+        os.path.join(folder, '2024-04-04.jsonl.gz')
+
+def test_debates_of_a_day_share_the_date_transcript(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    writers = [TranscriptWriter(ticker, 'GPT3.5', 'V2', '2024-04-04', compress=True, rotation='date') for ticker in ('TSLA', 'MSFT')]
+    assert writers[0].path == writers[1].path
+    for writer in writers:
+        writer.write_message(1, 'user_proxy', 'MDfinAnalyst', 'Analyse the stock', role='user')
+        writer.write_message(1, 'MDfinAnalyst', 'user_proxy', {'content': '### Decision: BUY', 'tool_calls': [{'id': 'call_1'}]})
+
+    records = read_transcript(writers[0].path)
+    assert [(record['ticker'], record['chat_id'], record['agent'], record['role']) for record in records] == [
+        ('TSLA', 1, 'user_proxy', 'user'), ('TSLA', 1, 'MDfinAnalyst', 'assistant'),
+        ('MSFT', 1, 'user_proxy', 'user'), ('MSFT', 1, 'MDfinAnalyst', 'assistant'),
+    ]
+    assert records[1]['tool_calls'] == [{'id': 'call_1'}]
+    assert all('ts' in record and 'elapsed' in record and 'latency' in record for record in records)
+    assert os.listdir(tmp_path / transcriptWriter.transcriptFolder) == ['2024-04-04.jsonl.gz']
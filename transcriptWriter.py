@@ -0,0 +1,138 @@
+import os
+import gzip
+import json
+import time
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 'jsonl' => every message is streamed to a JSON Lines transcript as it is sent (default),
+# 'txt' => the chat histories are dumped as Python reprs after the debate (the old format), 'both' => both
+historyFormat = os.getenv('CHAT_HISTORY_FORMAT', 'jsonl').lower()
+
+transcriptFolder = 'Chat History'
+transcriptCompress = os.getenv('TRANSCRIPT_COMPRESS', '0') == '1'
+
+# 'ticker' => one transcript per date and debate, 'date' => one transcript per date for every debate
+transcriptRotation = os.getenv('TRANSCRIPT_ROTATION', 'ticker').lower()
+
+# Debates running in parallel may share a transcript (rotation by date), every append holds the lock of its file
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+def path_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+def transcript_path(ticker: str, model: str, version: str, todaysDate, rotation: str = None, compress: bool = None) -> str:
+    rotation = rotation or transcriptRotation
+    compress = transcriptCompress if compress is None else compress
+    filename = f"{todaysDate}.jsonl" if rotation == 'date' else f"{todaysDate}_{ticker}_{model}_{version}.jsonl"
+    return os.path.join(transcriptFolder, filename + ('.gz' if compress else ''))
+
+def read_transcript(path: str) -> list:
+    """
+    :return: The records of a transcript, plain or gzip compressed. A line cut short by a crash is skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    records = []
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+class TranscriptWriter:
+    """
+    Streams the messages of a debate to a JSON Lines transcript. Each message is appended as soon as an agent
+    sends it, so a crash keeps everything up to the last message and the history is never held in memory.
+    """
+
+    def __init__(self, ticker: str, model: str, version: str, todaysDate, compress: bool = None, rotation: str = None):
+        self.compress = transcriptCompress if compress is None else compress
+        self.path = transcript_path(ticker, model, version, todaysDate, rotation, self.compress)
+        self.lock = path_lock(self.path)
+        self.debate = {"date": str(todaysDate), "ticker": ticker, "model": model, "version": version}
+        self.started = {}
+        self.last = {}
+        self.records = 0
+
+        if not os.path.exists(transcriptFolder):
+            os.makedirs(transcriptFolder)
+
+    def append(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            # Opened per record, so every line on disk is complete (a gzip member per append when compressed)
+            if self.compress:
+                with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                    f.write(line)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            self.records += 1
+
+    def write_message(self, chat_id: int, sender: str, recipient: str, message, role: str = "assistant"):
+        """
+        Appends one message with its chat id, agent, role, tool calls and timing.
+        """
+        now = time.monotonic()
+        started = self.started.setdefault(chat_id, now)
+        previous = self.last.get(chat_id, now)
+        self.last[chat_id] = now
+
+        if isinstance(message, str):
+            message = {"content": message}
+
+        record = {
+            "type": "message",
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            **self.debate,
+            "chat_id": chat_id,
+            "agent": sender,
+            "recipient": recipient,
+            "role": "tool" if message.get("tool_responses") else message.get("role", role),
+            "content": message.get("content"),
+            "tool_calls": message.get("tool_calls"),
+            "tool_responses": message.get("tool_responses"),
+            "function_call": message.get("function_call"),
+            "elapsed": round(now - started, 3),
+            # Time since the previous message of the chat, i.e. the LLM or tool latency that produced this one
+            "latency": round(now - previous, 3),
+        }
+        self.append({key: value for key, value in record.items() if value is not None})
+
+    def write_chat_end(self, chat_id: int, chat_result):
+        """
+        Appends the summary and cost of a finished chat.
+        """
+        now = time.monotonic()
+        self.append({
+            "type": "chat_end",
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            **self.debate,
+            "chat_id": chat_id,
+            "summary": chat_result.summary,
+            "cost": chat_result.cost,
+            "elapsed": round(now - self.started.get(chat_id, now), 3),
+        })
+
+    def attach(self, agent, chat_id: int):
+        """
+        Hooks the writer into an agent, so every message it sends in the chat is appended.
+        """
+        # Imported here, so reading transcripts (historyParser.py) doesn't load AutoGen
+        from autogen import UserProxyAgent
+
+        # From the model's side the user_proxy speaks as the user, and answers tool calls as the tool
+        role = "user" if isinstance(agent, UserProxyAgent) else "assistant"
+
+        def record_message(sender, message, recipient, silent):
+            self.write_message(chat_id, sender.name, recipient.name, message, role)
+            return message
+
+        agent.register_hook("process_message_before_send", record_message)